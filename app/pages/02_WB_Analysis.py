@@ -6,14 +6,9 @@ if "is_logged_in" not in st.session_state or not st.session_state.is_logged_in:
 import streamlit as st
 import sys
 import os
-import cv2
-import numpy as np
 import pandas as pd
 from streamlit_drawable_canvas import st_canvas
-from PIL import Image
-from scipy.signal import find_peaks
 import matplotlib.pyplot as plt
-from scipy.stats import linregress
 import re
 import io
 import json  # <--- 新增：用于存取本地文件
@@ -21,15 +16,27 @@ import json  # <--- 新增：用于存取本地文件
 # --- 数据库连接设置 ---
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from db import save_experiment_record
+from utils.wb_modules.image_pipeline import load_wb_image, canvas_to_native, native_to_canvas
+from utils.wb_modules.lane_analysis import BG_METHODS, analyze_lanes, scaled_params, fit_marker, lane_rows
+from utils.wb_modules.lane_detection import detect_lanes
+from utils.wb_modules.batch import load_layouts, save_layouts, make_layout, process_gels, iter_folder, IMAGE_EXTS, \
+    DATA_ROOT, layout_standards
+from utils.wb_modules.quantification import STD_MODELS, quantify, saturated_lanes, curve_points
 
 # ==========================================
 # 0. 全局配置与持久化逻辑
 # ==========================================
 st.set_page_config(page_title="WB Tool Pro", layout="wide")
 st.title("🧪 WB Tool Pro: 一体化定量分析")
+analysis_mode = st.radio("分析模式", ["单张分析", "批量分析"], horizontal=True,
+                         help="批量分析：套用单张模式中保存的泳道布局 + Marker 模板，一次处理多张胶图")
 
 # 定义本地存储文件名
 TEMPLATE_FILE = "marker_templates.json"
+# 分析表中用户可编辑的列 (其余列由泳道结果计算)
+EDIT_COLS = ["Sample Name", "Std?", "Std Conc."]
+# 编辑表中只读展示的列 (便于对照泳道填写)，不回写
+VIEW_COLS = ["Lane", "Type", "IOD"]
 
 
 # --- 核心函数：加载模板 ---
@@ -86,6 +93,9 @@ st.sidebar.header("🎛️ 图像与 Marker")
 st.sidebar.subheader("1. 泳道定义")
 n_lanes = st.sidebar.number_input("泳道总数", min_value=1, value=10, step=1)
 marker_idx = st.sidebar.number_input("Marker 泳道位置", min_value=1, max_value=n_lanes, value=1)
+auto_detect = st.sidebar.checkbox("🤖 自动识别泳道与条带", value=False,
+                                  help="按列投影找泳道中心、连通域找条带；画了定位框时只在框内识别")
+correct_shear = st.sidebar.checkbox("矫正泳道倾斜 / 微笑效应", value=True, disabled=not auto_detect)
 
 st.sidebar.markdown("**Marker 模板**")
 marker_list = list(st.session_state['marker_templates'].keys())
@@ -123,32 +133,87 @@ with st.sidebar.expander("➕ 新建/保存 Marker 模板"):
 # 1.2 信号处理
 st.sidebar.subheader("2. 信号处理")
 init_width_ratio = st.sidebar.slider("初始生成宽度 (%)", 50, 100, 80) / 100.0
-subtract_bg = st.sidebar.checkbox("自动扣除背景", value=True)
+bg_method = st.sidebar.selectbox("背景扣除", list(BG_METHODS), format_func=BG_METHODS.get)
+ball_radius = st.sidebar.slider("滚球半径 (显示像素)", 5, 200, 25, disabled=(bg_method != "rolling_ball"))
 prominence = st.sidebar.slider("峰值灵敏度", 1, 100, 10)
 rel_height = st.sidebar.slider("积分宽度判定", 0.1, 1.0, 0.6)
 
+# ==========================================
+# 1.5 批量模式 (套用已保存的布局)
+# ==========================================
+if analysis_mode == "批量分析":
+    wb_layouts = load_layouts()
+    if not wb_layouts:
+        st.info("还没有保存的泳道布局：请先在单张模式中分析一张胶图，并在页面底部「保存为批量布局」。")
+        st.stop()
+
+    col_lay, col_info = st.columns([1, 2])
+    with col_lay:
+        layout_name = st.selectbox("泳道布局", list(wb_layouts))
+    layout = wb_layouts[layout_name]
+    with col_info:
+        lane_desc = "每张自动识别" if layout["lanes"] == "auto" else f"{len(layout['lanes'])} 条固定泳道"
+        st.caption(f"泳道：{lane_desc}；Marker：第 {layout['marker_idx']} 道 ({layout['marker_name']})；"
+                   f"标准品：{', '.join(f'第 {k} 道 ({v:g})' for k, v in layout_standards(layout).items()) or '无'}"
+                   f" ({STD_MODELS.get(layout.get('std_model', 'linear'))})")
+
+    batch_files = st.file_uploader("📂 上传多张 WB 图像", type=[e.lstrip(".") for e in IMAGE_EXTS],
+                                   accept_multiple_files=True)
+    batch_folder = st.text_input("或服务器文件夹 (可选)", value="", help=f"相对于数据目录 {DATA_ROOT}")
+
+    if st.button("🚀 开始批量分析", type="primary"):
+        items = [(f.name, f.getvalue()) for f in batch_files or []]
+        if batch_folder:
+            try:
+                items += iter_folder(batch_folder)
+            except (ValueError, OSError) as e:
+                st.error(str(e))
+        if items:
+            bar = st.progress(0.0, text=f"分析 {len(items)} 张胶图...")
+            _, batch_table, batch_qc = process_gels(items, layout, progress=bar.progress)
+            bar.empty()
+            st.session_state['wb_batch_results'] = {"layout": layout_name, "table": batch_table, "qc": batch_qc}
+        else:
+            st.warning("请先上传图像或填写文件夹路径。")
+
+    batch_res = st.session_state.get('wb_batch_results')
+    if batch_res:
+        qc_df = batch_res["qc"]
+        n_pass = int((qc_df["Status"] == "✅ 通过").sum())
+        st.markdown(f"### 📋 QC 汇总：{n_pass} / {len(qc_df)} 张通过")
+        st.dataframe(qc_df, hide_index=True, use_container_width=True)
+
+        st.markdown("### 📊 合并结果表")
+        st.dataframe(batch_res["table"], hide_index=True, use_container_width=True, column_config={
+            "Purity (%)": st.column_config.ProgressColumn("纯度", format="%.1f%%", min_value=0, max_value=100),
+            "Conc.": st.column_config.NumberColumn("浓度", format="%.3f"),
+        })
+
+        try:
+            output = io.BytesIO()
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                batch_res["table"].to_excel(writer, index=False, sheet_name='WB_Batch')
+                qc_df.to_excel(writer, index=False, sheet_name='QC')
+            st.download_button("📥 导出批量结果 Excel", data=output.getvalue(),
+                               file_name=f"WB_Batch_{project_id}.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        except Exception as e:
+            st.error(f"Excel 导出失败: {e}")
+    st.stop()
+
 # ==========================================
 # 2. 图像上传与处理
 # ==========================================
-uploaded_file = st.file_uploader("📂 上传 WB 图像", type=["jpg", "png", "tif"])
+uploaded_file = st.file_uploader("📂 上传 WB 图像", type=["jpg", "png", "tif", "tiff"])
 
 if uploaded_file:
     # --- 图片预处理 ---
-    raw_image = Image.open(uploaded_file)
-    max_width = 800
-    if raw_image.width > max_width:
-        ratio = max_width / raw_image.width
-        new_height = int(raw_image.height * ratio)
-        image = raw_image.resize((max_width, new_height))
-    else:
-        image = raw_image
-
-    img_array = np.array(image)
-    if len(img_array.shape) == 3:
-        img_gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    else:
-        img_gray = img_array
-    img_inverted = 255 - img_gray
+    # 按文件哈希缓存：只解码一次；画布用缩小的 8 位显示图，定量用原始分辨率 / 原始位深 (16 位 TIFF 不损失动态范围)
+    wb_img = load_wb_image(uploaded_file.getvalue())
+    image = wb_img["display"]
+    img_signal = wb_img["signal"]
+    st.caption(f"原始图像 {img_signal.shape[1]} × {img_signal.shape[0]} px，{wb_img['depth']} 位；"
+               f"画布显示缩放 1 : {wb_img['scale']:.2f}，定量在原始分辨率上进行")
 
     st.markdown("---")
 
@@ -168,8 +233,31 @@ if uploaded_file:
         )
 
     initial_objects = []
+    quant_img = wb_img      # 定量用的图像 (自动识别并矫正倾斜时换成矫正后的信号)
+    locator_obj = None
     if canvas_locator.json_data and len(canvas_locator.json_data["objects"]) > 0:
-        obj = canvas_locator.json_data["objects"][-1]
+        locator_obj = canvas_locator.json_data["objects"][-1]
+
+    if auto_detect:
+        roi = canvas_to_native(locator_obj, wb_img["scale"], img_signal.shape) if locator_obj else None
+        if roi and (roi[2] <= 0 or roi[3] <= 0):
+            roi = None
+        detection = detect_lanes(wb_img, roi, n_lanes=n_lanes, width_ratio=init_width_ratio,
+                                 correct_shear=correct_shear)
+        quant_img = detection["image"]
+        for rect in detection["rects"]:
+            initial_objects.append({
+                "type": "rect", **native_to_canvas(rect, wb_img["scale"]),
+                "fill": "rgba(255, 0, 0, 0.2)", "stroke": "#FF0000", "strokeWidth": 2
+            })
+        if len(detection["rects"]) != n_lanes:
+            st.warning(f"自动识别到 {len(detection['rects'])} 条泳道 (设定 {n_lanes} 条)，请在步骤 2 中检查")
+        with st.expander(f"🤖 自动识别：{len(detection['rects'])} 条泳道，{len(detection['bands'])} 个条带"):
+            st.dataframe(detection["bands"], hide_index=True, use_container_width=True)
+            st.caption("每条泳道的剪切系数 (行偏移 / 列)：" +
+                       ", ".join(f"{i + 1}: {s:+.3f}" for i, s in enumerate(detection["shears"])))
+    elif locator_obj:
+        obj = locator_obj
         base_x, base_y, base_w, base_h = int(obj["left"]), int(obj["top"]), int(obj["width"]), int(obj["height"])
         slot_w = base_w / n_lanes
         sample_w = slot_w * init_width_ratio
@@ -190,7 +278,7 @@ if uploaded_file:
             background_image=image, update_streamlit=True,
             height=image.height, width=image.width,
             initial_drawing={"version": "4.4.0", "objects": initial_objects} if initial_objects else None,
-            drawing_mode="transform", key=f"canvas_finetune_{len(initial_objects)}", display_toolbar=True
+            drawing_mode="transform", key=f"canvas_finetune_{auto_detect}_{len(initial_objects)}", display_toolbar=True
         )
 
     # ==========================================
@@ -203,82 +291,25 @@ if uploaded_file:
     if final_objects and len(final_objects) > 0:
         all_lanes_data = []
 
-        for idx, obj in enumerate(final_objects):
+        # 所有泳道一次提取轮廓 + 扣背景 + 积分；结果按 (图像, 矩形, 参数) 缓存，微调一个框只重算该泳道
+        lane_rects = [canvas_to_native(obj, wb_img["scale"], img_signal.shape) for obj in final_objects]
+        lane_results = analyze_lanes(quant_img, lane_rects,
+                                     **scaled_params(bg_method, ball_radius, prominence, rel_height, wb_img["scale"]))
+        for idx, res in enumerate(lane_results):
+            if res is None: continue
             lane_num = idx + 1
-            is_marker_lane = (lane_num == marker_idx)
-            x, y, w, h = int(obj["left"]), int(obj["top"]), int(obj["width"]), int(obj["height"])
-
-            if w <= 0 or h <= 0: continue
-            roi = img_inverted[y:y + h, x:x + w]
-            if roi.size == 0: continue
-
-            profile = np.mean(roi, axis=1)
-            bg_val = np.percentile(profile, 10)
-            clean_profile = np.maximum(profile - bg_val, 0) if subtract_bg else profile
-            peaks, properties = find_peaks(clean_profile, prominence=prominence, width=5)
-
-            peak_data = []
-            for j, p_idx in enumerate(peaks):
-                width_prop = properties["widths"][j] * rel_height
-                p_start, p_end = int(max(0, p_idx - width_prop)), int(min(len(clean_profile), p_idx + width_prop))
-                iod = np.sum(clean_profile[p_start:p_end])
-                peak_data.append({"y_pos": p_idx, "iod": iod, "height": clean_profile[p_idx]})
-
-            total_peaks_iod = sum(p['iod'] for p in peak_data)
-            main_peak = max(peak_data, key=lambda x: x['iod']) if peak_data else None
-            purity = (main_peak['iod'] / total_peaks_iod * 100) if (main_peak and total_peaks_iod > 0) else 0
-
-            all_lanes_data.append({
-                "lane_id": lane_num,
-                "is_marker": is_marker_lane,
-                "profile": clean_profile,
-                "raw_profile": profile,
-                "peaks": peak_data,
-                "main_peak": main_peak,
-                "purity": purity,
-                "total_peaks_iod": total_peaks_iod
-            })
+            all_lanes_data.append({"lane_id": lane_num, "is_marker": lane_num == marker_idx, **res})
 
-        mw_model = None
-        r_squared = 0
         marker_data = next((d for d in all_lanes_data if d['is_marker']), None)
-        if marker_data and marker_data['peaks']:
-            template_mw = st.session_state['marker_templates'][marker_name]
-            detected_peaks_y = sorted([p['y_pos'] for p in marker_data['peaks']])
-            min_len = min(len(template_mw), len(detected_peaks_y))
-            if min_len >= 3:
-                y_vals = detected_peaks_y[:min_len]
-                mw_vals = template_mw[:min_len]
-                slope, intercept, r_value, p_value, std_err = linregress(y_vals, np.log10(mw_vals))
-                mw_model = (slope, intercept)
-                r_squared = r_value ** 2
-
-        # 构建 Session 数据
+        mw_model, r_squared = fit_marker(marker_data, st.session_state['marker_templates'][marker_name])
+
+        # 测量值每次重跑都从 (已缓存的) 泳道结果生成；可编辑的输入 (样品名 / 标准品) 只在泳道布局变化时重置
+        measured_df = pd.DataFrame(lane_rows(all_lanes_data, mw_model))
         current_layout_fingerprint = f"{len(final_objects)}_{final_objects[0]['left']}"
         if 'layout_fingerprint' not in st.session_state or st.session_state[
             'layout_fingerprint'] != current_layout_fingerprint:
-            rows = []
-            for d in all_lanes_data:
-                calc_mw = 0
-                if mw_model and d['main_peak']:
-                    calc_mw = 10 ** (mw_model[0] * d['main_peak']['y_pos'] + mw_model[1])
-
-                default_name = "Marker" if d['is_marker'] else f"Sample {d['lane_id']}"
-                iod_val = d['main_peak']['iod'] if d['main_peak'] else 0
-
-                rows.append({
-                    "Lane": d['lane_id'],
-                    "Type": "Marker" if d['is_marker'] else "Sample",
-                    "Sample Name": default_name,
-                    "Size (kDa)": round(calc_mw, 1) if calc_mw > 0 else 0,
-                    "Purity (%)": round(d['purity'], 1),
-                    "IOD": int(iod_val),
-                    "Ref?": False,
-                    "Conc.": 0.0
-                })
-            st.session_state['wb_table_data'] = pd.DataFrame(rows)
+            st.session_state['wb_table_data'] = measured_df[VIEW_COLS + EDIT_COLS].copy()
             st.session_state['layout_fingerprint'] = current_layout_fingerprint
-            st.rerun()
 
         # ==========================================
         # 5. 结果展示
@@ -289,7 +320,8 @@ if uploaded_file:
         with tab1:
             col_in1, col_in2, col_info = st.columns([1, 1, 2])
             with col_in1:
-                ref_conc_input = st.number_input("标品浓度 (Ref Conc.)", value=1.0, min_value=0.0, step=0.1)
+                std_model = st.selectbox("标准曲线模型", list(STD_MODELS), format_func=STD_MODELS.get,
+                                         help="勾选多个标准品泳道并填写已知浓度；只有 1 个标准品时按单点比例计算")
             with col_in2:
                 conc_unit = st.text_input("单位", value="mg/mL")
             with col_info:
@@ -298,46 +330,63 @@ if uploaded_file:
                 else:
                     st.caption("⚠️ 分子量未计算 (Marker 条带不足)")
 
-            df_to_edit = st.session_state['wb_table_data']
-
+            # 编辑状态由 data_editor 自己的 key 保存，直接用返回值计算，不再回写 session + st.rerun()
             edited_df = st.data_editor(
-                df_to_edit,
+                st.session_state['wb_table_data'],
                 column_config={
-                    "Ref?": st.column_config.CheckboxColumn("设为标品?", default=False),
                     "IOD": st.column_config.NumberColumn("光密度 (IOD)", format="%d"),
-                    "Purity (%)": st.column_config.ProgressColumn("纯度", format="%.1f%%", min_value=0, max_value=100),
-                    "Size (kDa)": st.column_config.NumberColumn("大小 (kDa)"),
-                    "Conc.": st.column_config.NumberColumn("浓度 (结果)", format="%.3f"),
+                    "Std?": st.column_config.CheckboxColumn("标准品?", default=False),
+                    "Std Conc.": st.column_config.NumberColumn("标准浓度", format="%.3f", min_value=0.0),
                 },
-                disabled=["Lane", "Type", "IOD", "Size (kDa)", "Purity (%)", "Conc."],
+                disabled=VIEW_COLS,
                 hide_index=True,
                 use_container_width=True,
-                key="wb_main_editor"
+                key=f"wb_main_editor_{current_layout_fingerprint}"
             )
 
-            # --- 实时计算 ---
-            calc_df = edited_df.copy()
-            ref_rows = calc_df[calc_df["Ref?"] == True]
-
-            if len(ref_rows) == 1:
-                ref_iod = ref_rows.iloc[0]["IOD"]
-                if ref_iod > 0:
-                    mask = (calc_df["Type"] == "Sample") & (calc_df["IOD"] > 0)
-                    calc_df.loc[mask, "Conc."] = (calc_df.loc[mask, "IOD"] / ref_iod) * ref_conc_input
-                    calc_df.loc[~mask, "Conc."] = 0.0
-                else:
-                    calc_df["Conc."] = 0.0
-            else:
-                calc_df["Conc."] = 0.0
-
-            if not calc_df["Conc."].equals(st.session_state['wb_table_data']["Conc."]) or \
-                    not calc_df["Ref?"].equals(st.session_state['wb_table_data']["Ref?"]) or \
-                    not calc_df["Sample Name"].equals(st.session_state['wb_table_data']["Sample Name"]):
-                st.session_state['wb_table_data'] = calc_df
-                st.rerun()
+            # --- 实时计算 (全部泳道一次反算) ---
+            calc_df = measured_df.copy()
+            if len(edited_df) == len(calc_df):
+                calc_df[EDIT_COLS] = edited_df[EDIT_COLS].to_numpy()
+            calc_df, std_curve, std_error = quantify(calc_df, std_model, saturated_lanes(all_lanes_data,
+                                                                                         quant_img["level"]))
+            if std_error:
+                st.error(f"⚠️ {std_error}")
+
+            st.dataframe(
+                calc_df,
+                column_config={
+                    "IOD": st.column_config.NumberColumn("光密度 (IOD)", format="%d"),
+                    "Purity (%)": st.column_config.ProgressColumn("纯度", format="%.1f%%", min_value=0, max_value=100),
+                    "Size (kDa)": st.column_config.NumberColumn("大小 (kDa)"),
+                    "Conc.": st.column_config.NumberColumn(f"浓度 ({conc_unit})", format="%.3f"),
+                    "Flag": st.column_config.TextColumn("提示"),
+                },
+                hide_index=True,
+                use_container_width=True
+            )
 
-            if len(ref_rows) > 1:
-                st.error("⚠️ 错误：只能勾选 1 个标品！")
+            if std_curve:
+                lin = std_curve["linear_range"]
+                r2_txt = f"R² = {std_curve['r2']:.4f}，" if std_curve["r2"] is not None else ""
+                st.caption(f"📈 标准曲线：{std_curve['formula']}；{r2_txt}"
+                           f"标准 IOD 范围 {std_curve['iod_min']:,.0f} – {std_curve['iod_max']:,.0f}" +
+                           (f"；线性范围 IOD {lin[0]:,.0f} – {lin[1]:,.0f}" if lin else ""))
+                n_sat = int((calc_df["Flag"] == "像素饱和").sum())
+                if n_sat:
+                    st.warning(f"⚠️ {n_sat} 条泳道像素饱和，IOD 被低估，建议缩短曝光后重新定量")
+                if std_curve["model"] != "ratio":
+                    std_mask = calc_df["Std?"].astype(bool) & (calc_df["Type"] != "Marker")
+                    fig_std, ax_std = plt.subplots(figsize=(6, 3))
+                    ax_std.plot(*curve_points(std_curve), color="black", label=STD_MODELS[std_curve["model"]])
+                    ax_std.scatter(calc_df.loc[std_mask, "Std Conc."], calc_df.loc[std_mask, "IOD"], color="red",
+                                   label="Standards", zorder=3)
+                    if lin:
+                        ax_std.axhspan(lin[0], lin[1], color="green", alpha=0.08, label="Linear range")
+                    ax_std.set_xlabel(f"Conc. ({conc_unit})")
+                    ax_std.set_ylabel("IOD")
+                    ax_std.legend()
+                    st.pyplot(fig_std)
 
         with tab2:
             st.markdown("### 峰形图详情")
@@ -366,10 +415,13 @@ if uploaded_file:
         with col_save:
             if st.button("💾 保存至 Database", type="primary", use_container_width=True):
                 results_json = {
-                    "summary_table": st.session_state['wb_table_data'].to_dict(orient="records"),
+                    "summary_table": json.loads(calc_df.to_json(orient="records")),
+                    "std_curve": {"model": std_curve["model"], "formula": std_curve["formula"],
+                                  "r2": None if std_curve["r2"] is None else float(std_curve["r2"]),
+                                  "linear_range": std_curve["linear_range"]} if std_curve else None,
                     "marker_fit_r2": r_squared,
                     "unit": conc_unit,
-                    "settings": {"prominence": prominence, "subtract_bg": subtract_bg}
+                    "settings": {"prominence": prominence, "bg_method": bg_method, "ball_radius": ball_radius}
                 }
                 uploaded_file.seek(0)
                 success, msg = save_experiment_record(project_id, researcher, uploaded_file, results_json)
@@ -383,7 +435,7 @@ if uploaded_file:
             output = io.BytesIO()
             try:
                 with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_export = st.session_state['wb_table_data']
+                    df_export = calc_df
                     df_export.to_excel(writer, index=False, sheet_name='WB_Analysis')
 
                 xlsx_data = output.getvalue()
@@ -399,5 +451,31 @@ if uploaded_file:
                 st.error(f"导出失败: {e}")
                 st.caption("请确保安装了 openpyxl: pip install openpyxl")
 
+        # C. 保存为批量布局 (相对坐标 + Marker 模板 + 参数)
+        with st.expander("🧩 保存为批量布局"):
+            col_ln, col_auto = st.columns([2, 1])
+            with col_ln:
+                new_layout_name = st.text_input("布局名称", placeholder="例如: 纯化 QC 15 孔")
+            with col_auto:
+                layout_auto = st.checkbox("每张胶图自动识别泳道", value=auto_detect)
+            if st.button("保存布局"):
+                if not new_layout_name:
+                    st.warning("请填写布局名称。")
+                else:
+                    std_rows = calc_df[calc_df["Std?"].astype(bool) & calc_df["Std Conc."].notna()]
+                    locator_rect = canvas_to_native(locator_obj, wb_img["scale"], img_signal.shape) \
+                        if locator_obj else None
+                    layouts = load_layouts()
+                    layouts[new_layout_name] = make_layout(
+                        "auto" if layout_auto else lane_rects, img_signal.shape, marker_idx, marker_name,
+                        st.session_state['marker_templates'][marker_name],
+                        {"bg_method": bg_method, "ball_radius": ball_radius, "prominence": prominence,
+                         "rel_height": rel_height},
+                        standards=dict(zip(std_rows["Lane"], std_rows["Std Conc."])), std_model=std_model,
+                        n_lanes=n_lanes, width_ratio=init_width_ratio, correct_shear=correct_shear,
+                        roi=locator_rect if layout_auto else None)
+                    save_layouts(layouts)
+                    st.success(f"已保存布局: {new_layout_name}")
+
 else:
     st.info("👋 请先上传 WB 图片。")
\ No newline at end of file
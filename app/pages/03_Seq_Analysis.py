@@ -10,11 +10,11 @@ import sys
 import os
 import io
 import json
+import hashlib
+import zipfile
 import plotly.graph_objects as go
-import matplotlib.pyplot as plt
-import seaborn as sns
+import streamlit.components.v1 as components
 from Bio import SeqIO
-from Bio.Seq import Seq
 from Bio.Align import PairwiseAligner
 
 # --- 路径设置 (确保能引用 utils) ---
@@ -24,7 +24,7 @@ if root_dir not in sys.path:
     sys.path.append(root_dir)
 
 # --- 引入数据库和工具 ---
-from db import save_experiment_record
+from db import save_experiment_record, pb
 
 # 引入比对渲染工具
 try:
@@ -32,6 +32,28 @@ try:
 except ImportError:
     pairwise = None # 或者处理报错
 
+from utils.seq_modules.numbering import SCHEMES, annotate_batch
+from utils.seq_modules.liabilities import DEFAULT_MOTIFS, scan_sequences, liability_summary
+from utils.seq_modules.structure import load_structure
+from utils.seq_modules.surface import EXPOSED_RSA, rank_clones
+from utils.seq_modules.germline import (
+    DEFAULT_SPECIES, GERMLINE_ROOT, list_species, install_fasta, build_index, assign_germlines, gene_usage
+)
+from utils.seq_modules.similarity import SIMILARITY_METHODS, AUTO_ALIGN_MAX, pairwise_similarity, resolve_method, \
+    to_square
+from utils.seq_modules.clustering import (
+    LINKAGE_METHODS, HEATMAP_MAX_SIZE, hierarchical_clusters, extract_cdr3, clonotypes, cluster_order, cluster_summary,
+    similarity_heatmap, dendrogram_figure
+)
+from utils.seq_modules.traces import MOTT_CUTOFF, MIXED_RATIO, process_batch, trace_figure, trimmed_fasta
+from utils.seq_modules.translation import MIN_ORF_AA, PAGE_SIZES, read_records, translate_records, page_count, \
+    page_slice
+from utils.seq_modules.registry import KMER_K, build_records, inventory_lookup, upsert_sequences, \
+    fetch_registry, SequenceIndex
+from utils.seq_modules.assembly import FWD_TAGS, REV_TAGS, QUAL_DELTA, assemble_plate, contig_fasta, translate_contig
+from utils.seq_modules.msa import prepare_sequences, align_sequences, column_profile, consensus_sequence, to_fasta, \
+    msa_viewer_html
+
 # ==========================================
 # 0. 全局配置
 # ==========================================
@@ -55,11 +77,37 @@ genetic_code = st.sidebar.selectbox("遗传密码表", [1, 11], index=0, help="1
 # ==========================================
 # 2. 核心功能区
 # ==========================================
-tab1, tab2, tab3, tab4 = st.tabs([
+def register_sequences(df, source, key):
+    """结果表写入序列库 (按内容哈希去重，已有记录只更新变化字段)；按克隆名关联库存样本"""
+    if not st.button(f"🗄️ 写入序列库 ({len(df)} 条)", key=key):
+        return
+    try:
+        inventory = inventory_lookup(pb.collection('inventory').get_full_list())
+    except Exception:
+        inventory = {}
+    records = build_records(df, project_id=project_id, source=source, inventory=inventory)
+    bar = st.progress(0.0, text="写入序列库...")
+    try:
+        stats = upsert_sequences(pb, records, progress=lambda p: bar.progress(p, text="写入序列库..."))
+    except Exception as e:
+        bar.empty()
+        st.error(f"写入失败: {e}")
+        return
+    bar.empty()
+    st.session_state.pop('seq_registry', None)
+    st.success(f"新增 {stats['created']} 条，更新 {stats['updated']} 条，未变化 {stats['unchanged']} 条"
+               + (f"，失败 {stats['failed']} 条" if stats['failed'] else ""))
+    if stats['fallback']:
+        st.warning(f"Batch API 不可用，已退回逐条写入 ({stats['fallback']})")
+
+
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
     "🧬 翻译 & 风险扫描",
     "⚖️ 双序列比对 (Pairwise)",
     "🌳 批量聚类 (Clustering)",
-    "📈 测序峰图 (.ab1)"
+    "📈 测序峰图 (.ab1)",
+    "🧭 Germline 分配",
+    "🗄️ 序列库"
 ])
 
 # --- TAB 1: 翻译 ---
@@ -68,50 +116,85 @@ with tab1:
     col_t1, col_t2 = st.columns([1, 1])
     with col_t1:
         seq_input = st.text_area("输入 DNA 序列 (支持多行FASTA或纯序列)", height=200, placeholder=">Clone1\nATGCGC...")
+        seq_file = st.file_uploader("或上传 FASTA / FASTQ 文件 (优先使用文件)", type=["fasta", "fa", "fna", "fastq", "fq", "txt"],
+                                    key="trans_file")
+        c_m1, c_m2 = st.columns(2)
+        trans_mode = c_m1.radio("翻译方式", ["frame1", "orf"], horizontal=True,
+                                format_func=lambda m: {"frame1": "读码框 1", "orf": "六框最长 ORF"}[m])
+        min_orf = c_m2.number_input("ORF 最短长度 (aa)", value=MIN_ORF_AA, min_value=1, disabled=trans_mode != "orf")
     with col_t2:
-        st.info("ℹ️ **功能说明**\n- 自动翻译\n- 风险扫描 (NG, DG, DP, Met)\n- Cys 二硫键检查")
-
-    if seq_input:
-        sequences = []
-        if ">" in seq_input:
-            parts = seq_input.split(">")
-            for p in parts:
-                if not p.strip(): continue
-                lines = p.strip().split("\n")
-                name = lines[0]
-                seq_str = "".join(lines[1:]).replace("\n", "").replace(" ", "").upper()
-                sequences.append({"name": name, "dna": seq_str})
-        else:
-            sequences.append({"name": "Input_Seq", "dna": seq_input.replace("\n", "").replace(" ", "").upper()})
-
-        results = []
-        for s in sequences:
+        st.info("ℹ️ **功能说明**\n- 自动翻译\n- FR / CDR 注释 (Kabat / IMGT)\n"
+                "- 风险扫描 (糖基化 N[^P][ST]、NG、DG、DP、氧化、游离 Cys 等)，标注所在区域")
+        num_scheme = st.selectbox("CDR 编号方案", SCHEMES, format_func=str.upper)
+        with st.expander("🧪 风险基序库 (可编辑)"):
+            motif_lib = st.data_editor(pd.DataFrame(DEFAULT_MOTIFS), num_rows="dynamic",
+                                       use_container_width=True, key="motif_lib")
+
+    if seq_file or seq_input:
+        # 翻译 / 注释 / 风险扫描按输入与参数的指纹缓存，翻页等重跑只重新切片当前页
+        motifs = motif_lib.dropna(subset=["name", "pattern"]).to_dict(orient="records")
+        src = seq_file.getvalue() if seq_file else seq_input.encode("utf-8")
+        trans_key = hashlib.sha1(src + json.dumps([genetic_code, trans_mode, min_orf, num_scheme, motifs],
+                                                  default=str).encode("utf-8")).hexdigest()
+        trans_res = st.session_state.get('trans_result')
+        if not trans_res or trans_res["key"] != trans_key:
+            trans_res = None
             try:
-                dna_obj = Seq(s['dna'])
-                padding = (3 - len(dna_obj) % 3) % 3
-                protein = str((dna_obj + "N" * padding).translate(table=genetic_code))
-
-                liabilities = []
-                if "NG" in protein: liabilities.append("NG")
-                if "DG" in protein: liabilities.append("DG")
-                if "DP" in protein: liabilities.append("DP")
-                if "M" in protein: liabilities.append("Met")
-                if "C" in protein: liabilities.append(f"Cys x {protein.count('C')}")
-
-                results.append({
-                    "Name": s['name'], "Protein Length": len(protein), "Protein Seq": protein,
-                    "Risks": ", ".join(liabilities) if liabilities else "Pass"
-                })
+                # SeqIO 流式读取 + 整批查表翻译
+                names, dnas = read_records(seq_file if seq_file else seq_input)
+                df_trans = translate_records(names, dnas, table=genetic_code, mode=trans_mode, min_aa=min_orf)
             except Exception as e:
                 st.error(f"解析失败: {e}")
-
-        if results:
-            df_trans = pd.DataFrame(results)
-            st.markdown("#### 分析结果")
-            st.dataframe(df_trans.style.applymap(
-                lambda x: "background-color: #ffcccc" if "NG" in str(x) or "DG" in str(x) else "", subset=["Risks"]),
+                df_trans = None
+
+            if df_trans is not None and len(df_trans):
+                # FR / CDR 注释 + 整批风险扫描 (Met/Trp/Cys 等只报告 CDR 内)
+                df_ann = annotate_batch(df_trans["Protein Seq"], scheme=num_scheme)
+                try:
+                    df_liab = scan_sequences(df_trans["Protein Seq"], names=df_trans["Name"],
+                                             regions=list(df_ann["Regions"]), motifs=motifs)
+                except ValueError as e:
+                    st.error(f"基序库错误: {e}")
+                    st.stop()
+                df_sum = liability_summary(df_liab, df_trans["Name"])
+
+                df_trans.insert(2, "Chain", df_ann["Chain"])
+                for col in ("CDR1", "CDR2", "CDR3"):
+                    df_trans[col] = df_ann[col]
+                for col in ("Risks", "CDR Risks", "High", "Medium", "Low"):
+                    df_trans[col] = df_sum[col].to_numpy()
+                df_trans["Numbering"] = df_ann["Status"]
+                trans_res = {"key": trans_key, "df": df_trans, "liab": df_liab, "dnas": dnas,
+                             "csv": df_trans.to_csv(index=False).encode("utf-8")}
+                st.session_state['trans_result'] = trans_res
+                st.session_state['seq_analysis_result'] = df_trans.to_dict(orient="records")
+
+        if trans_res:
+            df_trans, df_liab, dnas = trans_res["df"], trans_res["liab"], trans_res["dnas"]
+            st.markdown(f"#### 分析结果 ({len(df_trans)} 条)")
+            # 分页显示，只给当前页着色 (整列向量化，不再逐格 applymap)
+            p1, p2 = st.columns([1, 3])
+            page_size = p1.selectbox("每页行数", PAGE_SIZES, index=1, key="trans_page_size")
+            n_pages = page_count(len(df_trans), page_size)
+            page = p2.number_input(f"页码 (共 {n_pages} 页)", min_value=1, max_value=n_pages, value=1, key="trans_page")
+            st.dataframe(page_slice(df_trans, page, page_size).style.apply(
+                lambda col: np.where(col > 0, "background-color: #ffcccc", ""), subset=["High"]),
                          use_container_width=True)
-            st.session_state['seq_analysis_result'] = df_trans.to_dict(orient="records")
+            st.download_button("📥 下载完整结果 (CSV)", trans_res["csv"], f"Translation_{project_id}.csv", "text/csv")
+            with st.expander(f"📋 逐位点风险明细 ({len(df_liab)} 处)"):
+                st.dataframe(df_liab.drop(columns=["Seq Index"]), use_container_width=True, hide_index=True)
+            with st.expander("🧊 结构暴露度排名 (多克隆共用一个结构模型)"):
+                st.caption(f"每个风险位点取基序残基中最大的相对可及性 (RSA)，RSA ≥ {EXPOSED_RSA:.0%} 计为暴露；"
+                           "Exposure Score = Σ 等级权重 (High 3 / Medium 2 / Low 1) × RSA，越低越好。")
+                rank_pdb = st.file_uploader("上传结构模型 (.pdb)", type=["pdb"], key="rank_pdb")
+                if rank_pdb:
+                    try:
+                        rank_struct = load_structure(rank_pdb.getvalue().decode("utf-8", "replace"))
+                        df_rank = rank_clones(rank_struct, df_liab, df_trans["Protein Seq"], df_trans["Name"])
+                        st.dataframe(df_rank, use_container_width=True, hide_index=True)
+                    except ValueError as e:
+                        st.error(f"PDB 解析失败: {e}")
+            register_sequences(df_trans.assign(DNA=dnas), "Translate", "reg_translate")
 
 # --- TAB 2: 比对 ---
 with tab2:
@@ -132,28 +215,117 @@ with tab3:
 
             if target_col:
                 st.success(f"已识别序列列: `{target_col}`")
-                if st.button("计算相似度热图"):
-                    seqs = df_msa[target_col].dropna().astype(str).tolist()
-                    names = df_msa.iloc[:, 0].astype(str).tolist()
-
-                    from difflib import SequenceMatcher
-
-                    n = len(seqs)
-                    matrix = np.zeros((n, n))
-                    for i in range(n):
-                        for j in range(n):
-                            if i == j:
-                                matrix[i][j] = 1.0
-                            elif i < j:
-                                r = SequenceMatcher(None, seqs[i], seqs[j]).ratio()
-                                matrix[i][j] = r
-                                matrix[j][i] = r
-
-                    fig, ax = plt.subplots(figsize=(8, 6))
-                    sns.heatmap(matrix, xticklabels=names, yticklabels=names, cmap="viridis", ax=ax)
-                    st.pyplot(fig)
-                    # 将 numpy 矩阵转 list，否则 JSON 保存会报错
-                    st.session_state['seq_analysis_result'] = {"matrix": matrix.tolist(), "names": names}
+                c_m1, c_m2 = st.columns(2)
+                sim_method = c_m1.selectbox(
+                    "相似度算法", SIMILARITY_METHODS,
+                    help=f"auto: ≤{AUTO_ALIGN_MAX} 条用精确比对 (align)，更多用 k-mer；"
+                         "minhash 为 k-mer 签名近似，适合超长序列。各算法统一输出一致度估计 (k-mer 按 Mash 公式换算)")
+                sim_k = c_m2.number_input("k-mer 长度 (0 = 自动: DNA 8 / 蛋白 3)", value=0, min_value=0, max_value=12)
+
+                c_m3, c_m4, c_m5 = st.columns(3)
+                clu_mode = c_m3.radio("分组方式", ["层次聚类 (UPGMA)", "CDR3 克隆型"], horizontal=True)
+                if "层次" in clu_mode:
+                    clu_link = c_m4.selectbox("Linkage", LINKAGE_METHODS, help="average 即 UPGMA")
+                    clu_cut = c_m5.slider("切树一致度阈值", 0.1, 1.0, 0.8, 0.05,
+                                          help="按一致度切树；align / kmer / minhash 输出同一尺度的一致度，阈值含义相同")
+                else:
+                    clu_cut = c_m4.slider("CDR3 一致度 ≥", 0.5, 1.0, 0.8, 0.05, help="长度相同且一致度达到阈值即归为同一克隆型")
+
+                if st.button("计算相似度 & 聚类"):
+                    df_valid = df_msa.dropna(subset=[target_col])
+                    seqs = df_valid[target_col].astype(str).tolist()
+                    names = df_valid.iloc[:, 0].astype(str).tolist()
+
+                    bar = st.progress(0.0, text="计算相似度...")
+                    condensed = pairwise_similarity(seqs, method=sim_method, k=sim_k or None,
+                                                    progress=lambda p: bar.progress(min(p, 1.0), text="计算相似度..."))
+                    bar.empty()
+
+                    cdr3s = [extract_cdr3(s) for s in seqs]
+                    Z = None
+                    if "层次" in clu_mode and len(seqs) > 1:
+                        labels, order, Z = hierarchical_clusters(condensed, cut_similarity=clu_cut, method=clu_link)
+                    elif "层次" in clu_mode:
+                        labels, order = np.ones(len(seqs), dtype=int), np.arange(len(seqs))
+                    else:
+                        labels = clonotypes(cdr3s, identity=clu_cut)
+                        order = cluster_order(labels)
+
+                    st.session_state['seq_cluster'] = {
+                        "method": resolve_method(sim_method, len(seqs)), "auto": sim_method == "auto",
+                        "names": names, "cdr3s": cdr3s, "matrix": to_square(condensed, len(seqs)),
+                        "labels": labels, "order": order, "Z": Z,
+                    }
+
+                res = st.session_state.get('seq_cluster')
+                if res and len(res["names"]) == len(df_msa.dropna(subset=[target_col])):
+                    names, labels, matrix = res["names"], res["labels"], res["matrix"]
+                    df_assign = pd.DataFrame({"Name": names, "Cluster": labels, "CDR3": res["cdr3s"]})
+                    df_clu = cluster_summary(names, labels, matrix, cdr3s=res["cdr3s"])
+
+                    m1, m2, m3 = st.columns(3)
+                    m1.metric("序列数", len(names))
+                    m2.metric("簇 / 克隆型数", int((df_clu["Cluster"] > 0).sum()))
+                    m3.metric("单例 (Singleton)", int((df_clu["Size"] == 1).sum()))
+                    if "method" in res:
+                        st.caption(f"相似度算法: {res['method']}" + (" (auto 选择)" if res["auto"] else ""))
+
+                    if res["Z"] is not None:
+                        st.plotly_chart(dendrogram_figure(res["Z"], names), use_container_width=True)
+                    if len(names) > HEATMAP_MAX_SIZE:
+                        st.caption(f"序列较多，热图已按树序分箱平均显示 ({HEATMAP_MAX_SIZE} x {HEATMAP_MAX_SIZE})。")
+                    st.plotly_chart(similarity_heatmap(matrix, res["order"], names, labels), use_container_width=True)
+
+                    c_r1, c_r2 = st.columns([1, 1])
+                    with c_r1:
+                        st.markdown("#### 簇汇总")
+                        st.dataframe(df_clu, use_container_width=True, height=350, hide_index=True)
+                    with c_r2:
+                        st.markdown("#### 序列分组")
+                        st.dataframe(df_assign.iloc[res["order"]], use_container_width=True, height=350, hide_index=True)
+                    st.download_button("📥 下载分组结果 (CSV)", df_assign.to_csv(index=False).encode("utf-8-sig"),
+                                       f"Clusters_{project_id}.csv", "text/csv")
+
+                    # 只保存分组结果；矩阵仅在小样本时保存，避免记录过大
+                    saved = {"clusters": df_assign.to_dict(orient="records"),
+                             "summary": df_clu.to_dict(orient="records")}
+                    if len(names) <= 200:
+                        saved.update(matrix=np.round(matrix, 4).tolist(), names=names)
+                    st.session_state['seq_analysis_result'] = saved
+
+                    # --- 簇内多序列比对 ---
+                    st.markdown("#### 🧱 多序列比对 (MSA)")
+                    sizes = dict(zip(df_clu["Cluster"], df_clu["Size"]))
+                    a1, a2, a3 = st.columns(3)
+                    msa_cluster = a1.selectbox("比对范围", ["全部"] + list(df_clu["Cluster"]),
+                                               format_func=lambda c: c if c == "全部" else f"Cluster {c} ({sizes[c]} 条)")
+                    msa_translate = a2.checkbox("核酸翻译为蛋白", value=True)
+                    msa_color = a3.radio("着色", ["全部残基", "仅与共识不同"], horizontal=True)
+
+                    if st.button("生成 MSA"):
+                        all_seqs = df_msa.dropna(subset=[target_col])[target_col].astype(str).tolist()
+                        idx = np.arange(len(names)) if msa_cluster == "全部" else np.flatnonzero(labels == msa_cluster)
+                        seqs_sel = prepare_sequences([all_seqs[i] for i in idx], translate=msa_translate)
+                        bar = st.progress(0.0, text="多序列比对中...")
+                        aln = align_sequences(seqs_sel, [names[i] for i in idx],
+                                              progress=lambda p: bar.progress(p, text="多序列比对中..."))
+                        bar.empty()
+                        st.session_state['seq_msa'] = {"msa": aln, "profile": column_profile(aln["matrix"], aln["kind"])}
+
+                    msa_res = st.session_state.get('seq_msa')
+                    if msa_res and set(msa_res["msa"]["names"]) <= set(names):
+                        aln, profile = msa_res["msa"], msa_res["profile"]
+                        st.caption(f"{len(aln['names'])} 条序列 × {aln['matrix'].shape[1]} 列，"
+                                   f"中心序列: {aln['center']}；行按导向树排序。")
+                        components.html(msa_viewer_html(aln, profile, height=600,
+                                                        color_mode="all" if msa_color == "全部残基" else "diff"),
+                                        height=610)
+                        st.text_area("共识序列", consensus_sequence(profile), height=80)
+                        d1, d2 = st.columns(2)
+                        d1.download_button("📥 下载比对 (FASTA)", to_fasta(aln).encode("utf-8"),
+                                           f"MSA_{project_id}.fasta", "text/plain")
+                        d2.download_button("📥 下载逐列保守性 (CSV)", profile.to_csv(index=False).encode("utf-8-sig"),
+                                           f"MSA_profile_{project_id}.csv", "text/csv")
             else:
                 st.error("未找到包含 'Seq' 或 'DNA' 的列")
         except Exception as e:
@@ -161,30 +333,210 @@ with tab3:
 
 # --- TAB 4: AB1 ---
 with tab4:
-    st.markdown("### 测序峰图查看器")
-    ab1_file = st.file_uploader("上传 .ab1 文件", type=["ab1", "abi"])
+    st.markdown("### 测序峰图批量处理")
+    ab1_files = st.file_uploader("上传 .ab1 文件 (可多选)", type=["ab1", "abi"], accept_multiple_files=True)
+    c_a1, c_a2, c_a3 = st.columns(3)
+    mott_cutoff = c_a1.number_input("Mott 修剪阈值 (错误概率)", value=MOTT_CUTOFF, min_value=0.001, max_value=0.5,
+                                    step=0.01, format="%.3f")
+    mixed_ratio = c_a2.slider("杂合峰判定 (次峰/主峰 ≥)", 0.1, 0.9, MIXED_RATIO, 0.05)
+    plot_method = c_a3.radio("峰图降采样", ["minmax", "lttb"], horizontal=True)
+
+    if ab1_files and st.button("🚀 批量处理峰图", type="primary"):
+        bar = st.progress(0.0, text="解析 AB1...")
+        results, df_ab1 = process_batch([(f.name, f.getvalue()) for f in ab1_files], cutoff=mott_cutoff,
+                                        ratio=mixed_ratio, progress=lambda p: bar.progress(p, text="解析 AB1..."))
+        bar.empty()
+        st.session_state['ab1_batch'] = {"results": results, "summary": df_ab1}
+        st.session_state.pop('ab1_contigs', None)      # 拼接结果属于上一批文件，作废
+
+    ab1_res = st.session_state.get('ab1_batch')
+    if ab1_res:
+        results, df_ab1 = ab1_res["results"], ab1_res["summary"]
+        ok = df_ab1["Status"] == "OK"
+        m1, m2, m3 = st.columns(3)
+        m1.metric("文件数", len(df_ab1))
+        m2.metric("通过修剪", int(ok.sum()))
+        m3.metric("含杂合峰", int((df_ab1["Mixed Bases"] > 0).sum()))
+        st.dataframe(df_ab1, use_container_width=True, hide_index=True, height=300)
+
+        pick = st.selectbox("查看峰图", range(len(results)), format_func=lambda i: results[i]["name"])
+        rec = results[pick]
+        if rec["traces"] is not None:
+            span = rec["traces"].shape[1]
+            window = st.slider("显示范围 (采样点)", 0, span, (0, span), key=f"ab1_window_{pick}")
+            st.plotly_chart(trace_figure(rec, window, method=plot_method), use_container_width=True)
+        st.text_area("修剪后序列 (含 IUPAC 简并碱基)", rec["trimmed"], height=100)
+        st.download_button("📥 下载修剪后序列 (FASTA)", trimmed_fasta(results).encode("utf-8"),
+                           f"AB1_trimmed_{project_id}.fasta", "text/plain")
+
+        # --- 正反向拼接 ---
+        st.markdown("#### 🧩 正反向读段拼接")
+        st.caption("按文件名末尾的方向标记配对 (例如 Clone1_VH_F.ab1 / Clone1_VH_R.ab1)，反向读段反向互补后比对重叠区，"
+                   "按碱基质量生成一致序列；冲突位点质量相近时记为 IUPAC 简并码。")
+        c_s1, c_s2, c_s3 = st.columns(3)
+        fwd_tags = c_s1.text_input("正向标记 (逗号分隔)", ",".join(FWD_TAGS))
+        rev_tags = c_s2.text_input("反向标记 (逗号分隔)", ",".join(REV_TAGS))
+        qual_delta = c_s3.number_input("冲突取舍质量差", value=QUAL_DELTA, min_value=0, max_value=60)
+        if st.button("🧩 拼接 Contig"):
+            contigs, df_contig = assemble_plate(
+                results, fwd_tags=[t.strip() for t in fwd_tags.split(",") if t.strip()],
+                rev_tags=[t.strip() for t in rev_tags.split(",") if t.strip()], delta=qual_delta)
+            st.session_state['ab1_contigs'] = {"contigs": contigs, "summary": df_contig}
+
+        asm = st.session_state.get('ab1_contigs')
+        if asm and asm["contigs"]:
+            contigs, df_contig = asm["contigs"], asm["summary"]
+            n1, n2, n3 = st.columns(3)
+            n1.metric("克隆数", len(df_contig))
+            n2.metric("成功拼接", int((df_contig["Status"] == "Assembled").sum()))
+            n3.metric("含冲突位点", int((df_contig["Conflicts"] > 0).sum()))
+            st.dataframe(df_contig, use_container_width=True, hide_index=True, height=300)
+
+            pick_c = st.selectbox("查看 Contig", range(len(contigs)), format_func=lambda i: contigs[i]["clone"])
+            st.text_area("Contig 序列", contigs[pick_c]["contig"], height=100)
+            if len(contigs[pick_c]["conflicts"]):
+                st.dataframe(contigs[pick_c]["conflicts"], use_container_width=True, hide_index=True)
+            st.download_button("📥 下载 Contig (FASTA)", contig_fasta(contigs).encode("utf-8"),
+                               f"AB1_contigs_{project_id}.fasta", "text/plain")
+
+            # 直接送入翻译 + FR/CDR 注释 + 风险扫描 (与 Tab 1 同一套流程和基序库)
+            with st.expander("🧬 Contig 翻译 & 风险扫描", expanded=True):
+                df_ctrans = pd.DataFrame({"Name": [c["clone"] for c in contigs],
+                                          "Protein Seq": [translate_contig(c["contig"], genetic_code) for c in contigs]})
+                df_cann = annotate_batch(df_ctrans["Protein Seq"], scheme=num_scheme)
+                try:
+                    df_cliab = scan_sequences(df_ctrans["Protein Seq"], names=df_ctrans["Name"],
+                                              regions=list(df_cann["Regions"]),
+                                              motifs=motif_lib.dropna(subset=["name", "pattern"]).to_dict(orient="records"))
+                except ValueError as e:
+                    st.error(f"基序库错误: {e}")
+                    st.stop()
+                df_csum = liability_summary(df_cliab, df_ctrans["Name"])
+                df_ctrans.insert(1, "Chain", df_cann["Chain"])
+                for col in ("CDR1", "CDR2", "CDR3"):
+                    df_ctrans[col] = df_cann[col]
+                for col in ("Risks", "CDR Risks", "High", "Medium", "Low"):
+                    df_ctrans[col] = df_csum[col].to_numpy()
+                df_ctrans["Assembly"] = df_contig["Status"].to_numpy()
+                st.dataframe(df_ctrans, use_container_width=True, hide_index=True)
+                register_sequences(df_ctrans.assign(DNA=[c["contig"] for c in contigs]), "AB1 Contig", "reg_contig")
+
+        # AB1 结果比较大，这里只存汇总、修剪后的序列和拼接结果
+        st.session_state['seq_analysis_result'] = {
+            "summary": df_ab1.to_dict(orient="records"),
+            "sequences": {r["name"]: r["trimmed"] for r in results},
+            "contigs": asm["summary"].to_dict(orient="records") if asm else [],
+            "contig_sequences": {c["clone"]: c["contig"] for c in asm["contigs"]} if asm else {},
+        }
+
+# --- TAB 5: Germline ---
+with tab5:
+    st.markdown("### V / J 胚系基因分配 & 体细胞突变 (SHM)")
+
+    species_list = list_species()
+    with st.expander("📚 胚系库管理", expanded=not species_list):
+        st.caption(f"胚系库目录: `{GERMLINE_ROOT}`。请上传 IMGT/GENE-DB 导出的 IG V / J 核酸 FASTA "
+                   "(例如兔 IGHV、IGHJ、IGKV、IGKJ)，支持 IMGT 缺口格式；上传后自动构建 k-mer 索引。")
+        g1, g2 = st.columns([1, 2])
+        new_species = g1.text_input("物种", value=DEFAULT_SPECIES)
+        gl_files = g2.file_uploader("胚系 FASTA", type=["fasta", "fa", "fas"], accept_multiple_files=True,
+                                    key="germline_fasta")
+        if gl_files and st.button("📥 安装到胚系库"):
+            try:
+                for gf in gl_files:
+                    install_fasta(new_species, gf.name, gf.getvalue())
+                idx = build_index(new_species, force=True)
+                st.success(f"已安装 {len(idx['genes'])} 条胚系等位基因 "
+                           f"(V {int((idx['genes']['Segment'] == 'V').sum())} / "
+                           f"J {int((idx['genes']['Segment'] == 'J').sum())})")
+                species_list = list_species()
+            except Exception as e:
+                st.error(f"胚系库构建失败: {e}")
 
-    if ab1_file:
+    if not species_list:
+        st.info("ℹ️ 尚未安装胚系库，请先在上方上传 FASTA。")
+    else:
+        g_species = st.selectbox("参考物种", species_list,
+                                 index=species_list.index(DEFAULT_SPECIES) if DEFAULT_SPECIES in species_list else 0)
+        gl_input = st.file_uploader("上传克隆序列 (FASTA / Excel / CSV，核酸)", type=["fasta", "fa", "xlsx", "csv"],
+                                    key="germline_query")
+
+        if gl_input and st.button("🚀 开始分配", type="primary"):
+            if gl_input.name.endswith((".fasta", ".fa")):
+                recs = list(SeqIO.parse(io.StringIO(gl_input.getvalue().decode("utf-8")), "fasta"))
+                q_names, q_seqs = [r.id for r in recs], [str(r.seq) for r in recs]
+            else:
+                df_q = pd.read_excel(gl_input) if gl_input.name.endswith("xlsx") else pd.read_csv(gl_input)
+                q_col = next((c for c in df_q.columns if "seq" in c.lower() or "dna" in c.lower()), None)
+                if q_col is None:
+                    st.error("未找到包含 'Seq' 或 'DNA' 的列")
+                    st.stop()
+                df_q = df_q.dropna(subset=[q_col])
+                q_names, q_seqs = df_q.iloc[:, 0].astype(str).tolist(), df_q[q_col].astype(str).tolist()
+
+            bar = st.progress(0.0, text="V/J 分配中...")
+            df_gl = assign_germlines(q_seqs, names=q_names, species=g_species,
+                                     progress=lambda p: bar.progress(p, text="V/J 分配中..."))
+            bar.empty()
+            st.session_state['germline_result'] = df_gl
+
+        df_gl = st.session_state.get('germline_result')
+        if df_gl is not None:
+            ok = df_gl["Status"] == "OK"
+            m1, m2, m3 = st.columns(3)
+            m1.metric("成功分配", f"{int(ok.sum())} / {len(df_gl)}")
+            m2.metric("V 平均一致度", f"{df_gl.loc[ok, 'V Identity (%)'].mean():.1f}%" if ok.any() else "-")
+            m3.metric("V 平均 SHM (nt)", f"{df_gl.loc[ok, 'V SHM (nt)'].mean():.1f}" if ok.any() else "-")
+
+            st.dataframe(df_gl, use_container_width=True, height=400, hide_index=True)
+            usage = gene_usage(df_gl)
+            if not usage.empty:
+                fig_u = go.Figure(go.Bar(x=usage["Gene"], y=usage["Count"], marker_color="#4a90d9"))
+                fig_u.update_layout(title="V 基因使用频率", height=320, margin=dict(l=10, r=10, t=40, b=10))
+                st.plotly_chart(fig_u, use_container_width=True)
+            st.download_button("📥 下载分配结果 (CSV)", df_gl.to_csv(index=False).encode("utf-8-sig"),
+                               f"Germline_{project_id}.csv", "text/csv")
+            st.session_state['seq_analysis_result'] = {
+                "germline": df_gl.astype(object).where(df_gl.notna(), None).to_dict(orient="records")}
+
+# --- TAB 6: 序列库 ---
+with tab6:
+    st.markdown("### 序列库查询")
+    st.caption("序列按内容哈希去重保存 (有 DNA 按 DNA，否则按蛋白)；在 Tab 1 / Tab 4 结果下方点击「写入序列库」入库。"
+               "查询在本地索引上完成：精确 (哈希表)、前缀 (有序键二分)、k-mer (倒排表，按共享比例排序)。")
+    r1, r2 = st.columns([3, 1])
+    reg_scope = r1.radio("范围", ["当前项目", "全部项目"], horizontal=True)
+    if r2.button("🔄 重新加载") or st.session_state.get('seq_registry', {}).get("scope") != reg_scope:
         try:
-            record = SeqIO.read(ab1_file, "abi")
-            raw = record.annotations['abif_raw']
-            channels = ['DATA9', 'DATA10', 'DATA11', 'DATA12']
-            colors, bases = ['black', 'green', 'red', 'blue'], ['G', 'A', 'T', 'C']
-
-            fig = go.Figure()
-            for i, chan in enumerate(channels):
-                if chan in raw:
-                    fig.add_trace(
-                        go.Scatter(y=raw[chan], mode='lines', name=bases[i], line=dict(color=colors[i], width=1)))
-
-            fig.update_layout(title=f"Trace: {ab1_file.name}", height=400, hovermode="x unified")
-            st.plotly_chart(fig, use_container_width=True)
-            st.text_area("Base Call Sequence", str(record.seq), height=100)
-
-            # AB1 结果比较大，这里只存由机器读出的序列文本
-            st.session_state['seq_analysis_result'] = {"read_sequence": str(record.seq)}
+            df_reg = fetch_registry(pb, project_id if reg_scope == "当前项目" else None)
+            st.session_state['seq_registry'] = {"scope": reg_scope, "index": SequenceIndex(df_reg)}
         except Exception as e:
-            st.error(f"AB1 解析失败: {e}")
+            st.error(f"读取序列库失败: {e}")
+            st.session_state.pop('seq_registry', None)
+
+    reg = st.session_state.get('seq_registry')
+    if reg:
+        index = reg["index"]
+        st.metric("记录数", len(index.df))
+        q1, q2, q3 = st.columns([1, 1, 2])
+        q_field = q1.selectbox("字段", ["cdr3", "clone_id", "protein", "dna"], format_func=str.upper)
+        q_mode = q2.selectbox("方式", ["exact", "prefix", "kmer"],
+                              format_func=lambda m: {"exact": "精确", "prefix": "前缀", "kmer": f"k-mer (k={KMER_K})"}[m])
+        q_text = q3.text_input("查询内容", placeholder="例如 CDR3: ARDYYGSSYFDL")
+        show_cols = ["clone_id", "name", "chain", "cdr1", "cdr2", "cdr3", "source", "project_id", "inventory"]
+        if q_text:
+            q_text = q_text.strip() if q_field == "clone_id" else q_text.strip().upper()
+            if q_mode == "kmer":
+                min_shared = st.slider("最少共享 k-mer 比例", 0.1, 1.0, 0.5, 0.05)
+                df_hit = index.kmer(q_field, q_text, min_shared=min_shared)
+                show_cols = ["Shared (%)"] + show_cols
+            else:
+                df_hit = getattr(index, q_mode)(q_field, q_text)
+            st.markdown(f"**命中 {len(df_hit)} 条**，涉及 {df_hit['clone_id'].nunique()} 个克隆")
+            st.dataframe(df_hit[show_cols], use_container_width=True, hide_index=True)
+
+        with st.expander("🔗 共享 CDR3 的克隆"):
+            st.dataframe(index.shared("cdr3"), use_container_width=True, hide_index=True)
 
 # ==========================================
 # 3. 底部保存区 (修复版)
@@ -197,11 +549,21 @@ with col_save:
 
         # 1. 准备要保存的文件对象
         final_file_obj = None
-
-        # 优先级 A: AB1 文件 (如果是 AB1 模式)
-        if ab1_file:
-            ab1_file.seek(0)
-            final_file_obj = ab1_file
+        pw = st.session_state.get('pairwise') or {}        # TAB2 双序列比对的输入序列
+        seq_a, seq_b = pw.get("ref_dna", ""), pw.get("clone_dna", "")
+
+        # 优先级 A: AB1 文件 (如果是 AB1 模式；多个文件打包为 zip)
+        if ab1_files:
+            if len(ab1_files) == 1:
+                ab1_files[0].seek(0)
+                final_file_obj = ab1_files[0]
+            else:
+                final_file_obj = io.BytesIO()
+                with zipfile.ZipFile(final_file_obj, "w", zipfile.ZIP_DEFLATED) as zf:
+                    for f in ab1_files:
+                        zf.writestr(f.name, f.getvalue())
+                final_file_obj.seek(0)
+                final_file_obj.name = "ab1_batch.zip"
 
         # 优先级 B: Excel 文件 (如果是聚类模式)
         elif msa_file:
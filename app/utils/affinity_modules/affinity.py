@@ -14,6 +14,11 @@ if root_dir not in sys.path:
     sys.path.append(root_dir)
 
 from db import save_experiment_record
+from utils.classification import classify_threshold, classify_bands, fold_change
+
+# KD 量级分档 (M)
+KD_BAND_EDGES = [1e-12, 1e-11, 1e-10, 1e-9, 1e-8]
+KD_BAND_LABELS = ["<1 pM", "1-10 pM", "10-100 pM", "0.1-1 nM", "1-10 nM", ">10 nM"]
 
 
 # ==========================================
@@ -132,8 +137,10 @@ def show():
             # 3. 重算 KD (确保一致性)
             df[kd_col] = df[koff_col] / df[kon_col]
 
-            # 4. 判定优劣
-            df['Status'] = df.apply(lambda x: 'Better' if x[kd_col] < ref_kd else 'Worse', axis=1)
+            # 4. 判定优劣 (向量化：状态 / 倍数 / 量级)
+            df['Status'] = classify_threshold(df[kd_col], ref_kd, ("Better", "Worse"), "<")
+            df['Fold vs Ref'] = fold_change(df[kd_col], ref_kd, invert=True)
+            df['KD Band'] = classify_bands(df[kd_col], KD_BAND_EDGES, KD_BAND_LABELS)
 
             # --- 3. 散点图 ---
             st.markdown("### 1. 亲和力分布")
@@ -155,8 +162,10 @@ def show():
             with col_table:
                 st.markdown("**Top Candidates**")
                 # 排序
-                df_display = df[[name_col, kd_col, 'Status']].sort_values(by=kd_col).reset_index(drop=True)
-                styler = df_display.style.format({kd_col: "{:.2e}"}).background_gradient(subset=[kd_col], cmap="Greens")
+                df_display = df[[name_col, kd_col, 'Fold vs Ref', 'KD Band', 'Status']] \
+                    .sort_values(by=kd_col).reset_index(drop=True)
+                styler = df_display.style.format({kd_col: "{:.2e}", 'Fold vs Ref': "{:.2f}"}) \
+                    .background_gradient(subset=[kd_col], cmap="Greens")
 
                 selection = st.dataframe(
                     styler, use_container_width=True, height=450,
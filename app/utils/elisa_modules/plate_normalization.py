@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from utils.elisa_modules.screening_engine import MAD_SCALE
+
+# 归一化模式 -> 推荐的固定阈值 (得分单位)
+NORMALIZATION_MODES = {
+    "none": None,
+    "bscore": 3.0,
+    "poc": 50.0,
+    "zscore": 3.0,
+}
+
+
+# ==========================================
+# 1. 孔位掩码
+# ==========================================
+def wells_to_mask(wells, shape=(8, 12)):
+    """[(r, c), ...] (0 基) -> 布尔掩码"""
+    mask = np.zeros(shape, dtype=bool)
+    if wells:
+        rows, cols = zip(*wells)
+        mask[list(rows), list(cols)] = True
+    return mask
+
+
+def edge_mask(shape=(8, 12)):
+    """板边缘一圈孔位"""
+    mask = np.zeros(shape, dtype=bool)
+    mask[[0, -1], :] = True
+    mask[:, [0, -1]] = True
+    return mask
+
+
+# ==========================================
+# 2. 归一化 (stack: (板数, 行, 列)，整批向量化)
+# ==========================================
+def median_polish(stack, exclude=None, n_iter=10, tol=1e-6):
+    """
+    Tukey 中位数平滑：交替扣除行/列中位数，返回残差
+    exclude 为对照孔掩码，这些孔不参与行列效应估计，残差记为 NaN
+    """
+    resid = stack.astype(float).copy()
+    if exclude is not None and exclude.any():
+        resid[:, exclude] = np.nan
+
+    for _ in range(n_iter):
+        row_eff = np.nanmedian(resid, axis=2, keepdims=True)
+        resid -= row_eff
+        col_eff = np.nanmedian(resid, axis=1, keepdims=True)
+        resid -= col_eff
+        if max(np.nanmax(np.abs(row_eff)), np.nanmax(np.abs(col_eff))) < tol:
+            break
+    return resid
+
+
+def _per_plate_mad(values):
+    """values: (板数, N)，返回每板 MAD (SD 尺度)"""
+    med = np.nanmedian(values, axis=1, keepdims=True)
+    return MAD_SCALE * np.nanmedian(np.abs(values - med), axis=1)
+
+
+def b_score(stack, exclude=None, n_iter=10):
+    """B-score = 中位数平滑残差 / 残差 MAD，可消除边缘效应与行列梯度"""
+    resid = median_polish(stack, exclude=exclude, n_iter=n_iter)
+    mad = _per_plate_mad(resid.reshape(resid.shape[0], -1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return resid / mad[:, None, None]
+
+
+def z_score(stack, exclude=None):
+    """经典 Z-score (样品孔均值/标准差，对照孔为 NaN)"""
+    vals = stack.astype(float).copy()
+    if exclude is not None and exclude.any():
+        vals[:, exclude] = np.nan
+    flat = vals.reshape(vals.shape[0], -1)
+    mu = np.nanmean(flat, axis=1)
+    sd = np.nanstd(flat, axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (vals - mu[:, None, None]) / sd[:, None, None]
+
+
+def percent_of_control(stack, pos_mask, neg_mask=None):
+    """
+    有阴阳对照: 100 * (x - Neg) / (Pos - Neg)
+    只有阳性对照: 100 * x / Pos
+    """
+    pos = stack[:, pos_mask].mean(axis=1)
+    neg = stack[:, neg_mask].mean(axis=1) if neg_mask is not None and neg_mask.any() else np.zeros_like(pos)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100.0 * (stack - neg[:, None, None]) / (pos - neg)[:, None, None]
+    controls = pos_mask | (neg_mask if neg_mask is not None else False)
+    out[:, controls] = np.nan
+    return out
+
+
+def normalize_plates(stack, mode, pos_mask=None, neg_mask=None):
+    """
+    mode: none / bscore / poc / zscore
+    对照孔不参与归一化，返回的对照孔得分为 NaN (不会被判为阳性)
+    """
+    controls = np.zeros(stack.shape[1:], dtype=bool)
+    for m in (pos_mask, neg_mask):
+        if m is not None:
+            controls |= m
+
+    if mode == "none":
+        return stack
+    if mode == "bscore":
+        return b_score(stack, exclude=controls)
+    if mode == "zscore":
+        return z_score(stack, exclude=controls)
+    if mode == "poc":
+        if pos_mask is None or not pos_mask.any():
+            raise ValueError("Percent of control 需要至少一个阳性对照孔")
+        return percent_of_control(stack, pos_mask, neg_mask)
+    raise ValueError(f"未知归一化模式: {mode}")
+
+
+# ==========================================
+# 3. 板级 QC
+# ==========================================
+def plate_qc(stack, pos_mask=None, neg_mask=None):
+    """
+    每块板一行：
+    Z' / Signal Window / S/B (需阴阳对照)、对照与样品 CV%、边缘效应比 (边缘均值 / 内部均值)
+    """
+    n_plates = stack.shape[0]
+    controls = np.zeros(stack.shape[1:], dtype=bool)
+    for m in (pos_mask, neg_mask):
+        if m is not None:
+            controls |= m
+
+    def stats(mask):
+        if mask is None or not mask.any():
+            nan = np.full(n_plates, np.nan)
+            return nan, nan
+        vals = stack[:, mask]
+        sd = vals.std(axis=1, ddof=1) if vals.shape[1] > 1 else np.full(n_plates, np.nan)
+        return vals.mean(axis=1), sd
+
+    mu_p, sd_p = stats(pos_mask)
+    mu_n, sd_n = stats(neg_mask)
+    mu_s, sd_s = stats(~controls)
+    edges = edge_mask(stack.shape[1:])
+    mu_edge, _ = stats(edges & ~controls)
+    mu_mid, _ = stats(~edges & ~controls)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        window = np.abs(mu_p - mu_n)
+        spread = 3 * (sd_p + sd_n)
+        return pd.DataFrame({
+            "Z'": 1 - spread / window,
+            "Signal Window": (window - spread) / sd_p,
+            "S/B": mu_p / mu_n,
+            "Pos CV%": 100 * sd_p / mu_p,
+            "Neg CV%": 100 * sd_n / mu_n,
+            "Sample CV%": 100 * sd_s / mu_s,
+            "Edge Ratio": mu_edge / mu_mid,
+        })
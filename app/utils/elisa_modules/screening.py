@@ -1,7 +1,6 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import io
 import sys
 import os
 
@@ -12,6 +11,29 @@ if root_dir not in sys.path:
     sys.path.append(root_dir)
 
 from db import save_experiment_record
+from utils.classification import threshold_styles
+from utils.elisa_modules.screening_engine import (
+    ROWS_96, read_plate_array, build_plate_stack, parse_wells, compute_cutoffs, call_hits, plate_summary, plate_matrix
+)
+from utils.elisa_modules.plate_normalization import NORMALIZATION_MODES, wells_to_mask, normalize_plates, plate_qc
+from utils.elisa_modules.screening_report import new_temp_path, write_screening_report, write_screening_bundle
+from utils.elisa_modules.worklist import (
+    WORKLIST_FORMATS, build_worklist, worklist_stats, export_worklist, layout_to_inventory, inventory_excel
+)
+
+NORM_OPTIONS = {
+    "无 (原始 OD)": "none",
+    "B-score (中位数平滑，校正边缘/行列梯度)": "bscore",
+    "Percent of Control (%)": "poc",
+    "Z-score": "zscore",
+}
+
+# 导出格式 -> (扩展名, MIME)
+EXPORT_FORMATS = {
+    "Excel 田字格打印版": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV 压缩包": (".zip", "application/zip"),
+    "Parquet 压缩包": (".zip", "application/zip"),
+}
 
 
 # ==========================================
@@ -83,97 +105,26 @@ def show_384_guide_component():
 
 
 # ==========================================
-# 辅助函数：读取 96 孔板
-# ==========================================
-def parse_plate_96(file_obj, plate_name):
-    try:
-        df_raw = pd.read_excel(file_obj, header=None)
-        df_matrix = df_raw.iloc[0:8, 0:12].copy()
-        df_matrix.index = list('ABCDEFGH')
-        df_matrix.columns = list(range(1, 13))
-        df_matrix = df_matrix.apply(pd.to_numeric, errors='coerce').fillna(0)
-
-        data = []
-        for r in df_matrix.index:
-            for c in df_matrix.columns:
-                val = df_matrix.loc[r, c]
-                data.append({
-                    "Plate": plate_name, "Well": f"{r}{c}", "Row": r, "Col": c, "OD": float(val), "Source": "Direct"
-                })
-        return pd.DataFrame(data), [("96_Plate", df_matrix, plate_name)]
-    except:
-        return None, None
-
-
-# ==========================================
-# 辅助函数：读取 384 孔板并拆分
+# 样式函数
 # ==========================================
-def parse_plate_384(file_obj, filename_base):
-    try:
-        df_raw = pd.read_excel(file_obj, header=None)
-        df_384 = df_raw.iloc[0:16, 0:24].copy()
-
-        rows_96 = list('ABCDEFGH')
-        cols_96 = list(range(1, 13))
-        plates = {k: pd.DataFrame(index=rows_96, columns=cols_96) for k in ["Q1", "Q2", "Q3", "Q4"]}
-
-        data_list = []
-        rows_384 = list('ABCDEFGHIJKLMNOP')
-
-        for r_384 in range(16):
-            for c_384 in range(24):
-                val = df_384.iloc[r_384, c_384]
-                val = float(val) if (pd.notna(val) and isinstance(val, (int, float))) else 0.0
-
-                # 坐标变换
-                r_96 = r_384 // 2
-                c_96 = c_384 // 2
-                row_lbl = rows_96[r_96]
-                col_lbl = cols_96[c_96]
-
-                is_r_even = (r_384 % 2 == 0)
-                is_c_even = (c_384 % 2 == 0)
-
-                if is_r_even and is_c_even:
-                    q = "Q1"
-                elif is_r_even and not is_c_even:
-                    q = "Q2"
-                elif not is_r_even and is_c_even:
-                    q = "Q3"
-                else:
-                    q = "Q4"
-
-                plates[q].loc[row_lbl, col_lbl] = val
-
-                plate_name_final = f"{filename_base}_{q}"
-                well_384 = f"{rows_384[r_384]}{c_384 + 1}"
-
-                data_list.append({
-                    "Plate": plate_name_final, "Well": f"{row_lbl}{col_lbl}",
-                    "Row": row_lbl, "Col": col_lbl, "OD": val, "Source": f"384-{well_384}"
-                })
+HIT_CSS = 'background-color: #ffcccc; color: #cc0000; font-weight: bold; border: 1px solid #ffaaaa'
+MISS_CSS = 'background-color: #ffffff; color: #cccccc; border: 1px solid #eeeeee'
 
-        matrix_list = []
-        for q in ["Q1", "Q2", "Q3", "Q4"]:
-            name = f"{filename_base}_{q}"
-            matrix_list.append((q, plates[q], name))
 
-        return pd.DataFrame(data_list), matrix_list
-    except:
-        return None, None
+def highlight_hits(df, cutoff):
+    """整板一次生成样式表，配合 Styler.apply(axis=None) 使用"""
+    return threshold_styles(df, cutoff, HIT_CSS, MISS_CSS)
 
 
-# ==========================================
-# 样式函数
-# ==========================================
-def highlight_hits(val, cutoff):
-    try:
-        if float(val) >= cutoff:
-            return 'background-color: #ffcccc; color: #cc0000; font-weight: bold; border: 1px solid #ffaaaa'
-        else:
-            return 'background-color: #ffffff; color: #cccccc; border: 1px solid #eeeeee'
-    except:
-        return ''
+def _replace_report_file(path):
+    """记录本次导出的临时文件，并删除上一次的"""
+    old = st.session_state.get('scr_report_path')
+    if old and old != path and os.path.exists(old):
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    st.session_state['scr_report_path'] = path
 
 
 # ==========================================
@@ -203,212 +154,243 @@ def show():
         st.warning("请上传数据文件。")
         return
 
-    # --- 4. 阈值 ---
-    st.subheader("2. 阳性阈值 (Cutoff)")
+    # --- 4. 归一化 & 对照 ---
+    st.subheader("2. 板内归一化 & 对照孔")
+    c_norm, c_pos, c_neg = st.columns([2, 1, 1])
+    norm_mode = NORM_OPTIONS[c_norm.selectbox("归一化模式", list(NORM_OPTIONS.keys()))]
+    pos_ctrl = c_pos.text_input("阳性对照孔位 (96孔坐标)", "", help="多孔用逗号分隔，留空表示无")
+    neg_ctrl = c_neg.text_input("阴性对照孔位 (96孔坐标)", "H12", help="多孔用逗号分隔，留空表示无")
+    if "384" in plate_type:
+        st.caption("384 模式下按拆分后的每块 96 孔虚拟板分别归一化，对照孔位同样使用 96 孔坐标。")
+
+    # --- 5. 阈值 ---
+    st.subheader("3. 阳性阈值 (Cutoff)")
     c_rule, c_val = st.columns([2, 1])
     with c_rule:
         method = st.radio("判定策略",
-                          ["固定阈值 (Fixed OD)", "基于阴性对照 (Neg + 3SD)", "动态统计 (板内后10%数据为背景)"])
+                          ["固定阈值 (Fixed OD)", "基于阴性对照 (Neg + 3SD)", "动态统计 (板内后10%数据为背景)",
+                           "稳健统计 (Median + k·MAD / Robust Z)"])
     with c_val:
         manual_cutoff = 0.5
-        neg_pos = "H12"
+        k_sd = 3.0
         if "固定" in method:
-            manual_cutoff = st.number_input("OD >", 0.5, step=0.1)
+            if norm_mode == "none":
+                manual_cutoff = st.number_input("OD >", 0.5, step=0.1)
+            else:
+                manual_cutoff = st.number_input("Score ≥", value=NORMALIZATION_MODES[norm_mode], step=0.5)
         elif "阴性对照" in method:
-            neg_pos = st.text_input("阴性孔位 (96孔坐标)", "H12")
-
-    # --- 5. 分析逻辑 ---
+            st.caption(f"使用上方阴性对照孔位: {neg_ctrl or '(未填写)'}")
+        elif "稳健" in method:
+            k_sd = st.number_input("k (Robust Z ≥ k)", value=3.0, min_value=0.5, step=0.5)
+
+    # --- 6. 挑克隆 Worklist 设置 ---
+    with st.expander("🤖 挑克隆 Worklist 设置 (液体工作站)", expanded=False):
+        w1, w2, w3, w4 = st.columns(4)
+        wl_volume = w1.number_input("转移体积 (uL)", value=50.0, min_value=0.1, step=10.0)
+        wl_channels = w2.selectbox("移液通道", [1, 8], index=0)
+        wl_replicates = w3.number_input("复本数 (目标板份数)", value=1, min_value=1, max_value=4, step=1)
+        wl_prefix = w4.text_input("目标板前缀", value=f"{project_id}_Pick")
+        w5, w6 = st.columns([3, 1])
+        wl_reserved = w5.text_input("目标板预留孔位 (不放克隆，逗号分隔)", value="H11, H12")
+        wl_fmt = w6.selectbox("Worklist 格式", WORKLIST_FORMATS)
+
+    # --- 7. 分析逻辑 ---
     if st.button("🚀 开始分析 & 拆解数据", type="primary"):
-        all_data_long = []
-        plate_matrices = []  # 用于显示的列表
-        # 用于 Excel 导出的字典： { "Filename": { "Q1": matrix, "Q2": matrix... } }
-        plate_groups_for_excel = {}
-        summary_stats = []
+        is_384 = "384" in plate_type
+        shape = (16, 24) if is_384 else (8, 12)
 
+        # 5.1 读取全部文件 -> 堆叠为 (板数, 8, 12)
+        named_arrays = []
         progress = st.progress(0)
-
         for i, f in enumerate(uploaded_files):
             progress.progress((i + 1) / len(uploaded_files))
             fname = f.name.split('.')[0]
+            try:
+                arr = read_plate_array(f, *shape)
+            except Exception:
+                arr = None
+            if arr is None:
+                st.warning(f"⚠️ 跳过无法解析的文件: {f.name}")
+                continue
+            named_arrays.append((fname, arr))
+        progress.empty()
 
-            # 这里的 fname 作为分组的 Key
-            plate_groups_for_excel[fname] = {}
-
-            if "96" in plate_type:
-                df_long, matrices = parse_plate_96(f, fname)
+        stack, meta = build_plate_stack(named_arrays, is_384=is_384)
+
+        # 5.2 对照孔 & 归一化 (整批向量化)
+        pos_wells, neg_wells = None, None
+        try:
+            pos_wells = parse_wells(pos_ctrl) if pos_ctrl.strip() else None
+            neg_wells = parse_wells(neg_ctrl) if neg_ctrl.strip() else None
+        except ValueError as e:
+            st.warning(f"⚠️ 对照孔位{e}，忽略对照设置")
+        pos_mask = wells_to_mask(pos_wells) if pos_wells else None
+        neg_mask = wells_to_mask(neg_wells) if neg_wells else None
+        controls = wells_to_mask((pos_wells or []) + (neg_wells or []))     # 对照孔不参与判阳
+
+        scores = None
+        if norm_mode != "none":
+            try:
+                scores = normalize_plates(stack, norm_mode, pos_mask, neg_mask)
+            except ValueError as e:
+                st.warning(f"⚠️ {e}，改用原始 OD")
+        values = stack if scores is None else scores
+
+        # 5.3 整批计算 Cutoff
+        if "固定" in method:
+            cutoffs = compute_cutoffs(values, "fixed", manual_cutoff=manual_cutoff)
+        elif "阴性对照" in method and scores is None:
+            if neg_wells:
+                cutoffs = compute_cutoffs(values, "neg", neg_wells=neg_wells)
             else:
-                df_long, matrices = parse_plate_384(f, fname)
-
-            if df_long is None: continue
-
-            # 处理每一块(虚拟)板
-            for q_tag, df_matrix, final_name in matrices:
-                # 筛选当前板的数据
-                sub_df_long = df_long[df_long['Plate'] == final_name].copy()
-
-                # 计算 Cutoff
-                cutoff = 0.5
-                if "固定" in method:
-                    cutoff = manual_cutoff
-                elif "阴性对照" in method:
-                    try:
-                        nr, nc = neg_pos[0].upper(), int(neg_pos[1:])
-                        neg_val = df_matrix.loc[nr, nc]
-                        cutoff = neg_val * 3.0 if neg_val > 0.1 else neg_val + 0.2
-                    except:
-                        cutoff = 0.5
-                elif "动态" in method:
-                    vals = sorted(sub_df_long['OD'].values)
-                    bg = vals[:10]
-                    cutoff = np.mean(bg) + 3 * np.std(bg)
-                    if cutoff < 0.2: cutoff = 0.2
-
-                sub_df_long['Cutoff'] = cutoff
-                sub_df_long['Result'] = sub_df_long['OD'].apply(lambda x: 'Positive' if x >= cutoff else 'Negative')
-                hits = len(sub_df_long[sub_df_long['Result'] == 'Positive'])
-
-                all_data_long.append(sub_df_long)
-
-                # 存入列表用于网页展示
-                plate_matrices.append({
-                    "name": final_name,
-                    "matrix": df_matrix,
-                    "cutoff": cutoff,
-                    "hits": hits
-                })
-
-                # 存入字典用于 Excel 导出 (保留 Q 标签)
-                # 结构: groups["File1"]["Q1"] = {matrix, cutoff}
-                plate_groups_for_excel[fname][q_tag if "384" in plate_type else "96_Plate"] = {
-                    "matrix": df_matrix,
-                    "cutoff": cutoff
-                }
-
-                summary_stats.append({
-                    "Source File": fname, "Plate ID": final_name, "Cutoff": cutoff, "Hits": hits
-                })
+                st.warning("⚠️ 未指定阴性对照孔位，使用默认 Cutoff 0.5")
+                cutoffs = compute_cutoffs(values, "fixed", manual_cutoff=0.5)
+        elif "动态" in method and scores is None:
+            cutoffs = compute_cutoffs(values, "background", floor=0.2)
+        else:
+            if "阴性对照" in method:
+                st.warning("⚠️ 归一化后对照孔不参与判定，改用稳健统计 (Median + k·MAD)")
+            elif "动态" in method:
+                # 归一化得分以 0 为中心，后 10% 的“背景”为负值，其 Mean + 3SD 会把大半块板判为阳性
+                st.warning("⚠️ 归一化得分没有背景基线，动态统计不适用，改用稳健统计 (Median + k·MAD)")
+            cutoffs = compute_cutoffs(values, "robust", k=k_sd, floor=0.2 if scores is None else -np.inf)
 
-        progress.empty()
+        # 5.4 一次性判定 & 排名 + 板级 QC
+        df_final = call_hits(stack, cutoffs, meta, scores=scores, exclude=controls)
+        df_summary = pd.concat([plate_summary(meta, cutoffs, values, exclude=controls), plate_qc(stack, pos_mask, neg_mask)], axis=1)
 
-        if all_data_long:
-            df_final = pd.concat(all_data_long, ignore_index=True)
-            df_hits = df_final[df_final['Result'] == 'Positive'].sort_values(by='OD', ascending=False)
-
-            # --- 展示结果 ---
-            st.markdown("---")
-            st.subheader(f"3. 筛选结果 (共 {len(df_hits)} 个阳性)")
-
-            t1, t2, t3 = st.tabs(["📊 板图概览", "📋 挑克隆名单", "📈 统计"])
-
-            with t1:
-                st.caption("以下展示拆解后的 **96孔板视图**。")
-                for pm in plate_matrices:
-                    title = f"🧩 板号: {pm['name']} (Hits: {pm['hits']})"
-                    with st.expander(title, expanded=True):
-                        styler = pm['matrix'].style \
-                            .format("{:.3f}") \
-                            .applymap(lambda x: highlight_hits(x, pm['cutoff']))
-                        st.dataframe(styler, use_container_width=True, height=330)
-
-            with t2:
-                cols = ['Plate', 'Well', 'OD', 'Result', 'Cutoff']
-                if "384" in plate_type: cols.append('Source')
-                st.dataframe(df_hits[cols].style.background_gradient(subset=['OD'], cmap='Reds'),
-                             use_container_width=True)
-
-            with t3:
-                st.dataframe(pd.DataFrame(summary_stats), use_container_width=True)
-
-            # --- 下载与保存 ---
-            st.markdown("---")
-            c1, c2 = st.columns([1, 1])
-            with c1:
-                # --- Excel 导出核心逻辑 (田字格布局) ---
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    wb = writer.book
-                    # 格式：红底红字
-                    red_fmt = wb.add_format({'bg_color': '#FFC7CE', 'font_color': '#9C0006'})
-
-                    # 1. 名单 & 统计
-                    df_hits.to_excel(writer, sheet_name='Pick_List', index=False)
-                    pd.DataFrame(summary_stats).to_excel(writer, sheet_name='Summary', index=False)
-
-                    # 2. 板图 (按源文件分组，每个文件一个 Sheet)
-                    for file_base, quadrants in plate_groups_for_excel.items():
-                        # Sheet 名限制 31 字符
-                        sheet_name = file_base[:30]
-                        ws = wb.add_worksheet(sheet_name)
-
-                        # 如果是 96 孔，只有一个
-                        if "96_Plate" in quadrants:
-                            info = quadrants["96_Plate"]
-                            ws.write(0, 0, f"Plate: {file_base} (Cutoff: {info['cutoff']:.3f})")
-                            # 写入数据
-                            # Pandas to_excel 不能直接指定 writer 的 cell，需要手动循环或转换
-                            # 这里简单点：直接把 DataFrame 写在特定位置
-                            # 为了方便，我们临时创建一个 writer 只写这部分是不行的，必须全手动
-
-                            # 手动写入 96 孔矩阵 (带表头)
-                            # 写表头
-                            ws.write_row(1, 0, [""] + list(range(1, 13)))
-                            for r_idx, r_label in enumerate(list('ABCDEFGH')):
-                                ws.write(r_idx + 2, 0, r_label)  # 行号
-                                for c_idx in range(12):
-                                    val = info['matrix'].iloc[r_idx, c_idx]
-                                    ws.write(r_idx + 2, c_idx + 1, val)
-                                    # 条件格式
-                                    if val >= info['cutoff']:
-                                        ws.write(r_idx + 2, c_idx + 1, val, red_fmt)
-
-                        else:
-                            # 384 模式：田字格排布
-                            # Q1 (0,0) | Q2 (0, 14)
-                            # Q3 (11,0) | Q4 (11, 14)
-
-                            positions = {
-                                "Q1": (0, 0),  # Row 0, Col 0
-                                "Q2": (0, 14),  # Row 0, Col 14 (中间空1列 + 行标题)
-                                "Q3": (11, 0),  # Row 11, Col 0 (中间空2行)
-                                "Q4": (11, 14)
-                            }
-
-                            for q_tag, pos in positions.items():
-                                if q_tag in quadrants:
-                                    info = quadrants[q_tag]
-                                    start_r, start_c = pos
-
-                                    # 标题
-                                    ws.write(start_r, start_c, f"{q_tag} (Cutoff: {info['cutoff']:.3f})")
-
-                                    # 表头 (1-12)
-                                    ws.write_row(start_r + 1, start_c + 1, list(range(1, 13)))
-
-                                    # 数据主体
-                                    for r_idx, r_label in enumerate(list('ABCDEFGH')):
-                                        # 行号 (A-H)
-                                        ws.write(start_r + r_idx + 2, start_c, r_label)
-
-                                        for c_idx in range(12):
-                                            val = info['matrix'].iloc[r_idx, c_idx]
-                                            cell_r = start_r + r_idx + 2
-                                            cell_c = start_c + c_idx + 1
-
-                                            ws.write(cell_r, cell_c, val)
-                                            if val >= info['cutoff']:
-                                                ws.write(cell_r, cell_c, val, red_fmt)
-
-                st.download_button("📥 下载筛选报告 (田字格打印版)", output.getvalue(), f"Screen_{project_id}.xlsx",
-                                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        plate_matrices = []  # 用于显示的列表
+        # 用于 Excel 导出的字典： { "Filename": { "Q1": matrix, "Q2": matrix... } }
+        plate_groups_for_excel = {}
+        for i, row in enumerate(meta.itertuples(index=False)):
+            df_matrix = plate_matrix(values, i)
+            plate_matrices.append({
+                "name": row.Plate,
+                "matrix": df_matrix,
+                "cutoff": cutoffs[i],
+                "hits": int(df_summary['Hits'].iat[i])
+            })
+            plate_groups_for_excel.setdefault(row.File, {})[row.Quadrant] = {
+                "matrix": df_matrix,
+                "cutoff": cutoffs[i]
+            }
+        # 结果存入 session：切换导出格式 / 点击保存等操作触发重跑时结果不会消失
+        st.session_state['scr_result'] = {
+            "df_final": df_final, "df_summary": df_summary, "plate_matrices": plate_matrices,
+            "plate_groups": plate_groups_for_excel, "normalized": scores is not None, "is_384": is_384,
+        }
+        _replace_report_file(None)      # 旧报告对应上一次分析，作废
+
+    # --- 8. 结果展示 ---
+    result = st.session_state.get('scr_result')
+    if not result or not len(result["df_final"]):
+        return
+    df_final, df_summary = result["df_final"], result["df_summary"]
+    plate_matrices, plate_groups_for_excel = result["plate_matrices"], result["plate_groups"]
+    normalized, is_384 = result["normalized"], result["is_384"]
+    summary_stats = df_summary.to_dict(orient="records")
+    df_hits = df_final[df_final['Result'] == 'Positive'].sort_values(by='Rank')
+
+    # --- 展示结果 ---
+    st.markdown("---")
+    st.subheader(f"4. 筛选结果 (共 {len(df_hits)} 个阳性)")
+
+    t1, t2, t3, t4 = st.tabs(["📊 板图概览", "📋 挑克隆名单", "📈 统计", "🤖 Worklist"])
+
+    with t1:
+        st.caption("以下展示拆解后的 **96孔板视图**。" + (" (数值为归一化得分)" if normalized else ""))
+        expand_all = len(plate_matrices) <= 8
+        for pm in plate_matrices:
+            title = f"🧩 板号: {pm['name']} (Hits: {pm['hits']})"
+            with st.expander(title, expanded=expand_all):
+                styler = pm['matrix'].style \
+                    .format("{:.3f}") \
+                    .apply(highlight_hits, axis=None, cutoff=pm['cutoff'])
+                st.dataframe(styler, use_container_width=True, height=330)
+
+    with t2:
+        cols = ['Rank', 'Plate', 'Well', 'OD'] + (['Score'] if normalized else []) + \
+               ['Robust Z', 'Result', 'Cutoff']
+        if is_384: cols.append('Source')
+        st.dataframe(df_hits[cols].style.background_gradient(subset=['OD'], cmap='Reds'),
+                     use_container_width=True)
+
+    with t3:
+        st.caption("Z' ≥ 0.5 为优秀板；Edge Ratio 明显偏离 1 提示边缘效应。")
+        st.dataframe(
+            df_summary.style.format(precision=3)
+            .apply(threshold_styles, axis=None, subset=["Z'"], cutoff=0.5,
+                   hit_css="background-color: #ffcccc; color: #cc0000", direction="<"),
+            use_container_width=True
+        )
+
+    with t4:
+        try:
+            reserved = [f"{ROWS_96[r]}{c + 1}" for r, c in parse_wells(wl_reserved)] if wl_reserved.strip() else []
+            df_wl, df_layout = build_worklist(
+                df_hits, volume_ul=wl_volume, dest_prefix=wl_prefix, reserved_wells=reserved,
+                replicates=int(wl_replicates), channels=wl_channels, clone_prefix=f"{project_id}-"
+            )
+        except ValueError as e:
+            st.error(f"Worklist 生成失败: {e}")
+            df_wl = pd.DataFrame()
+
+        if df_wl.empty:
+            st.info("没有阳性克隆，无需生成 Worklist。")
+        else:
+            stats = worklist_stats(df_wl, wl_channels)
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("转移步数", stats["Transfers"])
+            m2.metric("枪头数", stats["Tips"])
+            m3.metric("目标板数", stats["Destination Plates"])
+            m4.metric("移液循环", stats["Cycles"])
+            st.dataframe(df_wl, use_container_width=True, height=360, hide_index=True)
+
+            d2, d3 = st.columns(2)
+            ext = ".gwl" if wl_fmt == "Tecan GWL" else ".csv"
+            d2.download_button(f"📥 下载 Worklist ({wl_fmt})", export_worklist(df_wl, wl_fmt, 16 if is_384 else 8),
+                               f"Worklist_{project_id}{ext}", "text/plain", use_container_width=True)
+            d3.download_button("📦 下载库存导入表 (目标板布局)",
+                               inventory_excel(layout_to_inventory(df_layout, project_id)),
+                               f"Pick_Inventory_{project_id}.xlsx",
+                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                               use_container_width=True)
+            st.caption("库存导入表可直接在「📦 库存管理 → 批量导入」上传，完成克隆登记。")
+
+    # --- 下载与保存 ---
+    st.markdown("---")
+    c1, c2 = st.columns([1, 1])
+    with c1:
+        export_fmt = st.radio("导出格式", list(EXPORT_FORMATS.keys()), horizontal=True, key="scr_fmt")
+        ext, mime = EXPORT_FORMATS[export_fmt]
+        # 只在用户请求时写报告 (直接写入临时文件，不在内存中构建整个工作簿)，上一次的临时文件随即删除
+        if st.button(f"📄 生成报告 ({export_fmt})", use_container_width=True):
+            try:
+                report_path = new_temp_path(ext)
+                if ext == ".xlsx":
+                    write_screening_report(report_path, df_hits, df_summary, plate_groups_for_excel)
+                else:
+                    write_screening_bundle(report_path, {
+                        "pick_list": df_hits, "summary": df_summary, "all_wells": df_final
+                    }, fmt="parquet" if "Parquet" in export_fmt else "csv")
+                _replace_report_file(report_path)
+                st.session_state['scr_report_fmt'] = export_fmt
+            except Exception as e:
+                st.error(f"导出失败: {e}")
+
+        report_path = st.session_state.get('scr_report_path')
+        if report_path and st.session_state.get('scr_report_fmt') == export_fmt and os.path.exists(report_path):
+            with open(report_path, "rb") as fh:
+                st.download_button(f"📥 下载筛选报告 ({export_fmt})", fh, f"Screen_{project_id}{ext}", mime,
                                    type="secondary", use_container_width=True)
 
-            with c2:
-                if st.button("☁️ 保存至 PocketBase", type="primary", use_container_width=True):
-                    if uploaded_files:
-                        uploaded_files[0].seek(0)
-                        res_json = {"summary": summary_stats, "top_hits": df_hits.head(50).to_dict(orient="records")}
-                        success, msg = save_experiment_record(project_id, researcher, uploaded_files[0], res_json)
-                        if success:
-                            st.success("已保存!")
-                        else:
-                            st.error(msg)
\ No newline at end of file
+    with c2:
+        if st.button("☁️ 保存至 PocketBase", type="primary", use_container_width=True):
+            if uploaded_files:
+                uploaded_files[0].seek(0)
+                res_json = {"summary": summary_stats, "top_hits": df_hits.head(50).to_dict(orient="records")}
+                success, msg = save_experiment_record(project_id, researcher, uploaded_files[0], res_json)
+                if success:
+                    st.success("已保存!")
+                else:
+                    st.error(msg)
\ No newline at end of file
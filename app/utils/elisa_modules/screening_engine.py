@@ -0,0 +1,240 @@
+import math
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 板型常量
+# ==========================================
+ROWS_96 = list('ABCDEFGH')
+COLS_96 = list(range(1, 13))
+ROWS_384 = list('ABCDEFGHIJKLMNOP')
+
+# 384 -> 96 象限映射 (行偏移, 列偏移)，与 show_384_guide_component 的图示一致
+QUADRANTS = {"Q1": (0, 0), "Q2": (0, 1), "Q3": (1, 0), "Q4": (1, 1)}
+
+CUTOFF_METHODS = ("fixed", "neg", "background", "robust")
+MAD_SCALE = 1.4826  # MAD -> SD (正态分布一致性系数)
+
+
+# ==========================================
+# 1. 读取 & 堆叠
+# ==========================================
+def read_plate_array(file_obj, n_rows=8, n_cols=12):
+    """
+    读取酶标仪 Excel 左上角 n_rows x n_cols 矩阵，返回 float 数组
+    非数字单元格按 0 处理；尺寸不足返回 None
+    """
+    df_raw = pd.read_excel(file_obj, header=None)
+    block = df_raw.iloc[0:n_rows, 0:n_cols]
+    if block.shape != (n_rows, n_cols):
+        return None
+    return block.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+
+
+def split_384(arr_384):
+    """(16, 24) -> (4, 8, 12)，顺序为 Q1..Q4"""
+    return np.stack([arr_384[dr::2, dc::2] for dr, dc in QUADRANTS.values()])
+
+
+def build_plate_stack(named_arrays, is_384=False):
+    """
+    named_arrays: [(文件名, 原始矩阵), ...]
+    返回 (stack, meta)
+        stack: (板数, 8, 12) 的 OD 数组
+        meta : 每块(虚拟)板一行，列为 File / Quadrant / Plate
+    """
+    blocks, meta = [], []
+    for fname, arr in named_arrays:
+        if is_384:
+            blocks.append(split_384(arr))
+            meta.extend({"File": fname, "Quadrant": q, "Plate": f"{fname}_{q}"} for q in QUADRANTS)
+        else:
+            blocks.append(arr[np.newaxis])
+            meta.append({"File": fname, "Quadrant": "96_Plate", "Plate": fname})
+
+    if not blocks:
+        return np.empty((0, 8, 12)), pd.DataFrame(columns=["File", "Quadrant", "Plate"])
+    return np.concatenate(blocks, axis=0), pd.DataFrame(meta)
+
+
+def parse_wells(text):
+    """
+    "H12" 或 "H11, H12" -> [(7, 11), (7, 10)] (0 基坐标)
+    格式错误抛出 ValueError
+    """
+    wells = []
+    for token in re.split(r'[\s,，;；]+', text.strip()):
+        if not token:
+            continue
+        m = re.fullmatch(r'([A-Ha-h])(\d{1,2})', token)
+        if not m or not 1 <= int(m.group(2)) <= 12:
+            raise ValueError(f"无效孔位: {token}")
+        wells.append((ROWS_96.index(m.group(1).upper()), int(m.group(2)) - 1))
+    if not wells:
+        raise ValueError("未指定孔位")
+    return wells
+
+
+# ==========================================
+# 2. Cutoff (整批一次计算，返回每块板一个值)
+# ==========================================
+def robust_center_scale(flat):
+    """按板计算中位数与 MAD (已换算为 SD 尺度)，flat 为 (板数, 孔数)"""
+    med = np.nanmedian(flat, axis=1)
+    mad = MAD_SCALE * np.nanmedian(np.abs(flat - med[:, None]), axis=1)
+    return med, mad
+
+
+def compute_cutoffs(stack, method, manual_cutoff=0.5, neg_wells=None, k=3.0, bg_fraction=0.1, floor=0.2):
+    """
+    method:
+        fixed      - 固定 OD
+        neg        - 阴性对照孔：单孔沿用 (>0.1 时 x3，否则 +0.2)；多孔取 mean + k·SD
+        background - 板内最低 bg_fraction 的孔作为背景，mean + k·SD (不低于 floor)
+        robust     - 中位数 + k·MAD (稳健 Z-score >= k，不低于 floor)
+    """
+    n_plates = stack.shape[0]
+    flat = stack.reshape(n_plates, -1)
+
+    if method == "fixed":
+        return np.full(n_plates, float(manual_cutoff))
+
+    if method == "neg":
+        rows, cols = zip(*neg_wells)
+        neg = stack[:, list(rows), list(cols)]
+        if neg.shape[1] == 1:
+            v = neg[:, 0]
+            return np.where(v > 0.1, v * 3.0, v + 0.2)
+        return neg.mean(axis=1) + k * neg.std(axis=1, ddof=1)
+
+    if method == "background":
+        n_bg = max(1, math.ceil(flat.shape[1] * bg_fraction))
+        bg = np.partition(flat, n_bg - 1, axis=1)[:, :n_bg]
+        return np.maximum(bg.mean(axis=1) + k * bg.std(axis=1), floor)
+
+    if method == "robust":
+        med, mad = robust_center_scale(flat)
+        return np.maximum(med + k * mad, floor)
+
+    raise ValueError(f"未知 Cutoff 策略: {method}")
+
+
+# ==========================================
+# 3. 判定 & 排名 (一次向量化)
+# ==========================================
+def call_hits(stack, cutoffs, meta, scores=None, exclude=None):
+    """
+    返回长表，每孔一行：
+    Plate / Well / Row / Col / OD / Source / Cutoff / Robust Z / Result / Plate Rank / Rank
+    Plate Rank: 板内降序名次；Rank: 全部阳性孔降序名次 (阴性为 NaN)
+    scores: 归一化得分 (与 stack 同形)，给定时按得分判定与排名，并额外输出 Score 列
+    exclude: 8x12 布尔掩码 (对照孔)，这些孔不判为阳性
+    """
+    n_plates = stack.shape[0]
+    n_wells = stack.shape[1] * stack.shape[2]
+    flat = (stack if scores is None else scores).reshape(n_plates, n_wells)
+
+    # 命中 (对照孔除外)
+    hit = flat >= cutoffs[:, None]
+    if exclude is not None:
+        hit &= ~np.asarray(exclude, dtype=bool).reshape(1, n_wells)
+
+    # 稳健 Z-score
+    med, mad = robust_center_scale(flat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (flat - med[:, None]) / mad[:, None]
+
+    # 板内名次
+    order = np.argsort(-flat, axis=1, kind='stable')
+    plate_rank = np.empty_like(order)
+    np.put_along_axis(plate_rank, order, np.arange(1, n_wells + 1)[None, :], axis=1)
+
+    # 全局阳性名次
+    val_flat = flat.ravel()
+    hit_flat = hit.ravel()
+    rank = np.full(val_flat.shape, np.nan)
+    hit_idx = np.flatnonzero(hit_flat)
+    rank[hit_idx[np.argsort(-val_flat[hit_idx], kind='stable')]] = np.arange(1, hit_idx.size + 1)
+
+    # 坐标
+    r_idx = np.repeat(np.arange(8), 12)
+    c_idx = np.tile(np.arange(12), 8)
+    rows = np.array(ROWS_96)[r_idx]
+    cols = c_idx + 1
+    wells = np.char.add(rows, cols.astype(str))
+
+    # 384 源孔位
+    quads = meta['Quadrant'].to_numpy()
+    offsets = np.array([QUADRANTS.get(q, (0, 0)) for q in quads])
+    r_384 = 2 * r_idx[None, :] + offsets[:, [0]]
+    c_384 = 2 * c_idx[None, :] + offsets[:, [1]]
+    src_384 = np.char.add(np.char.add("384-", np.array(ROWS_384)[r_384]), (c_384 + 1).astype(str))
+    source = np.where((quads == "96_Plate")[:, None], "Direct", src_384)
+
+    df_long = pd.DataFrame({
+        "Plate": np.repeat(meta['Plate'].to_numpy(), n_wells),
+        "Well": np.tile(wells, n_plates),
+        "Row": np.tile(rows, n_plates),
+        "Col": np.tile(cols, n_plates),
+        "OD": stack.reshape(-1),
+        "Source": source.ravel(),
+        "Cutoff": np.repeat(cutoffs, n_wells),
+        "Robust Z": z.ravel(),
+        "Result": pd.Categorical.from_codes(np.where(hit_flat, 0, 1).astype(np.int8),
+                                            categories=["Positive", "Negative"]),
+        "Plate Rank": plate_rank.ravel(),
+        "Rank": rank,
+    })
+    if scores is not None:
+        df_long.insert(df_long.columns.get_loc("OD") + 1, "Score", val_flat)
+    return df_long
+
+
+def plate_summary(meta, cutoffs, stack, exclude=None):
+    """每块板一行：Source File / Plate ID / Cutoff / Hits (exclude 掩码内的对照孔不计)"""
+    hit = stack.reshape(stack.shape[0], -1) >= cutoffs[:, None]
+    if exclude is not None:
+        hit &= ~np.asarray(exclude, dtype=bool).reshape(1, -1)
+    hits = hit.sum(axis=1)
+    return pd.DataFrame({
+        "Source File": meta['File'].to_numpy(),
+        "Plate ID": meta['Plate'].to_numpy(),
+        "Cutoff": cutoffs,
+        "Hits": hits,
+    })
+
+
+def plate_matrix(stack, i):
+    """取第 i 块板为 8x12 DataFrame (A-H / 1-12)"""
+    return pd.DataFrame(stack[i], index=ROWS_96, columns=COLS_96)
+
+
+# ==========================================
+# 4. 基准测试
+# ==========================================
+def benchmark_hit_calling(n_plates=200, is_384=True, seed=0):
+    """
+    模拟 n_plates 块 384 板 (或 96 板) 的整批判定耗时 (秒)，不含 Excel 读取
+    运行: python -m utils.elisa_modules.screening_engine
+    """
+    rng = np.random.default_rng(seed)
+    shape = (16, 24) if is_384 else (8, 12)
+    arrays = [(f"Plate{i:03d}", rng.gamma(2.0, 0.1, shape)) for i in range(n_plates)]
+
+    rows = []
+    for method in CUTOFF_METHODS:
+        t0 = time.perf_counter()
+        stack, meta = build_plate_stack(arrays, is_384=is_384)
+        cutoffs = compute_cutoffs(stack, method, neg_wells=[(7, 11)])
+        df_long = call_hits(stack, cutoffs, meta)
+        elapsed = time.perf_counter() - t0
+        rows.append({"Method": method, "Plates": stack.shape[0], "Wells": len(df_long),
+                     "Hits": int((df_long['Result'] == 'Positive').sum()), "Seconds": elapsed})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    print(benchmark_hit_calling().to_string(index=False))
@@ -0,0 +1,149 @@
+import io
+import os
+import re
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from utils.elisa_modules.screening_engine import ROWS_96, COLS_96
+
+# 384 田字格排布：象限 -> (起始行, 起始列)
+QUADRANT_POSITIONS = {
+    "Q1": (0, 0),
+    "Q2": (0, 14),
+    "Q3": (11, 0),
+    "Q4": (11, 14),
+}
+
+HIT_FORMAT = {'bg_color': '#FFC7CE', 'font_color': '#9C0006'}
+
+
+# ==========================================
+# 辅助函数
+# ==========================================
+def new_temp_path(suffix):
+    """在系统临时目录创建一个空文件并返回路径 (调用方负责删除)"""
+    fd, path = tempfile.mkstemp(prefix="screen_", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def _sheet_name(base, used):
+    """Excel Sheet 名：去掉非法字符，限制 31 字符，重名自动加序号"""
+    name = re.sub(r'[\[\]:*?/\\]', '_', str(base))[:30] or "Sheet"
+    candidate, n = name, 1
+    while candidate.lower() in used:
+        n += 1
+        suffix = f"~{n}"
+        candidate = name[:30 - len(suffix)] + suffix
+    used.add(candidate.lower())
+    return candidate
+
+
+def _clean_rows(df):
+    """DataFrame -> 行列表 (NaN 写为空单元格)"""
+    obj = df.astype(object)
+    return obj.where(pd.notna(obj), None).itertuples(index=False, name=None)
+
+
+def _write_table(wb, sheet_name, df):
+    ws = wb.add_worksheet(sheet_name)
+    ws.write_row(0, 0, [str(c) for c in df.columns])
+    for r, row in enumerate(_clean_rows(df), start=1):
+        ws.write_row(r, 0, row)
+    return ws
+
+
+def _matrix_rows(matrix):
+    """8x12 矩阵 -> [[行号, v1..v12], ...]，NaN 写为空"""
+    vals = np.asarray(matrix, dtype=float)
+    return [[label] + [None if np.isnan(v) else float(v) for v in vals[i]] for i, label in enumerate(ROWS_96)]
+
+
+def _highlight(ws, first_row, first_col, cutoff, fmt):
+    """对 8x12 数据区添加一条条件格式 (>= cutoff 红色)"""
+    if cutoff is None or not np.isfinite(cutoff):
+        return
+    ws.conditional_format(first_row, first_col, first_row + 7, first_col + 11,
+                          {'type': 'cell', 'criteria': '>=', 'value': float(cutoff), 'format': fmt})
+
+
+# ==========================================
+# 1. Excel 报告 (constant_memory 流式写入)
+# ==========================================
+def write_screening_report(path, df_hits, df_summary, plate_groups):
+    """
+    写出筛选报告到 path：
+        Pick_List / Summary + 每个源文件一个板图 Sheet (384 为田字格)
+    constant_memory 模式要求按行递增写入，因此同一行的 Q1/Q2 (Q3/Q4) 一起写
+    阳性高亮使用条件格式，每块板只需一条规则
+    """
+    wb = xlsxwriter.Workbook(path, {'constant_memory': True})
+    red_fmt = wb.add_format(HIT_FORMAT)
+    used = set()
+
+    # 1. 名单 & 统计
+    _write_table(wb, _sheet_name('Pick_List', used), df_hits)
+    _write_table(wb, _sheet_name('Summary', used), df_summary)
+
+    # 2. 板图 (按源文件分组，每个文件一个 Sheet)
+    for file_base, quadrants in plate_groups.items():
+        ws = wb.add_worksheet(_sheet_name(file_base, used))
+
+        if "96_Plate" in quadrants:
+            info = quadrants["96_Plate"]
+            ws.write(0, 0, f"Plate: {file_base} (Cutoff: {info['cutoff']:.3f})")
+            ws.write_row(1, 0, [""] + COLS_96)
+            for r_idx, row in enumerate(_matrix_rows(info['matrix'])):
+                ws.write_row(r_idx + 2, 0, row)
+            _highlight(ws, 2, 1, info['cutoff'], red_fmt)
+            continue
+
+        # 384 模式：上下两排象限，逐行写入
+        for top_row, pair in ((0, ("Q1", "Q2")), (11, ("Q3", "Q4"))):
+            present = [(q, QUADRANT_POSITIONS[q][1], quadrants[q]) for q in pair if q in quadrants]
+            for q, start_c, info in present:
+                ws.write(top_row, start_c, f"{q} (Cutoff: {info['cutoff']:.3f})")
+            for q, start_c, info in present:
+                ws.write_row(top_row + 1, start_c + 1, COLS_96)
+            rows = [(start_c, _matrix_rows(info['matrix'])) for q, start_c, info in present]
+            for r_idx in range(len(ROWS_96)):
+                for start_c, matrix_rows in rows:
+                    ws.write_row(top_row + 2 + r_idx, start_c, matrix_rows[r_idx])
+            for q, start_c, info in present:
+                _highlight(ws, top_row + 2, start_c + 1, info['cutoff'], red_fmt)
+
+    wb.close()
+    return path
+
+
+# ==========================================
+# 2. CSV / Parquet 压缩包
+# ==========================================
+def write_screening_bundle(path, tables, fmt="csv"):
+    """
+    tables: {"pick_list": df, "summary": df, "all_wells": df, ...}
+    fmt: csv / parquet (parquet 需要 pyarrow)
+    """
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("导出 Parquet 需要安装 pyarrow: pip install pyarrow")
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, df in tables.items():
+            if fmt == "parquet":
+                buf = io.BytesIO()
+                df.to_parquet(buf, index=False)
+                zf.writestr(f"{name}.parquet", buf.getvalue())
+            else:
+                with zf.open(f"{name}.csv", "w") as fh:
+                    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+                    df.to_csv(text, index=False)
+                    text.flush()
+                    text.detach()
+    return path
@@ -16,6 +16,7 @@ if root_dir not in sys.path:
 
 from db import save_experiment_record
 from utils.math_models import fit_4pl
+from utils.classification import classify_threshold, combine_flags, threshold_styles
 
 
 # ==========================================
@@ -77,18 +78,18 @@ def generate_report_excel(df_summary, df_details, fig_bytes, blank_val):
 # ==========================================
 # 辅助函数：布局预览样式
 # ==========================================
-def apply_plate_style(val):
-    if pd.isna(val) or str(val).strip() == "": return ""
-    val_str = str(val).upper()
-    if "BLANK" in val_str:
-        return 'background-color: #e2e3e5; color: #666666'
-    elif "NC" in val_str:
-        return 'background-color: #fff3cd; color: #856404'
-    elif "PC" in val_str:
-        return 'background-color: #f8d7da; color: #721c24'
-    elif "SAMPLE" in val_str:
-        return 'background-color: #d1e7dd; color: #0f5132'
-    return ""
+def apply_plate_style(df):
+    """整板一次生成样式表，配合 Styler.apply(axis=None) 使用"""
+    txt = df.fillna("").astype(str).apply(lambda col: col.str.upper())
+    css = np.select(
+        [txt.apply(lambda col: col.str.contains(k, regex=False)).to_numpy() for k in ["BLANK", "NC", "PC", "SAMPLE"]],
+        ['background-color: #e2e3e5; color: #666666',
+         'background-color: #fff3cd; color: #856404',
+         'background-color: #f8d7da; color: #721c24',
+         'background-color: #d1e7dd; color: #0f5132'],
+        default=""
+    )
+    return pd.DataFrame(css, index=df.index, columns=df.columns)
 
 
 # ==========================================
@@ -185,7 +186,7 @@ def show():
                 preview[r['Column']] = txt
 
             st.dataframe(
-                preview.style.applymap(apply_plate_style),
+                preview.style.apply(apply_plate_style, axis=None),
                 use_container_width=True, height=460
             )
             st.caption("图例: 🟩 Sample | 🟥 PC | 🟨 NC | ⬜ Blank")
@@ -231,11 +232,10 @@ def show():
                     cvs = np.nan_to_num((raw_stds / raw_means) * 100)
                 max_cv = np.max(cvs)
 
-                for r in range(8):
-                    details.append({
-                        "Sample": name, "Type": info['type'], "Conc": concs[r],
-                        "Net OD": means[r], "Raw OD": raw_means[r], "CV%": cvs[r]
-                    })
+                details.append(pd.DataFrame({
+                    "Sample": name, "Type": info['type'], "Conc": concs,
+                    "Net OD": means, "Raw OD": raw_means, "CV%": cvs
+                }))
 
                 # 拟合
                 if info['type'] == "NC":
@@ -244,24 +244,35 @@ def show():
                     fit_curves[name] = {"x": concs, "y": means, "y_err": stds, "type": "NC", "func": None}
                 else:
                     popt, r2, func = fit_4pl(concs, means)
-                    note = "Pass"
-                    if max_cv > cv_threshold: note = f"CV>{cv_threshold}%"
-                    if r2 < 0.95: note += "; Low R2"
 
                     if popt is not None:
+                        # Note 留空，循环结束后统一向量化生成 QC 标记
                         summary.append({
                             "Sample": name, "Type": info['type'], "EC50": popt[2], "R²": r2,
-                            "Max CV%": max_cv, "Top": popt[3], "Bottom": popt[0], "Note": note
+                            "Max CV%": max_cv, "Top": popt[3], "Bottom": popt[0], "Note": None
                         })
                         fit_curves[name] = {"x": concs, "y": means, "y_err": stds, "type": info['type'], "func": func}
                     else:
                         summary.append({"Sample": name, "Type": info['type'], "EC50": None, "R²": 0, "Max CV%": max_cv,
                                         "Note": "Fit Failed"})
 
+            # QC 标记 (向量化)：单孔 CV 判定 + 样品级 CV / R² 合并
+            df_sum = pd.DataFrame(summary)
+            df_det = pd.concat(details, ignore_index=True) if details else pd.DataFrame()
+            if not df_det.empty:
+                df_det['QC'] = classify_threshold(df_det['CV%'], cv_threshold, ("CV High", "Pass"), ">")
+            if not df_sum.empty:
+                pending = df_sum['Note'].isna()
+                flags = combine_flags([
+                    (df_sum['Max CV%'].to_numpy(dtype=float) > cv_threshold, f"CV>{cv_threshold}%"),
+                    (df_sum['R²'].to_numpy(dtype=float) < 0.95, "Low R2"),
+                ])
+                df_sum.loc[pending, 'Note'] = flags[pending.to_numpy()]
+
             # 保存状态
             st.session_state['titer_calc_done'] = True
-            st.session_state['titer_sum'] = pd.DataFrame(summary)
-            st.session_state['titer_det'] = pd.DataFrame(details)
+            st.session_state['titer_sum'] = df_sum
+            st.session_state['titer_det'] = df_det
             st.session_state['titer_blank'] = blank_val
             st.session_state['titer_curves'] = fit_curves
             st.session_state['titer_img_bytes'] = create_matplotlib_image(fit_curves, blank_val, conc_unit)
@@ -279,8 +290,8 @@ def show():
         # 结果表
         st.dataframe(
             st.session_state['titer_sum'].style.format({"EC50": "{:.4f}", "R²": "{:.4f}", "Max CV%": "{:.1f}"})
-            .applymap(lambda x: "color: red" if isinstance(x, (int, float)) and x > cv_threshold else "",
-                      subset=["Max CV%"]),
+            .apply(threshold_styles, axis=None, subset=["Max CV%"], cutoff=cv_threshold, hit_css="color: red",
+                   direction=">"),
             use_container_width=True
         )
 
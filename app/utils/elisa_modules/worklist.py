@@ -0,0 +1,219 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+# 目标板 / 枪头盒均为 96 孔 (8 x 12)，按列优先填充 (A1, B1 ... H1, A2 ...)
+DEST_ROWS, DEST_COLS = 8, 12
+
+WORKLIST_FORMATS = ("Generic CSV", "Tecan GWL", "Echo CSV")
+
+
+# ==========================================
+# 1. 孔位工具 (向量化)
+# ==========================================
+def split_wells(wells):
+    """"B17" -> (行 0 基, 列 0 基)，输入为序列，返回两个 int 数组"""
+    parts = pd.Series(wells, dtype=str).str.upper().str.extract(r'^([A-P])(\d{1,2})$')
+    rows = parts[0].map(lambda x: ord(x) - 65).to_numpy(dtype=int)
+    cols = parts[1].astype(int).to_numpy() - 1
+    return rows, cols
+
+
+def wells_from_index(idx, n_rows=DEST_ROWS):
+    """列优先序号 (0 基) -> 孔位名"""
+    idx = np.asarray(idx)
+    rows = np.array(list('ABCDEFGHIJKLMNOP'))[idx % n_rows]
+    return np.char.add(rows, (idx // n_rows + 1).astype(str))
+
+
+# ==========================================
+# 2. 源孔表
+# ==========================================
+def source_table(df_hits):
+    """
+    由挑克隆名单得到物理源板/源孔：
+    384 拆分模式 -> 原 384 板 (文件名) + Source 中的 384 孔位
+    96 模式      -> Plate + Well
+    """
+    src = df_hits['Source'].astype(str)
+    is_384 = src.str.startswith('384-').to_numpy()
+    plate = df_hits['Plate'].astype(str)
+    out = pd.DataFrame({
+        "Source Labware": np.where(is_384, plate.str.rsplit('_', n=1).str[0], plate),
+        "Source Well": np.where(is_384, src.str[4:], df_hits['Well'].astype(str)),
+        "Screen Plate": plate.to_numpy(),
+        "Screen Well": df_hits['Well'].astype(str).to_numpy(),
+        "OD": df_hits['OD'].to_numpy(),
+    })
+    return out.drop_duplicates(subset=["Source Labware", "Source Well"]).reset_index(drop=True)
+
+
+# ==========================================
+# 3. 生成 Worklist
+# ==========================================
+def build_worklist(df_hits, volume_ul=50.0, dest_prefix="Pick", reserved_wells=(), replicates=1, channels=1,
+                   clone_prefix=""):
+    """
+    返回 (worklist, dest_layout)
+    - 行走顺序：按源板出现顺序 -> 列 -> 行 (蛇形)，减少机械臂往返
+    - 目标板装箱：按行走顺序列优先连续填充，跳过 reserved_wells (对照孔等)
+    - 枪头：同一源孔的多个复本共用一个枪头 (一次吸液多次分配)；
+      channels > 1 时每 channels 个连续转移为一个循环，枪头按列优先从枪头盒取
+    """
+    src = source_table(df_hits)
+    if src.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    # 行走顺序 (蛇形：偶数列自上而下，奇数列自下而上)
+    plate_order = pd.Categorical(src["Source Labware"], categories=pd.unique(src["Source Labware"]))
+    r, c = split_wells(src["Source Well"])
+    snake_row = np.where(c % 2 == 0, r, -r)
+    order = np.lexsort((snake_row, c, plate_order.codes))
+    src = src.iloc[order].reset_index(drop=True)
+    n_src = len(src)
+
+    # 目标孔位 (跳过预留孔)
+    reserved = set()
+    if len(reserved_wells):
+        rr, rc = split_wells(list(reserved_wells))
+        reserved = set((rc * DEST_ROWS + rr).tolist())
+    free_slots = np.array([i for i in range(DEST_ROWS * DEST_COLS) if i not in reserved])
+    if free_slots.size == 0:
+        raise ValueError("目标板所有孔位均被预留")
+
+    n_total = n_src * replicates
+    k = np.arange(n_total)
+    src_idx = k % n_src                     # 复本按整板重复：Rep1 全部 -> Rep2 全部
+    rep_idx = k // n_src
+    plate_no = (src_idx // free_slots.size) + rep_idx * int(np.ceil(n_src / free_slots.size))
+    dest_wells = wells_from_index(free_slots[src_idx % free_slots.size])
+    dest_labware = np.char.add(f"{dest_prefix}_", np.char.zfill((plate_no + 1).astype(str), 2))
+
+    # 枪头：每个源孔一个枪头 (复本共用)，按源孔顺序编号
+    tip_no = src_idx
+    tips_per_rack = DEST_ROWS * DEST_COLS
+    cycle = src_idx // max(1, channels)
+
+    clone_ids = np.char.add(np.char.add(f"{clone_prefix}", src["Screen Plate"].to_numpy().astype(str)),
+                            np.char.add("-", src["Screen Well"].to_numpy().astype(str)))
+
+    wl = pd.DataFrame({
+        "Step": k + 1,
+        "Source Labware": src["Source Labware"].to_numpy()[src_idx],
+        "Source Well": src["Source Well"].to_numpy()[src_idx],
+        "Destination Labware": dest_labware,
+        "Destination Well": dest_wells,
+        "Volume (uL)": float(volume_ul),
+        "Replicate": rep_idx + 1,
+        "Tip": tip_no + 1,
+        "Tip Rack": tip_no // tips_per_rack + 1,
+        "Tip Well": wells_from_index(tip_no % tips_per_rack),
+        "Cycle": cycle + 1,
+        "Clone ID": clone_ids[src_idx],
+        "OD": src["OD"].to_numpy()[src_idx],
+    })
+    # 同一枪头的多次分配相邻执行
+    wl = wl.sort_values(["Tip", "Replicate"], kind="stable").reset_index(drop=True)
+    wl["Step"] = np.arange(1, len(wl) + 1)
+
+    layout = wl[["Destination Labware", "Destination Well", "Clone ID", "Source Labware", "Source Well",
+                 "Replicate", "OD", "Volume (uL)"]].copy()
+    return wl, layout
+
+
+def worklist_stats(wl, channels=1):
+    """转移数 / 枪头数 / 目标板数 / 移液循环数"""
+    if wl.empty:
+        return {"Transfers": 0, "Tips": 0, "Destination Plates": 0, "Cycles": 0}
+    return {
+        "Transfers": len(wl),
+        "Tips": int(wl["Tip"].nunique()),
+        "Destination Plates": int(wl["Destination Labware"].nunique()),
+        "Cycles": int(wl["Cycle"].nunique()) if channels > 1 else len(wl),
+    }
+
+
+# ==========================================
+# 4. 导出格式
+# ==========================================
+def _well_position(wells, n_rows):
+    """孔位 -> 列优先位置号 (1 基)，Tecan 使用"""
+    r, c = split_wells(wells)
+    return c * n_rows + r + 1
+
+
+def export_worklist(wl, fmt="Generic CSV", source_rows=16):
+    """
+    fmt:
+        Generic CSV - 通用列表 (大部分液体工作站可直接映射)
+        Tecan GWL   - EVOware A/D/W 指令 (位置号为列优先序号)
+        Echo CSV    - Labcyte Echo 风格列名，体积单位 nL
+    source_rows: 源板行数 (384 为 16，96 为 8)，仅 Tecan 位置号需要
+    """
+    if fmt == "Generic CSV":
+        cols = ["Step", "Source Labware", "Source Well", "Destination Labware", "Destination Well",
+                "Volume (uL)", "Tip", "Clone ID"]
+        return wl[cols].to_csv(index=False).encode("utf-8-sig")
+
+    if fmt == "Echo CSV":
+        df = pd.DataFrame({
+            "Source Plate Name": wl["Source Labware"],
+            "Source Well": wl["Source Well"],
+            "Destination Plate Name": wl["Destination Labware"],
+            "Destination Well": wl["Destination Well"],
+            "Transfer Volume": (wl["Volume (uL)"] * 1000).round().astype(int),
+            "Sample ID": wl["Clone ID"],
+        })
+        return df.to_csv(index=False).encode("utf-8-sig")
+
+    if fmt == "Tecan GWL":
+        src_pos = _well_position(wl["Source Well"], source_rows)
+        dst_pos = _well_position(wl["Destination Well"], DEST_ROWS)
+        # 同一枪头多次分配：一次吸取全部体积
+        asp_vol = wl.groupby("Tip")["Volume (uL)"].transform("sum").to_numpy()
+        vol = wl["Volume (uL)"].to_numpy()
+        src_lab, dst_lab = wl["Source Labware"].to_numpy(), wl["Destination Labware"].to_numpy()
+        tips = wl["Tip"].to_numpy()
+        new_tip = np.r_[True, tips[1:] != tips[:-1]]
+
+        lines = []
+        for i in range(len(wl)):
+            if new_tip[i]:
+                if i > 0:
+                    lines.append("W;")
+                lines.append(f"A;{src_lab[i]};;;{src_pos[i]};;{asp_vol[i]:g};")
+            lines.append(f"D;{dst_lab[i]};;;{dst_pos[i]};;{vol[i]:g};")
+        if lines:
+            lines.append("W;")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    raise ValueError(f"未知 Worklist 格式: {fmt}")
+
+
+# ==========================================
+# 5. 回写库存
+# ==========================================
+def layout_to_inventory(layout, project_name, rack_id="Rack-Pick", sample_type="Supernatant"):
+    """
+    目标板布局 -> 库存导入模板列 (rack_id / box_name / slot / sample_id / project_name / sample_type / vol_ul)
+    可直接在「库存管理 -> 批量导入」上传
+    """
+    return pd.DataFrame({
+        "rack_id": rack_id,
+        "box_name": layout["Destination Labware"].to_numpy(),
+        "slot": layout["Destination Well"].to_numpy(),
+        "sample_id": layout["Clone ID"].to_numpy(),
+        "project_name": project_name,
+        "sample_type": sample_type,
+        "conc_mgml": 0.0,
+        "vol_ul": layout["Volume (uL)"].to_numpy(),
+    })
+
+
+def inventory_excel(df_inv):
+    """库存导入 Excel (与 generate_excel_template 相同的 Sheet 结构)"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        df_inv.to_excel(writer, index=False, sheet_name='Inventory_Template')
+    return output.getvalue()
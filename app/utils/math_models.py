@@ -116,4 +116,17 @@ def fit_4pl(x_data, y_data):
 
     except Exception as e:
         # 拟合失败
-        return None, 0, None
\ No newline at end of file
+        return None, 0, None
+
+
+# --- 4PL 反算 (已知信号求浓度) ---
+def inverse_four_pl(y, A, B, C, D):
+    """
+    4PL 反函数: x = C * ((A - D) / (y - D) - 1) ** (1 / B)
+    y 不在 (A, D) 之间 (超出平台) 时无解，返回 NaN；支持数组输入
+    """
+    y = np.asarray(y, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = (A - D) / (y - D) - 1
+        x = C * np.power(np.where(ratio > 0, ratio, np.nan), 1.0 / B)
+    return x if x.ndim else float(x)
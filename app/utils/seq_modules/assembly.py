@@ -0,0 +1,277 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from Bio.Align import PairwiseAligner
+from Bio.Seq import Seq
+
+# ==========================================
+# 0. 常量
+# ==========================================
+FWD_TAGS = ("F", "FWD", "FOR", "FORWARD", "M13F", "T7")
+REV_TAGS = ("R", "REV", "REVERSE", "M13R", "T7TERM", "SP6")
+MIN_OVERLAP = 20            # 正反向重叠少于该长度不拼接
+SEED_K = 12                 # 定位重叠区用的 k-mer 长度
+SEED_MARGIN = 30            # 重叠区两侧额外比对的碱基数 (容纳插入 / 缺失)
+MIN_IDENTITY = 80.0         # 重叠区一致性 (%) 低于该值不拼接
+QUAL_DELTA = 10             # 冲突位点两条读段质量差 >= 该值时取高质量碱基，否则记为简并碱基
+QUAL_MAX = 60               # 一致位点质量相加后的上限
+PARALLEL_MIN = 64           # 少于该数量的克隆不启用多进程
+
+_COMPLEMENT = str.maketrans("ACGTRYSWKMBDHVNacgtryswkmbdhvn-", "TGCAYRSWMKVHDBNtgcayrswmkvhdbn-")
+_IUPAC = {frozenset("AG"): "R", frozenset("CT"): "Y", frozenset("GC"): "S", frozenset("AT"): "W",
+          frozenset("GT"): "K", frozenset("AC"): "M"}
+
+
+# ==========================================
+# 1. 读段配对
+# ==========================================
+def reverse_complement(seq):
+    """反向互补 (支持 IUPAC 简并碱基)"""
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def read_direction(name, fwd_tags=FWD_TAGS, rev_tags=REV_TAGS):
+    """
+    文件名 -> (克隆名, 'F' / 'R' / None)
+    去掉扩展名后，按 '_' '-' '.' 或空格分隔的最后一段识别方向，例如 Clone1_VH_F.ab1 -> ('Clone1_VH', 'F')
+    """
+    stem = re.sub(r"\.(ab1|abi|scf|seq|fasta|fa)$", "", os.path.basename(name), flags=re.I)
+    for tags, direction in ((fwd_tags, "F"), (rev_tags, "R")):
+        for tag in sorted(tags, key=len, reverse=True):
+            m = re.match(rf"^(.+?)[_\-. ]{re.escape(tag)}$", stem, flags=re.I)
+            if m:
+                return m.group(1), direction
+    return stem, None
+
+
+def pair_reads(results, fwd_tags=FWD_TAGS, rev_tags=REV_TAGS):
+    """
+    traces.process_batch 的结果 -> {克隆名: {'F': [读段], 'R': [读段]}}，顺序与上传顺序一致
+    无法识别方向的文件按正向处理；修剪后为空的读段丢弃
+    """
+    groups = {}
+    for rec in results:
+        if not rec.get("trimmed"):
+            continue
+        clone, direction = read_direction(rec["name"], fwd_tags, rev_tags)
+        start, end = rec["trim"]
+        read = {"name": rec["name"], "seq": rec["trimmed"], "qual": np.asarray(rec["qual"][start:end], dtype=np.int16)}
+        groups.setdefault(clone, {"F": [], "R": []})[direction or "F"].append(read)
+    return groups
+
+
+# ==========================================
+# 2. 重叠比对 + 质量加权一致序列
+# ==========================================
+@lru_cache(maxsize=1)
+def _overlap_aligner():
+    """全局比对但末端缺口不罚分，即只比对重叠区"""
+    return PairwiseAligner(mode="global", match_score=2.0, mismatch_score=-3.0, open_gap_score=-6.0,
+                           extend_gap_score=-2.0, end_gap_score=0.0)
+
+
+def _overlap_window(f_seq, r_seq, k=SEED_K):
+    """
+    k-mer 种子投票确定正反向读段的错位 (对角线)，返回重叠窗口 (f 起点, r 终点)；找不到种子时返回 None
+    只比对窗口内的序列，代替对两条全长读段做动态规划
+    """
+    index = {}
+    for j in range(len(r_seq) - k + 1):
+        index.setdefault(r_seq[j:j + k], j)
+    diag = [i - index[f_seq[i:i + k]] for i in range(len(f_seq) - k + 1) if f_seq[i:i + k] in index]
+    if not diag:
+        return None
+    diag = np.asarray(diag)
+    d = int(np.bincount(diag - diag.min()).argmax() + diag.min())
+    return max(0, d - SEED_MARGIN), min(len(r_seq), len(f_seq) - d + SEED_MARGIN)
+
+
+def overlap_indices(f_seq, r_seq):
+    """
+    正向读段与 (已反向互补的) 反向读段的列索引 (2 x 列数，缺口为 -1)
+    窗口外: 前段只有正向读段，后段只有反向读段
+    """
+    aligner = _overlap_aligner()
+    window = _overlap_window(f_seq, r_seq)
+    if window is None:
+        return aligner.align(f_seq, r_seq)[0].indices
+    f0, r1 = window
+    fi, ri = aligner.align(f_seq[f0:], r_seq[:r1])[0].indices
+    head = np.arange(f0)
+    tail = np.arange(r1, len(r_seq))
+    return np.vstack([np.r_[head, np.where(fi >= 0, fi + f0, -1), np.full(tail.size, -1)],
+                      np.r_[np.full(head.size, -1), ri, tail]])
+
+
+def _fill_prev(idx):
+    """缺口列向前填充为同一读段中最近的碱基下标 (用于估计缺口处的质量)"""
+    filled = np.maximum.accumulate(np.where(idx >= 0, idx, -1))
+    return np.where(filled >= 0, filled, 0)
+
+
+def merge_reads(fwd, rev, delta=QUAL_DELTA):
+    """
+    fwd / rev: {'name', 'seq', 'qual'}，rev 为原始反向读段 (函数内反向互补)
+    返回 (拼接结果, 重叠长度, 重叠区一致性 %)；重叠不可靠时拼接结果为 None
+    拼接结果 dict: contig / qual / conflicts (冲突及缺口位点 DataFrame，Position 为拼接序列上的 1 基位置，被删除的为 0)
+    冲突处理 (逐列向量化):
+      - 两边碱基相同: 取该碱基，质量相加 (上限 QUAL_MAX)
+      - 碱基不同: 质量差 >= delta 取高质量一方，否则记为 IUPAC 简并码
+      - 一边为缺口: 碱基质量不低于缺口一侧相邻碱基质量时保留，否则删除
+    """
+    r_seq = reverse_complement(rev["seq"])
+    r_qual = np.asarray(rev["qual"], dtype=np.int16)[::-1]
+    f_seq, f_qual = fwd["seq"], np.asarray(fwd["qual"], dtype=np.int16)
+
+    fi, ri = overlap_indices(f_seq, r_seq)
+    both = (fi >= 0) & (ri >= 0)
+    fb = np.frombuffer(f_seq.encode(), dtype="S1")
+    rb = np.frombuffer(r_seq.encode(), dtype="S1")
+    same = both & (fb[np.where(fi >= 0, fi, 0)] == rb[np.where(ri >= 0, ri, 0)])
+    overlap = int(both.sum())
+    identity = 100.0 * same.sum() / overlap if overlap else 0.0
+    if overlap < MIN_OVERLAP or identity < MIN_IDENTITY:
+        return None, overlap, identity
+
+    # 重叠区 = 第一个到最后一个双方都有碱基的列；区外只有一条读段覆盖
+    cols = np.flatnonzero(both)
+    inside = np.zeros(fi.size, dtype=bool)
+    inside[cols[0]:cols[-1] + 1] = True
+
+    # 缺口列的质量取该读段缺口前一个碱基的质量
+    fq = f_qual[_fill_prev(fi)]
+    rq = r_qual[_fill_prev(ri)]
+    fbase = np.where(fi >= 0, fb[np.where(fi >= 0, fi, 0)], b"-")
+    rbase = np.where(ri >= 0, rb[np.where(ri >= 0, ri, 0)], b"-")
+
+    call = np.where(fi >= 0, fbase, rbase)
+    qual = np.where(fi >= 0, fq, rq).astype(np.int16)
+    keep = np.ones(fi.size, dtype=bool)
+
+    qual[same] = np.minimum(fq[same] + rq[same], QUAL_MAX)
+    diff = both & ~same
+    call[diff] = np.where(rq[diff] > fq[diff], rbase[diff], fbase[diff])
+    qual[diff] = np.abs(fq[diff] - rq[diff])
+    ambiguous = np.flatnonzero(diff & (np.abs(fq.astype(int) - rq) < delta))
+    for i in ambiguous:
+        call[i] = _IUPAC.get(frozenset((fbase[i].decode(), rbase[i].decode())), "N").encode()
+
+    f_gap = inside & (fi < 0)
+    r_gap = inside & (ri < 0)
+    keep[f_gap] = rq[f_gap] >= fq[f_gap]
+    keep[r_gap] = fq[r_gap] >= rq[r_gap]
+
+    contig = b"".join(call[keep]).decode()
+    pos = np.cumsum(keep)
+    flagged = np.flatnonzero(diff | f_gap | r_gap)
+    conflicts = pd.DataFrame({
+        "Position": np.where(keep[flagged], pos[flagged], 0),
+        "F Base": [b.decode() for b in fbase[flagged]], "F Q": np.where(fi[flagged] >= 0, fq[flagged], 0),
+        "R Base": [b.decode() for b in rbase[flagged]], "R Q": np.where(ri[flagged] >= 0, rq[flagged], 0),
+        "Call": [c.decode() if k else "-" for c, k in zip(call[flagged], keep[flagged])],
+    })
+    return {"contig": contig, "qual": qual[keep], "conflicts": conflicts}, overlap, identity
+
+
+def assemble_clone(clone, reads, delta=QUAL_DELTA):
+    """
+    单个克隆: 取每个方向最长的读段进行拼接；只有单向读段时直接输出 (反向读段先反向互补)
+    """
+    fwd = max(reads["F"], key=lambda r: len(r["seq"]), default=None)
+    rev = max(reads["R"], key=lambda r: len(r["seq"]), default=None)
+    out = {"clone": clone, "reads": [r["name"] for r in reads["F"] + reads["R"]], "overlap": 0, "identity": 0.0,
+           "conflicts": pd.DataFrame(columns=["Position", "F Base", "F Q", "R Base", "R Q", "Call"])}
+    if fwd is not None and rev is not None:
+        merged, overlap, identity = merge_reads(fwd, rev, delta)
+        out.update(overlap=overlap, identity=identity)
+        if merged is not None:
+            out.update(merged, status="Assembled")
+            return out
+        # 没有可靠重叠时保留较长的一条
+        fwd, rev = (fwd, None) if len(fwd["seq"]) >= len(rev["seq"]) else (None, rev)
+        out["status"] = "No Overlap"
+    else:
+        out["status"] = "Single Read"
+    if fwd is not None:
+        out.update(contig=fwd["seq"], qual=np.asarray(fwd["qual"], dtype=np.int16))
+    else:
+        out.update(contig=reverse_complement(rev["seq"]), qual=np.asarray(rev["qual"], dtype=np.int16)[::-1])
+    return out
+
+
+def contig_summary(res):
+    q = res["qual"]
+    return {"Clone": res["clone"], "Reads": len(res["reads"]), "Contig Length": len(res["contig"]),
+            "Overlap": res["overlap"], "Identity (%)": round(res["identity"], 2),
+            "Conflicts": len(res["conflicts"]), "Mean Q": float(q.mean()) if q.size else 0.0,
+            "Status": res["status"]}
+
+
+# ==========================================
+# 3. 整板拼接 (进程池)
+# ==========================================
+def _assemble_chunk(args):
+    items, delta = args
+    return [assemble_clone(c, r, delta) for c, r in items]
+
+
+def assemble_plate(results, fwd_tags=FWD_TAGS, rev_tags=REV_TAGS, delta=QUAL_DELTA, n_jobs=None):
+    """
+    traces.process_batch 的结果 -> (拼接结果列表, 汇总 DataFrame)
+    只把修剪后的序列和质量传给子进程，峰图数据不参与序列化
+    """
+    items = list(pair_reads(results, fwd_tags, rev_tags).items())
+    n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+    if n_jobs == 1 or len(items) < PARALLEL_MIN:
+        contigs = _assemble_chunk((items, delta))
+    else:
+        size = max(1, -(-len(items) // (n_jobs * 4)))
+        with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+            contigs = [c for part in ex.map(_assemble_chunk, [(items[i:i + size], delta)
+                                                               for i in range(0, len(items), size)]) for c in part]
+    columns = ["Clone", "Reads", "Contig Length", "Overlap", "Identity (%)", "Conflicts", "Mean Q", "Status"]
+    return contigs, pd.DataFrame([contig_summary(c) for c in contigs], columns=columns)
+
+
+def contig_fasta(contigs):
+    return "".join(f">{c['clone']}\n{c['contig']}\n" for c in contigs if c["contig"])
+
+
+def translate_contig(dna, table=1):
+    """在 3 个正向读码框中取终止密码子最少的一个翻译 (拼接结果已按正向定向)"""
+    best = ""
+    for frame in range(3):
+        sub = dna[frame:]
+        sub = sub[:len(sub) - len(sub) % 3]
+        protein = str(Seq(sub).translate(table=table)) if sub else ""
+        if not best or protein.count("*") < best.count("*"):
+            best = protein
+    return best
+
+
+# ==========================================
+# 4. 基准测试
+# ==========================================
+def benchmark_plate(n_clones=48, length=800, overlap=300, seed=0):
+    """模拟 96 孔板 (每克隆正反各一条) 的拼接耗时；运行: python -m utils.seq_modules.assembly"""
+    rng = np.random.default_rng(seed)
+    results = []
+    for i in range(n_clones):
+        insert = "".join(rng.choice(list("ACGT"), 2 * length - overlap))
+        qual = rng.integers(20, 60, length).astype(np.int16)
+        for direction, seq in (("F", insert[:length]), ("R", reverse_complement(insert[-length:]))):
+            results.append({"name": f"Clone{i + 1}_{direction}.ab1", "trimmed": seq, "qual": qual,
+                            "trim": (0, length)})
+    t0 = time.perf_counter()
+    _, df = assemble_plate(results, n_jobs=1)
+    return pd.DataFrame([{"Clones": n_clones, "Reads": len(results), "Assembled": int((df["Status"] == "Assembled").sum()),
+                          "Time (s)": time.perf_counter() - t0}])
+
+
+if __name__ == "__main__":
+    print(benchmark_plate().to_string(index=False))
@@ -0,0 +1,338 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from Bio import SeqIO
+from Bio.Align import PairwiseAligner, substitution_matrices
+from Bio.Seq import Seq
+
+# ==========================================
+# 0. 常量
+# ==========================================
+# 突变矩阵编码 (克隆 x 参考氨基酸位点)
+MUT_CODES = {"Uncovered": -1, "Same": 0, "Silent": 1, "Missense": 2, "Nonsense": 3, "Deletion": 4, "Insertion": 5}
+MUT_SYMBOLS = {-1: " ", 0: ".", 1: "S", 2: "M", 3: "*", 4: "D", 5: "I"}
+MUT_COLORS = {-1: "#ffffff", 0: "#f0f0f0", 1: "#5bc0de", 2: "#d9534f", 3: "#000000", 4: "#f0ad4e", 5: "#8e44ad"}
+
+PARALLEL_MIN = 50           # 少于该数量的克隆不启用多进程
+BASES = frozenset("ACGT")   # 确定碱基；N 等简并碱基不计入错配
+_BLOSUM62 = substitution_matrices.load("BLOSUM62")
+
+
+# ==========================================
+# 1. 输入
+# ==========================================
+def clean_dna(seq):
+    return "".join(str(seq).split()).upper().replace("U", "T")
+
+
+def read_clones(file_obj):
+    """
+    FASTA / Excel / CSV -> (names, seqs)
+    表格取第一列为名称，列名含 Seq / DNA 的列为序列
+    """
+    name = file_obj.name.lower()
+    if name.endswith((".fasta", ".fa", ".fas", ".txt")):
+        recs = list(SeqIO.parse(io.StringIO(file_obj.getvalue().decode("utf-8")), "fasta"))
+        return [r.id for r in recs], [clean_dna(r.seq) for r in recs]
+
+    df = pd.read_excel(file_obj) if name.endswith("xlsx") else pd.read_csv(file_obj)
+    col = next((c for c in df.columns if "seq" in str(c).lower() or "dna" in str(c).lower()), None)
+    if col is None:
+        raise ValueError("未找到包含 'Seq' 或 'DNA' 的列")
+    df = df.dropna(subset=[col])
+    return df.iloc[:, 0].astype(str).tolist(), [clean_dna(s) for s in df[col]]
+
+
+# ==========================================
+# 2. 密码子感知比对
+# ==========================================
+def _protein_aligner():
+    """蛋白全局比对 (BLOSUM62)，两端悬挂不罚分 (克隆可以比参考长或短)"""
+    return PairwiseAligner(mode="global", substitution_matrix=_BLOSUM62,
+                           open_gap_score=-10.0, extend_gap_score=-1.0, end_gap_score=0.0)
+
+
+def _translate(dna):
+    dna = dna[:len(dna) - len(dna) % 3]
+    return str(Seq(dna).translate()) if dna else ""
+
+
+def _nt_mismatch(rc, cc):
+    """两个密码子的确定碱基错配数 (克隆中的 N 等简并碱基不计)"""
+    return sum(a != b for a, b in zip(rc, cc) if b in BASES)
+
+
+def _shift_indels(ref_idx, clone_idx, ref, clone, frame, ref_aa, clone_aa):
+    """
+    插入 / 缺失在蛋白水平常有多个等价位置 (如 GG 中插入一个 G)，比对器任选其一会把错配的密码子
+    配对，造成假的同义 / 错义突变；在所有等价位置中取核酸错配最少者，平局取最左 (左对齐)
+    """
+    r, c = ref_idx.copy(), clone_idx.copy()
+    n = len(r)
+
+    def cost(lo, hi):
+        return sum(_nt_mismatch(ref[3 * r[k]:3 * r[k] + 3], clone[frame + 3 * c[k]:frame + 3 * c[k] + 3])
+                   for k in range(lo, hi) if r[k] >= 0 and c[k] >= 0)
+
+    col = 0
+    while col < n:
+        if r[col] >= 0 and c[col] >= 0:
+            col += 1
+            continue
+        # gap: 含缺口的一侧；other: 连续的另一侧；seq: other 侧的氨基酸序列
+        gap, other, seq = (r, c, clone_aa) if r[col] < 0 else (c, r, ref_aa)
+        s = col
+        while col < n and gap[col] < 0 and other[col] >= 0:
+            col += 1
+        e = col
+        matched = lambda k: 0 <= k < n and r[k] >= 0 and c[k] >= 0
+        if e == s or not matched(s - 1) or not matched(e):
+            col = max(col, s + 1)
+            continue
+        # 先左移到底，再逐个右移，记录每个等价位置的错配数
+        while matched(s - 1) and seq[other[s - 1]] == seq[other[e - 1]]:
+            gap[e - 1], gap[s - 1] = gap[s - 1], -1
+            s, e = s - 1, e - 1
+        lo = s - 1
+        states = [(s, e)]
+        while matched(e) and seq[other[s]] == seq[other[e]]:
+            gap[s], gap[e] = gap[e], -1
+            s, e = s + 1, e + 1
+            states.append((s, e))
+        hi = e + 1
+        if len(states) > 1:
+            best, best_cost = states[-1], cost(lo, hi)
+            while len(states) > 1:
+                gap[e - 1], gap[s - 1] = gap[s - 1], -1
+                s, e = s - 1, e - 1
+                states.pop()
+                cur = cost(lo, hi)
+                if cur <= best_cost:
+                    best, best_cost = (s, e), cur
+            while (s, e) != best:
+                gap[s], gap[e] = gap[e], -1
+                s, e = s + 1, e + 1
+        col = e
+    return r, c
+
+
+def codon_align(ref, clone, aligner=None):
+    """
+    参考 (读码框 0) 与克隆的密码子感知比对：
+    先在克隆的 3 个读码框中选与参考蛋白得分最高者，按蛋白比对结果把核酸以密码子为单位对齐
+    等价的插入 / 缺失位置按核酸错配最少、再左对齐的规则确定
+    返回 dict:
+        frame / ref_idx / clone_idx (每个比对列的参考、克隆氨基酸序号，缺口为 -1) / ref_aa / clone_aa
+    """
+    aligner = aligner or _protein_aligner()
+    ref_aa = _translate(ref)
+    best = None
+    for f in range(3):
+        aa = _translate(clone[f:])
+        if not aa or not ref_aa:
+            continue
+        score = aligner.score(ref_aa, aa)
+        if best is None or score > best[0]:
+            best = (score, f, aa)
+    if best is None:
+        return None
+    score, frame, clone_aa = best
+    aln = aligner.align(ref_aa, clone_aa)[0]
+    ref_idx, clone_idx = _shift_indels(aln.indices[0], aln.indices[1], ref, clone, frame, ref_aa, clone_aa)
+    return {"frame": frame, "score": score, "ref_idx": ref_idx, "clone_idx": clone_idx,
+            "ref_aa": ref_aa, "clone_aa": clone_aa}
+
+
+def aligned_strings(ref, clone, ca):
+    """
+    把密码子比对展开为等长的核酸/氨基酸比对字符串 (缺口为 "---" / "-")
+    供渲染器使用：返回 (ref_nt, clone_nt, ref_aa, clone_aa)
+    """
+    frame = ca["frame"]
+    r_nt, c_nt, r_aa, c_aa = [], [], [], []
+    for i, j in zip(ca["ref_idx"], ca["clone_idx"]):
+        r_nt.append(ref[3 * i:3 * i + 3] if i >= 0 else "---")
+        c_nt.append(clone[frame + 3 * j:frame + 3 * j + 3] if j >= 0 else "---")
+        r_aa.append(ca["ref_aa"][i] if i >= 0 else "-")
+        c_aa.append(ca["clone_aa"][j] if j >= 0 else "-")
+    return "".join(r_nt), "".join(c_nt), "".join(r_aa), "".join(c_aa)
+
+
+def classify_clone(ref, clone, name="", aligner=None):
+    """
+    单个克隆 -> dict:
+        summary   : 汇总 (读码框 / 覆盖 / 一致度 / 各类突变数 / 简并密码子数)
+        codes     : int8 数组 (长度 = 参考氨基酸数)，编码见 MUT_CODES
+    含简并碱基、翻译为 X 的密码子记为 Ambiguous：位点按未覆盖处理，不计入突变和一致度
+        mutations : 突变明细列表
+    """
+    n_ref = len(ref) // 3
+    codes = np.full(n_ref, MUT_CODES["Uncovered"], dtype=np.int8)
+    summary = {"Clone": name, "Length (nt)": len(clone), "Frame": np.nan, "Coverage (%)": 0.0,
+               "AA Identity (%)": np.nan, "NT Mismatch": 0, "Silent": 0, "Missense": 0, "Nonsense": 0,
+               "Deletion": 0, "Insertion": 0, "Ambiguous": 0, "Status": "Failed"}
+    ca = codon_align(ref, clone, aligner)
+    if ca is None:
+        return {"summary": summary, "codes": codes, "mutations": []}
+
+    frame, ref_idx, clone_idx = ca["frame"], ca["ref_idx"], ca["clone_idx"]
+    ref_aa, clone_aa = ca["ref_aa"], ca["clone_aa"]
+    both = (ref_idx >= 0) & (clone_idx >= 0)
+
+    # 两端悬挂之外的区域才算覆盖
+    covered = np.flatnonzero(both)
+    mutations = []
+    if covered.size:
+        first, last = covered[0], covered[-1]
+        for col in range(first, last + 1):
+            i, j = ref_idx[col], clone_idx[col]
+            if i >= 0 and j >= 0:
+                rc = ref[3 * i:3 * i + 3]
+                cc = clone[frame + 3 * j:frame + 3 * j + 3]
+                ra, qa = ref_aa[i], clone_aa[j]
+                if qa == "X" or ra == "X":
+                    summary["Ambiguous"] += 1
+                    continue
+                nt_diff = _nt_mismatch(rc, cc)
+                summary["NT Mismatch"] += nt_diff
+                if qa == "*" and ra != "*":
+                    kind = "Nonsense"
+                elif ra != qa:
+                    kind = "Missense"
+                elif nt_diff:
+                    kind = "Silent"
+                else:
+                    codes[i] = MUT_CODES["Same"]
+                    continue
+                codes[i] = MUT_CODES[kind]
+                mutations.append({"Clone": name, "Ref Pos": int(i) + 1, "Type": kind, "Ref Codon": rc,
+                                  "Clone Codon": cc, "Ref AA": ra, "Clone AA": qa,
+                                  "Notation": f"{ra}{i + 1}{qa}"})
+            elif i >= 0:
+                codes[i] = MUT_CODES["Deletion"]
+                mutations.append({"Clone": name, "Ref Pos": int(i) + 1, "Type": "Deletion",
+                                  "Ref Codon": ref[3 * i:3 * i + 3], "Clone Codon": "---",
+                                  "Ref AA": ref_aa[i], "Clone AA": "-", "Notation": f"del {ref_aa[i]}{i + 1}"})
+            else:
+                # 插入记在前一个参考位点之后
+                prev = ref_idx[:col][ref_idx[:col] >= 0]
+                anchor = int(prev[-1]) if prev.size else 0
+                if codes[anchor] == MUT_CODES["Same"]:
+                    codes[anchor] = MUT_CODES["Insertion"]
+                cc = clone[frame + 3 * j:frame + 3 * j + 3]
+                mutations.append({"Clone": name, "Ref Pos": anchor + 1, "Type": "Insertion", "Ref Codon": "---",
+                                  "Clone Codon": cc, "Ref AA": "-", "Clone AA": clone_aa[j],
+                                  "Notation": f"ins {clone_aa[j]} after {anchor + 1}"})
+
+        pairs = [(ref_aa[i], clone_aa[j]) for i, j in zip(ref_idx[both], clone_idx[both])]
+        pairs = [(a, b) for a, b in pairs if a != "X" and b != "X"]
+        n_pair = len(pairs)
+        same_aa = sum(a == b for a, b in pairs)
+        counts = pd.Series([m["Type"] for m in mutations], dtype=object).value_counts()
+        summary.update({
+            "Frame": frame,
+            "Coverage (%)": 100.0 * float((codes >= 0).sum()) / max(n_ref, 1),
+            "AA Identity (%)": 100.0 * same_aa / n_pair if n_pair else np.nan,
+            **{k: int(counts.get(k, 0)) for k in ("Silent", "Missense", "Nonsense", "Deletion", "Insertion")},
+            "Status": "OK",
+        })
+    return {"summary": summary, "codes": codes, "mutations": mutations}
+
+
+# ==========================================
+# 3. 批量 (进程池，按块流式返回)
+# ==========================================
+def _align_chunk(args):
+    start, ref, names, seqs = args
+    aligner = _protein_aligner()
+    return start, [classify_clone(ref, s, n, aligner) for n, s in zip(names, seqs)]
+
+
+def iter_align_clones(ref, seqs, names=None, n_jobs=None, chunk_size=25):
+    """
+    生成器：按块返回 (起始序号, 结果列表)，完成顺序不保证与输入一致
+    页面可以边收边显示 (流式)
+    """
+    ref = clean_dna(ref)
+    ref = ref[:len(ref) - len(ref) % 3]
+    seqs = [clean_dna(s) for s in seqs]
+    names = list(names) if names is not None else [f"Clone{i + 1}" for i in range(len(seqs))]
+    tasks = [(i, ref, names[i:i + chunk_size], seqs[i:i + chunk_size]) for i in range(0, len(seqs), chunk_size)]
+
+    n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+    if n_jobs == 1 or len(seqs) < PARALLEL_MIN:
+        for t in tasks:
+            yield _align_chunk(t)
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+        for fut in as_completed([ex.submit(_align_chunk, t) for t in tasks]):
+            yield fut.result()
+
+
+def collect_results(chunks, n_ref):
+    """
+    把 (起始序号, 结果列表) 汇总为:
+        df_summary (每克隆一行) / df_mut (突变长表) / codes (克隆 x 位点 int8 矩阵，按输入顺序)
+    """
+    ordered = [r for _, rs in sorted(chunks, key=lambda c: c[0]) for r in rs]
+    df_summary = pd.DataFrame([r["summary"] for r in ordered])
+    df_mut = pd.DataFrame([m for r in ordered for m in r["mutations"]],
+                          columns=["Clone", "Ref Pos", "Type", "Ref Codon", "Clone Codon", "Ref AA", "Clone AA",
+                                   "Notation"])
+    codes = np.vstack([r["codes"] for r in ordered]) if ordered else np.empty((0, n_ref), dtype=np.int8)
+    return df_summary, df_mut, codes
+
+
+def mutation_matrix(codes, clone_names, ref_aa):
+    """int8 编码矩阵 -> 符号 DataFrame (行: 克隆，列: 参考位点如 "A33")"""
+    symbols = np.array([MUT_SYMBOLS[k] for k in sorted(MUT_SYMBOLS)], dtype=object)
+    cols = [f"{aa}{i + 1}" for i, aa in enumerate(ref_aa[:codes.shape[1]])]
+    return pd.DataFrame(symbols[codes.astype(int) + 1], index=list(clone_names), columns=cols)
+
+
+def position_frequency(codes):
+    """每个参考位点各类突变的克隆数 (列: Silent / Missense / ...)"""
+    return pd.DataFrame({k: (codes == v).sum(axis=0) for k, v in MUT_CODES.items() if v > 0})
+
+
+# ==========================================
+# 4. 可视化
+# ==========================================
+def mutation_heatmap(codes, clone_names, ref_aa, max_rows=300):
+    """
+    突变矩阵热图 (离散色阶)；克隆数超过 max_rows 时只画突变最多的 max_rows 个
+    """
+    import plotly.graph_objects as go
+
+    names = np.asarray(list(clone_names), dtype=object)
+    if codes.shape[0] > max_rows:
+        keep = np.sort(np.argsort(-(codes > 0).sum(axis=1), kind="stable")[:max_rows])
+        codes, names = codes[keep], names[keep]
+
+    keys = sorted(MUT_SYMBOLS)
+    n = len(keys)
+    # 每个编码占色阶上等宽的一段
+    scale = []
+    for i, k in enumerate(keys):
+        scale += [(i / n, MUT_COLORS[k]), ((i + 1) / n, MUT_COLORS[k])]
+    labels = {v: k for k, v in MUT_CODES.items()}
+    text = np.array([labels[k] for k in keys], dtype=object)[codes.astype(int) + 1]
+    pos = [f"{aa}{i + 1}" for i, aa in enumerate(ref_aa[:codes.shape[1]])]
+
+    fig = go.Figure(go.Heatmap(
+        z=codes, x=np.arange(codes.shape[1]), y=np.arange(codes.shape[0]), text=text,
+        colorscale=scale, zmin=keys[0] - 0.5, zmax=keys[-1] + 0.5,
+        colorbar=dict(tickmode="array", tickvals=keys, ticktext=[labels[k] for k in keys]),
+        customdata=np.broadcast_to(np.asarray(pos, dtype=object)[None, :], codes.shape),
+        hovertemplate="%{customdata}<br>#%{y}<br>%{text}<extra></extra>",
+    ))
+    yaxis = dict(autorange="reversed", showticklabels=False)
+    if len(names) <= 60:
+        yaxis.update(showticklabels=True, tickmode="array", tickvals=np.arange(len(names)), ticktext=list(names))
+    fig.update_layout(height=min(900, 200 + 12 * len(names)), margin=dict(l=10, r=10, t=30, b=10),
+                      xaxis=dict(tickmode="array", tickvals=np.arange(0, len(pos), 10), ticktext=pos[::10]),
+                      yaxis=yaxis)
+    return fig
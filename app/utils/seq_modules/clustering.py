@@ -0,0 +1,223 @@
+import re
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from Bio.Seq import Seq
+from scipy.cluster.hierarchy import linkage, fcluster, leaves_list, dendrogram, optimal_leaf_ordering
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+LINKAGE_METHODS = ("average", "complete", "single", "weighted")
+HEATMAP_MAX_SIZE = 400      # 热图最多显示 400 x 400 个格子，超过则按树序分箱取平均
+OPTIMAL_ORDER_MAX = 500     # optimal_leaf_ordering 为 O(n^3)，只在小样本时启用
+
+# CDR3：保守 Cys 之后到 W-G-x-G (重链) / F-G-x-G (轻链) 之前 (IMGT CDR3，不含两端锚点)
+CDR3_PATTERN = re.compile(r'C([A-Z]{3,30}?)(?=[WF]G.G)')
+
+
+# ==========================================
+# 1. CDR3 提取 & 克隆型分组
+# ==========================================
+def _translate_frames(seq):
+    """DNA 按 3 个正向读码框翻译；蛋白序列原样返回"""
+    seq = "".join(str(seq).split()).upper()
+    if set(seq) <= set("ACGTUN-"):
+        seq = seq.replace("-", "").replace("U", "T")
+        return [str(Seq(seq[f:len(seq) - (len(seq) - f) % 3]).translate()) for f in range(3)]
+    return [seq]
+
+
+def extract_cdr3(seq):
+    """
+    返回 CDR3 氨基酸序列 (找不到返回 "")
+    每个读码框只搜索最长的无终止密码子片段，取最后一个满足锚点规则的匹配 (避开 FR 中的偶然 Cys)
+    """
+    for prot in _translate_frames(seq):
+        orf = max(prot.split("*"), key=len)
+        matches = CDR3_PATTERN.findall(orf)
+        if matches:
+            return matches[-1]
+    return ""
+
+
+def clonotypes(cdr3s, identity=0.8):
+    """
+    CDR3 克隆型分组：长度相同且一致度 >= identity 的 CDR3 连通即为同一克隆型 (单连接)
+    返回 int 数组 (从 1 开始，按克隆型大小降序编号)，无 CDR3 的序列为 0
+    """
+    cdr3s = pd.Series(list(cdr3s), dtype=object).fillna("")
+    labels = np.zeros(len(cdr3s), dtype=np.int64)
+    next_id = 0
+    groups = []
+
+    for length, idx in cdr3s.groupby(cdr3s.str.len()).groups.items():
+        if length == 0:
+            continue
+        idx = np.asarray(idx)
+        # 相同 CDR3 先合并，再在唯一序列之间比较
+        uniq, inverse = np.unique(cdr3s.iloc[idx].to_numpy().astype(str), return_inverse=True)
+        arr = np.frombuffer("".join(uniq).encode(), dtype=np.uint8).reshape(len(uniq), length)
+        max_mismatch = int(np.floor(length * (1 - identity) + 1e-9))
+
+        rows, cols = [], []
+        for start in range(0, len(uniq), 256):
+            block = arr[start:start + 256]
+            mism = (block[:, None, :] != arr[None, :, :]).sum(axis=2)
+            r, c = np.nonzero(mism <= max_mismatch)
+            rows.append(r + start)
+            cols.append(c)
+        r, c = np.concatenate(rows), np.concatenate(cols)
+        graph = coo_matrix((np.ones(r.size, dtype=np.int8), (r, c)), shape=(len(uniq), len(uniq)))
+        n_comp, comp = connected_components(graph, directed=False)
+        groups.append((idx, comp[inverse] + next_id))
+        next_id += n_comp
+
+    if not groups:
+        return labels
+    # 按克隆型大小重新编号
+    all_idx = np.concatenate([g[0] for g in groups])
+    all_lab = np.concatenate([g[1] for g in groups])
+    counts = np.bincount(all_lab)
+    rank = np.empty_like(counts)
+    rank[np.argsort(-counts, kind="stable")] = np.arange(1, counts.size + 1)
+    labels[all_idx] = rank[all_lab]
+    return labels
+
+
+# ==========================================
+# 2. 层次聚类
+# ==========================================
+def hierarchical_clusters(condensed_sim, cut_similarity=0.8, method="average"):
+    """
+    condensed_sim: 压缩一致度向量 (见 similarity.pairwise_similarity，各算法同一尺度)
+    距离 = 1 - 相似度；method=average 即 UPGMA
+    在 1 - cut_similarity 处切树，返回 (labels, order, Z)
+        labels: 簇编号 (从 1 开始，按簇大小降序)
+        order : 树叶顺序 (热图行列排序)
+    """
+    dist = 1.0 - np.asarray(condensed_sim, dtype=np.float64)
+    np.clip(dist, 0.0, 1.0, out=dist)
+    Z = linkage(dist, method=method)
+    n = Z.shape[0] + 1
+    if n <= OPTIMAL_ORDER_MAX:
+        Z = optimal_leaf_ordering(Z, dist)
+    raw = fcluster(Z, t=1.0 - cut_similarity, criterion="distance")
+
+    counts = np.bincount(raw)
+    rank = np.zeros_like(counts)
+    rank[np.argsort(-counts, kind="stable")[:np.count_nonzero(counts)]] = np.arange(1, np.count_nonzero(counts) + 1)
+    return rank[raw], leaves_list(Z), Z
+
+
+def cluster_order(labels, order=None):
+    """克隆型模式没有树序：按 (簇编号, 原顺序) 排列，同簇相邻"""
+    base = np.arange(len(labels)) if order is None else np.asarray(order)
+    lab = np.asarray(labels)[base]
+    # 无 CDR3 (0) 放最后
+    key = np.where(lab == 0, np.iinfo(np.int64).max, lab)
+    return base[np.argsort(key, kind="stable")]
+
+
+def cluster_summary(names, labels, sim_square, cdr3s=None):
+    """
+    每簇一行：Cluster / Size / Representative (簇内平均相似度最高者) / Mean Identity / Min Identity
+    """
+    names = np.asarray(names, dtype=object)
+    labels = np.asarray(labels)
+    rows = []
+    for lab in np.unique(labels):
+        idx = np.flatnonzero(labels == lab)
+        sub = sim_square[np.ix_(idx, idx)]
+        if idx.size > 1:
+            off = sub[~np.eye(idx.size, dtype=bool)]
+            mean_sim = sub.sum(axis=1) - 1.0
+            rep = idx[np.argmax(mean_sim)]
+            mean_id, min_id = float(off.mean()), float(off.min())
+        else:
+            rep, mean_id, min_id = idx[0], 1.0, 1.0
+        row = {"Cluster": int(lab), "Size": idx.size, "Representative": names[rep],
+               "Mean Identity": mean_id, "Min Identity": min_id}
+        if cdr3s is not None:
+            row["CDR3"] = cdr3s[rep]
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values(["Size", "Cluster"], ascending=[False, True]).reset_index(drop=True)
+
+
+# ==========================================
+# 3. 可视化 (大样本降采样)
+# ==========================================
+def downsample_ordered(sim_square, order, names, max_size=HEATMAP_MAX_SIZE):
+    """
+    按树序重排后，若 n > max_size 则把相邻行列分箱取平均 (n x n -> max_size x max_size)
+    返回 (矩阵, 标签)；分箱标签为 "首条 … 末条 (k)"
+    """
+    order = np.asarray(order)
+    names = np.asarray(names, dtype=object)[order]
+    n = order.size
+    mat = sim_square[np.ix_(order, order)]
+    if n <= max_size:
+        return mat, list(names)
+
+    edges = np.linspace(0, n, max_size + 1).astype(int)
+    starts = edges[:-1]
+    sizes = np.diff(edges)
+    # 先行后列分段求和 (reduceat)，再除以格子数
+    summed = np.add.reduceat(np.add.reduceat(mat, starts, axis=0), starts, axis=1)
+    binned = summed / np.outer(sizes, sizes)
+    labels = [f"{names[s]} … {names[s + k - 1]} ({k})" if k > 1 else names[s] for s, k in zip(starts, sizes)]
+    return binned.astype(np.float32), labels
+
+
+def similarity_heatmap(sim_square, order, names, labels=None, max_size=HEATMAP_MAX_SIZE):
+    """plotly 热图 (按树序)，簇边界用细线标出"""
+    mat, ticks = downsample_ordered(sim_square, order, names, max_size)
+    n_show = len(ticks)
+    # 用数值坐标 + 标签文本，避免重名克隆在类别轴上被合并
+    pos = np.arange(n_show)
+    ticks = np.asarray(ticks, dtype=object)
+    heatmap = dict(z=mat, x=pos, y=pos, colorscale="Viridis", zmin=0, zmax=1, colorbar=dict(title="Similarity"),
+                   hovertemplate="#%{y} × #%{x}<br>Similarity: %{z:.3f}<extra></extra>")
+    if n_show <= 150:
+        # 逐格悬停标签 (n^2 个字符串)，格子太多时省略以控制页面体积
+        heatmap.update(customdata=np.stack(np.broadcast_arrays(ticks[:, None], ticks[None, :]), axis=-1),
+                       hovertemplate="%{customdata[0]}<br>%{customdata[1]}<br>Similarity: %{z:.3f}<extra></extra>")
+    fig = go.Figure(go.Heatmap(**heatmap))
+
+    if labels is not None and np.unique(labels).size <= 200:
+        # 簇边界 (换算到降采样后的坐标)
+        lab = np.asarray(labels)[np.asarray(order)]
+        breaks = np.flatnonzero(lab[1:] != lab[:-1]) + 1
+        scale = n_show / len(lab)
+        for b in breaks * scale - 0.5:
+            fig.add_shape(type="line", x0=b, x1=b, y0=-0.5, y1=n_show - 0.5, line=dict(color="white", width=0.5))
+            fig.add_shape(type="line", y0=b, y1=b, x0=-0.5, x1=n_show - 0.5, line=dict(color="white", width=0.5))
+
+    axis = dict(showticklabels=False, showgrid=False, zeroline=False)
+    if n_show <= 60:
+        axis.update(showticklabels=True, tickmode="array", tickvals=pos, ticktext=list(ticks))
+    fig.update_layout(height=700, margin=dict(l=10, r=10, t=30, b=10),
+                      xaxis=axis, yaxis=dict(axis, autorange="reversed"))
+    return fig
+
+
+def dendrogram_figure(Z, names, max_leaves=60):
+    """
+    plotly 树状图；叶子数超过 max_leaves 时截断为 lastp 显示 (叶子标签为 "(簇大小)")
+    """
+    kwargs = {"no_plot": True, "labels": list(names)}
+    if Z.shape[0] + 1 > max_leaves:
+        kwargs.update(truncate_mode="lastp", p=max_leaves)
+    d = dendrogram(Z, **kwargs)
+
+    fig = go.Figure()
+    for xs, ys in zip(d["icoord"], d["dcoord"]):
+        fig.add_trace(go.Scatter(x=xs, y=1 - np.asarray(ys), mode="lines", line=dict(color="#555", width=1),
+                                 hoverinfo="skip", showlegend=False))
+    ticks = 5 + 10 * np.arange(len(d["ivl"]))
+    fig.update_layout(
+        height=300, margin=dict(l=10, r=10, t=30, b=10),
+        xaxis=dict(tickmode="array", tickvals=ticks, ticktext=d["ivl"], tickangle=-90),
+        yaxis=dict(title="Similarity"),
+    )
+    return fig
@@ -0,0 +1,253 @@
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils.seq_modules.numbering import region_of
+
+# ==========================================
+# 0. 默认基序库
+# ==========================================
+# pattern 语法：字母、X 或 . (任意残基)、[ST] / [^P] 字符集、开头的 ^ (N 端)；大小写不敏感 (序列统一为大写)
+#   以上定长写法编译为逐位查找表，整批序列用 numpy 一次完成匹配；其他正则写法 (变长、分支) 走 re 回退
+# cdr_only: 只在 CDR 内报告 (Met/Trp/Cys 在框架区普遍存在，一般不作为风险)；未提供 CDR 注释时全部报告
+DEFAULT_MOTIFS = [
+    {"name": "N-Glyco", "pattern": "N[^P][ST]", "desc": "糖基化 (Glycosylation)", "severity": "High", "cdr_only": False},
+    {"name": "NG", "pattern": "NG", "desc": "脱酰胺 (Deamidation)", "severity": "High", "cdr_only": False},
+    {"name": "NS/NT/NH", "pattern": "N[STH]", "desc": "脱酰胺 (Deamidation)", "severity": "Medium", "cdr_only": True},
+    {"name": "DG", "pattern": "DG", "desc": "异构化 (Isomerization)", "severity": "High", "cdr_only": False},
+    {"name": "DS/DT/DD/DH", "pattern": "D[STDH]", "desc": "异构化 (Isomerization)", "severity": "Medium",
+     "cdr_only": True},
+    {"name": "DP", "pattern": "DP", "desc": "酸裂解 (Cleavage)", "severity": "Medium", "cdr_only": False},
+    {"name": "Met", "pattern": "M", "desc": "氧化 (Oxidation)", "severity": "Medium", "cdr_only": True},
+    {"name": "Trp", "pattern": "W", "desc": "氧化 (Oxidation)", "severity": "Medium", "cdr_only": True},
+    {"name": "Cys", "pattern": "C", "desc": "游离半胱氨酸 (Free Cys)", "severity": "High", "cdr_only": True},
+    {"name": "RGD", "pattern": "RGD", "desc": "整合素结合 (Integrin binding)", "severity": "Low", "cdr_only": False},
+    {"name": "N-term Q/E", "pattern": "^[QE]", "desc": "焦谷氨酸 (Pyro-Glu)", "severity": "Low", "cdr_only": False},
+]
+
+SEVERITY_ORDER = ["High", "Medium", "Low"]
+_SEP = "\n"                 # 批量拼接的分隔符 (位置跨越分隔符的匹配会被丢弃)
+
+
+# ==========================================
+# 1. 编译
+# ==========================================
+_FIXED_TOKEN = re.compile(r'\[\^?[A-Z]+\]|[A-Z.]')
+_SEP_CODE = ord(_SEP)
+
+
+def _library_key(motifs):
+    """基序库 -> 可哈希的键 (用于编译缓存)"""
+    return tuple((m["name"], m["pattern"]) for m in motifs)
+
+
+def _char_table(token):
+    """单个位置的写法 -> 256 长度的布尔查找表 (分隔符永远为 False，避免跨序列匹配)"""
+    table = np.zeros(256, dtype=bool)
+    if token in (".", "X"):
+        table[65:91] = True
+    elif token.startswith("[^"):
+        table[65:91] = True
+        table[np.frombuffer(token[2:-1].encode(), dtype=np.uint8)] = False
+    elif token.startswith("["):
+        table[np.frombuffer(token[1:-1].encode(), dtype=np.uint8)] = True
+    else:
+        table[ord(token)] = True
+    table[_SEP_CODE] = False
+    return table
+
+
+def _parse_fixed(pattern):
+    """定长基序 -> (逐位查找表 (k, 256), 是否锚定 N 端)；不是定长写法返回 None"""
+    anchored = pattern.startswith("^")
+    body = pattern[1:] if anchored else pattern
+    tokens = _FIXED_TOKEN.findall(body)
+    if not tokens or "".join(tokens) != body:
+        return None
+    return np.stack([_char_table(t) for t in tokens]), anchored
+
+
+@lru_cache(maxsize=32)
+def _compile(key):
+    """
+    基序库 -> 匹配器列表，每个基序一个：
+        ("fixed", 查找表, 锚定)  定长写法，numpy 整批匹配 (等价于一个逐位并行的有限自动机)
+        ("regex", 编译后的正则)  其他写法，用前瞻 (?=(p)) 找出全部重叠匹配
+    用户输入的小写写法先转大写再判断是否定长；正则回退忽略大小写 (不改写 \\d 之类的转义)
+    """
+    matchers = []
+    for name, p in key:
+        fixed = _parse_fixed(p.upper())
+        if fixed is not None:
+            matchers.append(("fixed",) + fixed)
+            continue
+        try:
+            matchers.append(("regex", re.compile(f"(?=({p}))", re.MULTILINE | re.IGNORECASE)))
+        except re.error as e:
+            raise ValueError(f"基序 {name} 的正则无效: {e}")
+    return matchers
+
+
+def compile_library(motifs=None):
+    """返回 (匹配器列表, 基序表 DataFrame)"""
+    motifs = list(DEFAULT_MOTIFS if motifs is None else motifs)
+    if not motifs:
+        raise ValueError("基序库为空")
+    return _compile(_library_key(motifs)), pd.DataFrame(motifs)
+
+
+def _find_all(matcher, codes, text, seq_starts):
+    """单个基序在拼接文本中的全部 (起点, 终点)"""
+    if matcher[0] == "fixed":
+        _, tables, anchored = matcher
+        k = tables.shape[0]
+        if anchored:
+            cand = seq_starts[seq_starts + k <= codes.size]
+            mask = np.ones(cand.size, dtype=bool)
+            for j in range(k):
+                mask &= tables[j][codes[cand + j]]
+            pos = cand[mask]
+        else:
+            n = codes.size - k + 1
+            if n <= 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            mask = tables[0][codes[:n]]
+            for j in range(1, k):
+                mask &= tables[j][codes[j:j + n]]
+            pos = np.flatnonzero(mask)
+        return pos, pos + k
+
+    spans = np.array([m.span(1) for m in matcher[1].finditer(text)], dtype=np.int64).reshape(-1, 2)
+    return spans[:, 0], spans[:, 1]
+
+
+# ==========================================
+# 2. 扫描
+# ==========================================
+def scan_sequences(seqs, names=None, regions=None, motifs=None):
+    """
+    一次扫描多条蛋白序列，返回逐位点风险长表：
+        Name / Seq Index / Position (1 基) / End / Motif / Match / Risk / Severity / Region / In CDR
+    regions: 与 seqs 等长的 FR/CDR 区间 dict 列表 (numbering.annotate_* 的 Regions)，可选
+    """
+    seqs = ["".join(str(s).split()).upper() for s in seqs]
+    names = list(names) if names is not None else [f"Seq{i + 1}" for i in range(len(seqs))]
+    matchers, lib = compile_library(motifs)
+    columns = ["Name", "Seq Index", "Position", "End", "Motif", "Match", "Risk", "Severity", "Region", "In CDR"]
+    if not seqs:
+        return pd.DataFrame(columns=columns)
+
+    # 拼接为一个长字符串 (uint8 数组)，每个基序对整批只做一次匹配
+    text = _SEP.join(seqs)
+    codes = np.frombuffer(text.encode("ascii", "replace"), dtype=np.uint8)
+    starts = np.r_[0, np.cumsum([len(s) + len(_SEP) for s in seqs[:-1]])].astype(np.int64)
+    ends = starts + np.array([len(s) for s in seqs])
+
+    found = [(*_find_all(m, codes, text, starts), gi) for gi, m in enumerate(matchers)]
+    hit_pos = np.concatenate([f[0] for f in found])
+    hit_end = np.concatenate([f[1] for f in found])
+    hit_motif = np.concatenate([np.full(f[0].size, f[2]) for f in found])
+    if hit_pos.size == 0:
+        return pd.DataFrame(columns=columns)
+
+    order = np.lexsort((hit_motif, hit_pos))
+    hit_pos, hit_end, hit_motif = hit_pos[order], hit_end[order], hit_motif[order]
+    seq_idx = np.searchsorted(starts, hit_pos, side="right") - 1
+    keep = hit_end <= ends[seq_idx]               # 丢弃跨越分隔符的正则匹配
+    hit_pos, hit_end, hit_motif, seq_idx = hit_pos[keep], hit_end[keep], hit_motif[keep], seq_idx[keep]
+    local = hit_pos - starts[seq_idx]
+
+    df = pd.DataFrame({
+        "Name": np.asarray(names, dtype=object)[seq_idx],
+        "Seq Index": seq_idx,
+        "Position": local + 1,
+        "End": hit_end - starts[seq_idx],
+        "Motif": lib["name"].to_numpy()[hit_motif],
+        "Match": [text[a:b] for a, b in zip(hit_pos, hit_end)],
+        "Risk": lib["desc"].to_numpy()[hit_motif],
+        "Severity": pd.Categorical(lib["severity"].to_numpy()[hit_motif], categories=SEVERITY_ORDER),
+    })
+
+    if regions is None:
+        df["Region"] = ""
+        df["In CDR"] = False
+        return df[columns].reset_index(drop=True)
+
+    df["Region"] = [region_of(regions[i] or {}, p) for i, p in zip(seq_idx, local)]
+    df["In CDR"] = df["Region"].str.startswith("CDR")
+    # cdr_only 基序只保留 CDR 内 (该条序列未注释出任何区域时全部保留)
+    cdr_only = lib["cdr_only"].fillna(False).astype(bool).to_numpy()[hit_motif] if "cdr_only" in lib else False
+    annotated = np.array([bool(regions[i]) for i in seq_idx])
+    df = df[~(cdr_only & annotated & ~df["In CDR"].to_numpy())]
+    return df[columns].reset_index(drop=True)
+
+
+def liability_summary(df_hits, names):
+    """
+    每条序列一行：Risks (基序 x 次数)、CDR Risks (基序@区域)、High / Medium / Low 计数
+    """
+    base = pd.DataFrame({"Name": list(names)})
+    base["Seq Index"] = np.arange(len(base))
+    if df_hits.empty:
+        base["Risks"], base["CDR Risks"] = "Pass", "-"
+        for sev in SEVERITY_ORDER:
+            base[sev] = 0
+        return base.drop(columns="Seq Index")
+
+    counts = df_hits.groupby(["Seq Index", "Motif"], sort=False).size()
+    risks = counts.groupby(level=0).apply(
+        lambda s: ", ".join(f"{m} x {n}" if n > 1 else m for (_, m), n in s.items()))
+    cdr = df_hits[df_hits["In CDR"]]
+    # 没有 CDR 内命中时 groupby.apply 返回空 DataFrame，这里直接用空 Series
+    cdr_risks = cdr.groupby("Seq Index")[["Motif", "Region"]].apply(
+        lambda g: ", ".join(g["Motif"] + "@" + g["Region"])) if len(cdr) else pd.Series(dtype=object)
+    sev = pd.crosstab(df_hits["Seq Index"], df_hits["Severity"]).reindex(columns=SEVERITY_ORDER, fill_value=0)
+
+    out = base.set_index("Seq Index")
+    out["Risks"] = risks.reindex(out.index).fillna("Pass")
+    out["CDR Risks"] = cdr_risks.reindex(out.index).fillna("-")
+    out = out.join(sev).fillna({s: 0 for s in SEVERITY_ORDER})
+    out[SEVERITY_ORDER] = out[SEVERITY_ORDER].astype(int)
+    return out.reset_index(drop=True)
+
+
+def risk_residues(df_hits, seq_index=0):
+    """某条序列所有风险基序覆盖的残基 (1 基位点集合)"""
+    sub = df_hits[df_hits["Seq Index"] == seq_index]
+    return sorted({p for s, e in zip(sub["Position"], sub["End"]) for p in range(s, e + 1)})
+
+
+# ==========================================
+# 3. 基准测试
+# ==========================================
+def benchmark_liabilities(n=10_000, length=120, seed=0):
+    """
+    n 条随机蛋白序列一次扫描 vs 旧的逐位点循环 (秒)
+    运行: python -m utils.seq_modules.liabilities
+    """
+    rng = np.random.default_rng(seed)
+    aa = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+    seqs = ["".join(row) for row in rng.choice(aa, (n, length))]
+
+    t0 = time.perf_counter()
+    df = scan_sequences(seqs)
+    t_new = time.perf_counter() - t0
+
+    motifs = ["NG", "DG", "DP", "NXS", "NXT"]
+    t0 = time.perf_counter()
+    for s in seqs:
+        for i in range(len(s) - 1):
+            sub_2, sub_3 = s[i:i + 2], s[i:i + 3]
+            for m in motifs:
+                if m in [sub_2, sub_3]:
+                    pass
+    t_old = time.perf_counter() - t0
+    return pd.DataFrame([{"Sequences": n, "Hits": len(df), "Per-position loop (s)": t_old,
+                          "Batch scan (s)": t_new}])
+
+
+if __name__ == "__main__":
+    print(benchmark_liabilities().to_string(index=False))
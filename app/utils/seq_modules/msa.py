@@ -0,0 +1,352 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from Bio.Align import PairwiseAligner, substitution_matrices
+from Bio.Seq import Seq
+
+from utils.seq_modules.similarity import DNA_ALPHABET, PROTEIN_ALPHABET, detect_alphabet, pairwise_similarity, \
+    to_square
+from utils.seq_modules.clustering import hierarchical_clusters
+
+# ==========================================
+# 0. 常量
+# ==========================================
+GAP = ord("-")
+PARALLEL_MIN = 2_000        # 少于该数量的序列不启用多进程 (进程启动开销大于比对本身)
+VIEWER_MAX_COLS = 2000      # 查看器单次最多渲染的列数 (超出部分截断)
+
+# Clustal X 风格配色 (蛋白) / 常规四色 (核酸)
+PROTEIN_COLORS = {**dict.fromkeys("AILMFWV", "#80a0f0"), **dict.fromkeys("KR", "#f01505"),
+                  **dict.fromkeys("DE", "#c048c0"), **dict.fromkeys("NQST", "#15c015"), "C": "#f08080",
+                  "G": "#f09048", "P": "#c0c000", **dict.fromkeys("HY", "#15a4a4")}
+DNA_COLORS = {"A": "#5cb85c", "C": "#428bca", "G": "#f0ad4e", "T": "#d9534f"}
+
+
+# ==========================================
+# 1. 预处理
+# ==========================================
+def to_protein(seq):
+    """核酸 -> 3 个正向读码框中最长的无终止片段"""
+    seq = "".join(str(seq).split()).upper().replace("U", "T").replace("-", "")
+    best = ""
+    for f in range(3):
+        sub = seq[f:]
+        sub = sub[:len(sub) - len(sub) % 3]
+        if sub:
+            best = max([best] + str(Seq(sub).translate()).split("*"), key=len)
+    return best
+
+
+def prepare_sequences(seqs, translate=False):
+    """去空白 / 缺口并转大写；translate=True 时核酸翻译为蛋白"""
+    seqs = ["".join(str(s).split()).upper().replace("-", "") for s in seqs]
+    if translate:
+        seqs = [to_protein(s) for s in seqs]
+    return seqs
+
+
+def _aligner(kind):
+    """全局比对，末端缺口不罚分 (克隆长短不一)"""
+    if kind == "protein":
+        return PairwiseAligner(mode="global", substitution_matrix=substitution_matrices.load("BLOSUM62"),
+                               open_gap_score=-10.0, extend_gap_score=-1.0, end_gap_score=0.0)
+    return PairwiseAligner(mode="global", match_score=2.0, mismatch_score=-3.0, open_gap_score=-5.0,
+                           extend_gap_score=-2.0, end_gap_score=0.0)
+
+
+# ==========================================
+# 2. 导向树 & 逐条比对到中心序列
+# ==========================================
+def guide_tree(seqs):
+    """
+    k-mer 相似度 + UPGMA 导向树
+    返回 (树叶顺序, 中心序列下标 (与其他序列平均相似度最高者))
+    """
+    n = len(seqs)
+    if n <= 2:
+        return np.arange(n), 0
+    condensed = pairwise_similarity(seqs, method="kmer")
+    _, order, _ = hierarchical_clusters(condensed, cut_similarity=0.8, method="average")
+    center = int(np.argmax(to_square(condensed, n).sum(axis=1)))
+    return order, center
+
+
+def _align_paths(args):
+    """一批序列与中心序列比对，返回每条的 (中心序号, 序列序号) 路径 (缺口为 -1)"""
+    center, seqs, kind = args
+    aligner = _aligner(kind)
+    paths = []
+    for s in seqs:
+        if not s or not center:
+            paths.append((np.full(len(s), -1, dtype=np.int64), np.arange(len(s))))
+            continue
+        idx = aligner.align(center, s)[0].indices
+        paths.append((idx[0], idx[1]))
+    return paths
+
+
+def _merge_paths(center_len, paths, seqs):
+    """
+    按中心序列坐标合并所有两两比对，插入的残基放到各自位置的插入列 (左对齐)
+    返回 uint8 矩阵 (n x 总列数)，缺口为 "-"
+    """
+    # slot p: 中心第 p 个残基之前的插入列 (p = center_len 即末端之后)
+    ins = np.zeros(center_len + 1, dtype=np.int64)
+    slots = []
+    for c, s in paths:
+        is_ins = (c < 0) & (s >= 0)
+        slot = np.cumsum(c >= 0)[is_ins]
+        slots.append(slot)
+        if slot.size:
+            np.maximum(ins, np.bincount(slot, minlength=center_len + 1), out=ins)
+
+    before = np.cumsum(ins) - ins                     # slot p 之前的插入列总数
+    slot_start = np.arange(center_len + 1) + before
+    center_col = slot_start[:center_len] + ins[:center_len]
+    n_cols = center_len + int(ins.sum())
+
+    M = np.full((len(seqs), n_cols), GAP, dtype=np.uint8)
+    for r, ((c, s), slot, seq) in enumerate(zip(paths, slots, seqs)):
+        codes = np.frombuffer(seq.encode("ascii", "replace"), dtype=np.uint8)
+        both = (c >= 0) & (s >= 0)
+        M[r, center_col[c[both]]] = codes[s[both]]
+        if slot.size:
+            # 同一 slot 内第 k 个插入残基 -> slot_start + k
+            k = np.arange(slot.size) - np.searchsorted(slot, slot)
+            M[r, slot_start[slot] + k] = codes[s[(c < 0) & (s >= 0)]]
+    return M
+
+
+def align_sequences(seqs, names=None, n_jobs=None, progress=None):
+    """
+    多序列比对：导向树定中心序列，其余序列与之两两比对后按中心坐标合并 (星形比对)
+    行按导向树叶顺序排列，相近克隆相邻
+    返回 dict: names / matrix (uint8, n x L) / kind (dna / protein) / center (中心序列名)
+    """
+    seqs = list(seqs)
+    names = list(names) if names is not None else [f"Seq{i + 1}" for i in range(len(seqs))]
+    if not seqs:
+        raise ValueError("没有可比对的序列")
+    kind = detect_alphabet(seqs)
+
+    order, center = guide_tree(seqs)
+    ordered = [seqs[i] for i in order]
+    ref = seqs[center]
+
+    n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+    size = 50 if n_jobs == 1 or len(seqs) < PARALLEL_MIN else -(-len(seqs) // (n_jobs * 4))
+    tasks = [(ref, ordered[i:i + size], kind) for i in range(0, len(ordered), size)]
+    paths = []
+    if n_jobs > 1 and len(seqs) >= PARALLEL_MIN:
+        with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+            for i, chunk in enumerate(ex.map(_align_paths, tasks)):
+                paths.extend(chunk)
+                if progress:
+                    progress((i + 1) / len(tasks))
+    else:
+        for i, t in enumerate(tasks):
+            paths.extend(_align_paths(t))
+            if progress:
+                progress((i + 1) / len(tasks))
+
+    M = _merge_paths(len(ref), paths, ordered)
+    return {"names": [names[i] for i in order], "matrix": M, "kind": kind, "center": names[center]}
+
+
+# ==========================================
+# 3. 保守性 & 共识序列 (按列向量化)
+# ==========================================
+def column_profile(M, kind="protein"):
+    """
+    逐列统计，返回 DataFrame:
+        Column (1 基) / Consensus / Identity (共识字符占全部序列的比例) / Gap (%)
+        缺口占多数 (残基数 < n / 2) 的列共识为 "-"，少数克隆携带的插入不会进入共识序列
+        Conservation: (1 - 归一化香农熵) x 非缺口比例，缺口多的列不会因为只剩少数残基而显得保守
+    """
+    letters = DNA_ALPHABET if kind == "dna" else PROTEIN_ALPHABET
+    codes = np.frombuffer(letters.encode(), dtype=np.uint8)
+    n = M.shape[0]
+    counts = np.stack([(M == c).sum(axis=0) for c in codes])         # (字母数, 列数)
+    residues = counts.sum(axis=0)
+    top = counts.argmax(axis=0)
+
+    gap_major = residues * 2 < n
+    consensus = np.where(gap_major | (residues == 0), GAP, codes[top]).astype(np.uint8)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / np.maximum(residues, 1)
+        h = -(np.where(p > 0, p * np.log2(p), 0.0)).sum(axis=0)
+    conservation = np.where(residues > 0, (1.0 - h / np.log2(len(letters))) * residues / n, 0.0)
+
+    return pd.DataFrame({
+        "Column": np.arange(1, M.shape[1] + 1),
+        "Consensus": list(consensus.tobytes().decode()),
+        "Identity": np.where(gap_major, n - residues, counts[top, np.arange(M.shape[1])]) / n,
+        "Conservation": conservation,
+        "Gap (%)": 100.0 * (n - residues) / n,
+    })
+
+
+def consensus_sequence(profile, min_identity=0.0):
+    """共识序列 (去掉缺口列；Identity 低于阈值的列记为 X)"""
+    cons = profile["Consensus"].to_numpy(dtype=object).copy()
+    cons[(profile["Identity"].to_numpy() < min_identity) & (cons != "-")] = "X"
+    return "".join(c for c in cons if c != "-")
+
+
+def to_fasta(msa):
+    """比对结果 -> 带缺口的 FASTA 文本"""
+    rows = msa["matrix"].view(f"S{msa['matrix'].shape[1]}").ravel()
+    return "".join(f">{n}\n{r.decode()}\n" for n, r in zip(msa["names"], rows))
+
+
+# ==========================================
+# 4. Canvas 查看器 (只绘制可见区域)
+# ==========================================
+def msa_viewer_html(msa, profile, height=600, color_mode="all"):
+    """
+    生成自包含的 HTML (用 streamlit.components.v1.html 嵌入)
+    比对矩阵整体以字符串传给前端，滚动时只重绘视口内的行列，1000+ 条序列也能流畅滚动
+    color_mode: all (全部着色) / diff (只给与共识不同的残基着色)
+    """
+    M = msa["matrix"][:, :VIEWER_MAX_COLS]
+    palette = DNA_COLORS if msa["kind"] == "dna" else PROTEIN_COLORS
+    payload = {
+        "names": [str(n) for n in msa["names"]],
+        "rows": M.view(f"S{M.shape[1]}").ravel().astype(str).tolist() if M.size else [],
+        "consensus": "".join(profile["Consensus"].iloc[:M.shape[1]]),
+        "conservation": np.round(profile["Conservation"].to_numpy()[:M.shape[1]], 3).tolist(),
+        "palette": palette,
+        "mode": color_mode,
+    }
+    data = json.dumps(payload).replace("</", "<\\/")              # 序列名中的 </script> 不会截断脚本
+    return _VIEWER_TEMPLATE.replace("__DATA__", data).replace("__HEIGHT__", str(int(height)))
+
+
+_VIEWER_TEMPLATE = """
+<div id="msa" style="position:relative;height:__HEIGHT__px;font-family:Consolas,'Courier New',monospace;">
+  <canvas id="cv" style="position:absolute;top:0;left:0;pointer-events:none;"></canvas>
+  <div id="sc" style="position:absolute;top:0;left:0;right:0;bottom:0;overflow:auto;">
+    <div id="sp"></div>
+  </div>
+  <div id="tip" style="position:absolute;display:none;background:#333;color:#fff;font-size:11px;padding:2px 6px;border-radius:3px;pointer-events:none;"></div>
+</div>
+<script>
+const D = __DATA__;
+const ROW = 16, COL = 11, NAME_W = 160, HEAD = 44;
+const wrap = document.getElementById("msa"), cv = document.getElementById("cv"),
+      sc = document.getElementById("sc"), sp = document.getElementById("sp"), tip = document.getElementById("tip");
+const ctx = cv.getContext("2d");
+const nRows = D.rows.length, nCols = D.consensus.length;
+sp.style.width = (NAME_W + nCols * COL) + "px";
+sp.style.height = (HEAD + nRows * ROW) + "px";
+
+function resize() {
+  const dpr = window.devicePixelRatio || 1;
+  cv.width = sc.clientWidth * dpr; cv.height = sc.clientHeight * dpr;
+  cv.style.width = sc.clientWidth + "px"; cv.style.height = sc.clientHeight + "px";
+  ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+  draw();
+}
+
+function draw() {
+  const w = sc.clientWidth, h = sc.clientHeight, x0 = sc.scrollLeft, y0 = sc.scrollTop;
+  const c0 = Math.floor(x0 / COL), c1 = Math.min(nCols, Math.ceil((x0 + w - NAME_W) / COL) + 1);
+  const r0 = Math.floor(y0 / ROW), r1 = Math.min(nRows, Math.ceil((y0 + h - HEAD) / ROW) + 1);
+  ctx.clearRect(0, 0, w, h);
+  ctx.font = "11px Consolas, monospace"; ctx.textAlign = "center"; ctx.textBaseline = "middle";
+
+  // 序列区 (只画可见行列)
+  for (let r = r0; r < r1; r++) {
+    const y = HEAD + r * ROW - y0, row = D.rows[r];
+    for (let c = c0; c < c1; c++) {
+      const x = NAME_W + c * COL - x0, ch = row[c];
+      if (ch === "-") { ctx.fillStyle = "#bbb"; ctx.fillText("-", x + COL / 2, y + ROW / 2); continue; }
+      const same = ch === D.consensus[c];
+      if (D.mode === "all" || !same) {
+        ctx.fillStyle = D.palette[ch] || "#ddd"; ctx.fillRect(x, y, COL, ROW);
+      }
+      ctx.fillStyle = (D.mode === "diff" && same) ? "#bbb" : "#000";
+      ctx.fillText(D.mode === "diff" && same ? "." : ch, x + COL / 2, y + ROW / 2);
+    }
+  }
+
+  // 顶部: 标尺 + 保守性柱 + 共识
+  ctx.fillStyle = "#fff"; ctx.fillRect(0, 0, w, HEAD);
+  for (let c = c0; c < c1; c++) {
+    const x = NAME_W + c * COL - x0, v = D.conservation[c];
+    ctx.fillStyle = "#7a9cc6"; ctx.fillRect(x + 1, 28 - 14 * v, COL - 2, 14 * v);
+    ctx.fillStyle = "#000"; ctx.fillText(D.consensus[c], x + COL / 2, 36);
+    if ((c + 1) % 10 === 0) { ctx.fillStyle = "#666"; ctx.fillText(String(c + 1), x + COL / 2, 6); }
+  }
+
+  // 左侧: 序列名
+  ctx.fillStyle = "#fff"; ctx.fillRect(0, 0, NAME_W, h);
+  ctx.textAlign = "left"; ctx.fillStyle = "#333";
+  ctx.fillText("Conservation", 4, 20); ctx.fillText("Consensus", 4, 36);
+  for (let r = r0; r < r1; r++) {
+    const y = HEAD + r * ROW - y0;
+    if (y < HEAD - ROW / 2) continue;
+    ctx.fillText(D.names[r].slice(0, 22), 4, y + ROW / 2);
+  }
+  ctx.strokeStyle = "#ccc"; ctx.beginPath();
+  ctx.moveTo(NAME_W - 0.5, 0); ctx.lineTo(NAME_W - 0.5, h); ctx.moveTo(0, HEAD - 0.5); ctx.lineTo(w, HEAD - 0.5);
+  ctx.stroke();
+}
+
+let pending = false;
+sc.addEventListener("scroll", () => {
+  if (!pending) { pending = true; requestAnimationFrame(() => { pending = false; draw(); }); }
+});
+sc.addEventListener("mousemove", (e) => {
+  const rect = sc.getBoundingClientRect();
+  const px = e.clientX - rect.left, py = e.clientY - rect.top;
+  const c = Math.floor((px - NAME_W + sc.scrollLeft) / COL), r = Math.floor((py - HEAD + sc.scrollTop) / ROW);
+  if (px < NAME_W || py < HEAD || c >= nCols || r >= nRows) { tip.style.display = "none"; return; }
+  tip.textContent = D.names[r] + " | col " + (c + 1) + " | " + D.rows[r][c] + " (cons " + D.consensus[c] + ")";
+  tip.style.left = (px + 12) + "px"; tip.style.top = (py + 12) + "px"; tip.style.display = "block";
+});
+sc.addEventListener("mouseleave", () => { tip.style.display = "none"; });
+window.addEventListener("resize", resize);
+resize();
+</script>
+"""
+
+
+# ==========================================
+# 5. 基准测试
+# ==========================================
+def benchmark_msa(n=1000, length=150, n_jobs=None):
+    """
+    n 条模拟同一克隆家族的蛋白 (点突变 + 少量插入缺失) 的比对耗时 (秒)
+    运行: python -m utils.seq_modules.msa
+    """
+    rng = np.random.default_rng(0)
+    aa = np.array(list(PROTEIN_ALPHABET))
+    parent = list(rng.choice(aa, length))
+    seqs = []
+    for _ in range(n):
+        s = list(parent)
+        for p in rng.choice(length, 8, replace=False):
+            s[p] = rng.choice(aa)
+        if rng.random() < 0.2:
+            del s[rng.integers(length - 3)]
+        if rng.random() < 0.2:
+            s.insert(rng.integers(length), rng.choice(aa))
+        seqs.append("".join(s))
+
+    t0 = time.perf_counter()
+    msa = align_sequences(seqs, n_jobs=n_jobs)
+    t_align = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    column_profile(msa["matrix"], msa["kind"])
+    t_profile = time.perf_counter() - t0
+    return pd.DataFrame([{"Sequences": n, "Columns": msa["matrix"].shape[1], "Align (s)": t_align,
+                          "Profile (s)": t_profile}])
+
+
+if __name__ == "__main__":
+    print(benchmark_msa().to_string(index=False))
@@ -0,0 +1,261 @@
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from Bio.Seq import Seq
+
+# ==========================================
+# 0. 常量
+# ==========================================
+# 基于保守锚点的 FR/CDR 划分 (Martin 规则的 Kabat 定义 + 同一组锚点推出的 IMGT 定义)
+#   重链: C22 ... W36-[VIAFYL]-[RK]-[QKR] ... H2 ... [KR]66-[LIVFTA]-[TSIA] ... C92 ... W103-G-x-G
+#   轻链: C23 ... W35-[YLFVNHQ]-[QLHR]-[QKR] ... L2(7) ... C88 ... F98-G-x-G
+# 不依赖 HMM / 外部比对工具，兔、人、鼠抗体可变区均适用；非典型框架返回 Partial / Failed
+SCHEMES = ("kabat", "imgt")
+REGIONS = ("FR1", "CDR1", "FR2", "CDR2", "FR3", "CDR3", "FR4")
+CDR_REGIONS = ("CDR1", "CDR2", "CDR3")
+
+_H_W36 = re.compile(r'W[VIAFYL][RK][QKR]')
+_H_R66 = re.compile(r'[KR][LIVFTA][TSIA]')
+_H_CDR3 = re.compile(r'C([A-Z]{4,40}?)(?=WG.G)')
+_L_W35 = re.compile(r'W[YLFVNHQ][QLHR][QKR]')
+_L_CDR3 = re.compile(r'C([A-Z]{3,20}?)(?=FG.G)')
+
+CACHE_MAX = 200_000         # 缓存条目上限 (按序列哈希)
+PARALLEL_MIN = 5_000        # 未命中缓存的序列超过该数量时才启用多进程
+_CACHE = {}
+
+
+# ==========================================
+# 1. 单条序列
+# ==========================================
+def _heavy_bounds(p):
+    """重链锚点 -> {区域: (start, end)} (0 基半开区间，Kabat 与 IMGT 各一套)"""
+    for m in _H_W36.finditer(p):
+        w = m.start()
+        cys = p.rfind("C", max(0, w - 17), w - 12)
+        if cys < 0:
+            continue
+        kabat = {"CDR1": (cys + 9, w)}
+        imgt = {"CDR1": (cys + 4, w - 2)}
+
+        h2s = w + 14
+        h2e = None
+        for length in range(16, 20):
+            if _H_R66.match(p, h2s + length):
+                h2e = h2s + length
+                break
+        if h2e is None:
+            return kabat, imgt
+        kabat["CDR2"] = (h2s, h2e)
+        imgt["CDR2"] = (w + 15, h2e - 8)
+
+        m3 = _H_CDR3.search(p, h2e + 26)
+        if m3:
+            kabat["CDR3"] = (m3.start() + 3, m3.end())
+            imgt["CDR3"] = (m3.start() + 1, m3.end())
+        return kabat, imgt
+    return {}, {}
+
+
+def _light_bounds(p):
+    """轻链锚点 -> {区域: (start, end)}"""
+    for m in _L_W35.finditer(p):
+        w = m.start()
+        cys = p.find("C", max(0, w - 18), w - 10)
+        if cys < 0:
+            continue
+        kabat = {"CDR1": (cys + 1, w)}
+        imgt = {"CDR1": (cys + 4, w - 2)}
+
+        l2s = w + 15
+        if l2s + 7 > len(p):
+            return kabat, imgt
+        kabat["CDR2"] = (l2s, l2s + 7)
+        imgt["CDR2"] = (l2s, l2s + 3)
+
+        m3 = _L_CDR3.search(p, l2s + 7 + 28)
+        if m3:
+            kabat["CDR3"] = imgt["CDR3"] = (m3.start() + 1, m3.end())
+        return kabat, imgt
+    return {}, {}
+
+
+def _to_regions(p, cdrs):
+    """CDR 区间 -> 完整 FR/CDR 区间表 (未识别的 CDR 之后的区域不输出)"""
+    bounds, prev = {}, 0
+    for i, cdr in enumerate(CDR_REGIONS):
+        if cdr not in cdrs:
+            break
+        s, e = cdrs[cdr]
+        bounds[f"FR{i + 1}"] = (prev, s)
+        bounds[cdr] = (s, e)
+        prev = e
+    else:
+        bounds["FR4"] = (prev, len(p))
+    return bounds
+
+
+def annotate_protein(protein, scheme="kabat"):
+    """
+    单条蛋白序列 -> dict:
+        Chain (H / L / ?)、Status (OK / Partial / Failed)、Regions {区域: (start, end)}、各区域序列
+    重链/轻链规则各跑一遍，取识别出 CDR 更多的一个 (相同时按重链处理)
+    """
+    p = "".join(str(protein).split()).upper()
+    idx = SCHEMES.index(scheme)
+    heavy = _heavy_bounds(p)[idx]
+    light = _light_bounds(p)[idx]
+
+    if heavy and len(heavy) >= len(light):
+        chain, cdrs = "H", heavy
+    elif light:
+        chain, cdrs = "L", light
+    else:
+        chain, cdrs = "?", {}
+
+    regions = _to_regions(p, cdrs)
+    status = "OK" if len(cdrs) == 3 else ("Partial" if cdrs else "Failed")
+    out = {"Chain": chain, "Scheme": scheme, "Status": status, "Protein": p, "Regions": regions}
+    for name in REGIONS:
+        s, e = regions.get(name, (0, 0))
+        out[name] = p[s:e]
+    return out
+
+
+def _candidate_proteins(seq):
+    """DNA: 6 个读码框翻译 (取每个框最长无终止片段)；蛋白原样返回"""
+    seq = "".join(str(seq).split()).upper()
+    if not seq or not set(seq) <= set("ACGTUN-"):
+        return [seq]
+    dna = Seq(seq.replace("-", "").replace("U", "T"))
+    out = []
+    for strand in (dna, dna.reverse_complement()):
+        for f in range(3):
+            sub = strand[f:]
+            sub = sub[:len(sub) - len(sub) % 3]
+            out.append(max(str(sub.translate()).split("*"), key=len))
+    return out
+
+
+def annotate_sequence(seq, scheme="kabat"):
+    """DNA 或蛋白 -> 注释 dict；DNA 会在 6 个读码框中选识别出 CDR 最多的一个"""
+    best = None
+    for prot in _candidate_proteins(seq):
+        ann = annotate_protein(prot, scheme)
+        n_cdr = sum(bool(ann[c]) for c in CDR_REGIONS)
+        if best is None or n_cdr > best[0]:
+            best = (n_cdr, ann)
+        if n_cdr == 3:
+            break
+    return best[1]
+
+
+# ==========================================
+# 2. 批量 (缓存 + 多进程)
+# ==========================================
+def sequence_key(seq, scheme):
+    """缓存键：规范化序列的 SHA1 + 编号方案"""
+    norm = "".join(str(seq).split()).upper()
+    return hashlib.sha1(f"{scheme}:{norm}".encode()).hexdigest()
+
+
+def _annotate_many(args):
+    seqs, scheme = args
+    return [annotate_sequence(s, scheme) for s in seqs]
+
+
+def annotate_batch(seqs, scheme="kabat", n_jobs=None):
+    """
+    批量注释，返回 DataFrame (每条序列一行，顺序与输入一致)
+    相同序列只计算一次；结果按序列哈希缓存在进程内，重复分析同一批克隆时直接命中
+    """
+    seqs = ["" if s is None else str(s) for s in seqs]
+    keys = [sequence_key(s, scheme) for s in seqs]
+    todo = {}
+    for k, s in zip(keys, seqs):
+        if k not in _CACHE and k not in todo:
+            todo[k] = s
+
+    if todo:
+        items = list(todo.items())
+        n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+        if n_jobs > 1 and len(items) >= PARALLEL_MIN:
+            size = -(-len(items) // (n_jobs * 4))
+            chunks = [items[i:i + size] for i in range(0, len(items), size)]
+            with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+                results = ex.map(_annotate_many, [([s for _, s in c], scheme) for c in chunks])
+                for chunk, anns in zip(chunks, results):
+                    _CACHE.update(zip((k for k, _ in chunk), anns))
+        else:
+            _CACHE.update((k, annotate_sequence(s, scheme)) for k, s in items)
+
+        # 超出上限时丢弃最早写入的条目
+        overflow = len(_CACHE) - CACHE_MAX
+        if overflow > 0:
+            for k in list(_CACHE)[:overflow]:
+                del _CACHE[k]
+
+    return pd.DataFrame([_CACHE.get(k) or annotate_sequence(s, scheme) for k, s in zip(keys, seqs)])
+
+
+def clear_cache():
+    _CACHE.clear()
+
+
+# ==========================================
+# 3. 位点 -> 区域
+# ==========================================
+def region_track(regions, length):
+    """逐残基区域标签列表 (未注释的位置为 "")"""
+    track = [""] * length
+    for name, (s, e) in regions.items():
+        track[s:e] = [name] * (min(e, length) - s)
+    return track
+
+
+def region_of(regions, pos):
+    """0 基位点所在区域 (找不到返回 "")"""
+    for name, (s, e) in regions.items():
+        if s <= pos < e:
+            return name
+    return ""
+
+
+# ==========================================
+# 4. 基准测试
+# ==========================================
+def benchmark_numbering(n=10_000, n_jobs=None):
+    """
+    模拟 n 条兔重链 (CDR 随机突变) 的批量注释耗时 (秒)，冷缓存 / 热缓存各一次
+    运行: python -m utils.seq_modules.numbering
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    aa = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+    fr1, fr2, fr3, fr4 = ("QSVEESGGRLVTPGTPLTLTCTVSGFSLS", "WVRQAPGKGLEWIG",
+                          "RFTISKTSTTVDLKITSPTTEDTATYFCAR", "WGPGTLVTVSS")
+    seqs = []
+    for _ in range(n):
+        h1 = "".join(rng.choice(aa, 5))
+        h2 = "".join(rng.choice(aa, 16))
+        h3 = "".join(rng.choice(aa, rng.integers(5, 18)))
+        seqs.append(fr1 + h1 + fr2 + h2 + fr3 + h3 + fr4)
+
+    clear_cache()
+    t0 = time.perf_counter()
+    df = annotate_batch(seqs, n_jobs=n_jobs)
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    annotate_batch(seqs, n_jobs=n_jobs)
+    warm = time.perf_counter() - t0
+    return pd.DataFrame([{"Sequences": n, "OK": int((df["Status"] == "OK").sum()),
+                          "Cold (s)": cold, "Cached (s)": warm}])
+
+
+if __name__ == "__main__":
+    print(benchmark_numbering().to_string(index=False))
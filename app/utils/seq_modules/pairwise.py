@@ -1,170 +1,317 @@
+from html import escape as html_escape
+
+import numpy as np
+import pandas as pd
 import streamlit as st
 from Bio.Seq import Seq
 import py3Dmol
 from stmol import showmol
 
+from utils.seq_modules.numbering import annotate_protein
+from utils.seq_modules.structure import (LABEL_MAX, load_structure, protein_chains, trimmed_pdb, atom_selection,
+                                         map_sequence, mapped_keys, residue_label)
+from utils.seq_modules.surface import EXPOSED_RSA, residue_exposure, liability_clusters, hydrophobic_patches
+from utils.seq_modules.liabilities import scan_sequences, risk_residues
+from utils.seq_modules.batch_alignment import (read_clones, clean_dna, iter_align_clones, collect_results,
+                                               mutation_matrix, mutation_heatmap, position_frequency,
+                                               codon_align, aligned_strings, classify_clone)
+
 
 # ==========================================
-# 1. 3D 渲染函数：加粗、表面、高亮、偏移量
+# 1. 3D 渲染函数：精简载荷 + 批量选择
 # ==========================================
-def render_3d_structure(pdb_string, mutated_indices, risk_indices, offset=0):
+def render_3d_structure(pdb_string, mut_keys, risk_keys, chains=None, spin=False):
+    """
+    mut_keys / risk_keys: 结构残基键 (链, 序号, 插入码) 列表，见 structure_keys
+    结构按哈希缓存只解析一次；交给 py3Dmol 的是去掉水/配体/氢/多余链的精简 PDB，
+    突变和风险残基各用一次多残基 setStyle 完成着色
+    """
+    struct = load_structure(pdb_string)
+
     view = py3Dmol.view(width=800, height=550)
-    view.addModel(pdb_string, "pdb")
+    view.addModel(trimmed_pdb(struct, chains=chains), "pdb")
 
     # --- 1. 设置基础样式 (全灰) ---
-    # 我们把基础飘带设为稍微透明的灰色
-    view.setStyle({'cartoon': {'color': '#e0e0e0', 'thickness': 1.0, 'opacity': 0.6}})
-
-    # --- 2. 渲染“一段红”（错义突变） ---
-    # 我们直接修改突变残基对应的 cartoon 颜色
-    for idx in mutated_indices:
-        pdb_idx = str(idx + offset)
-        # 修改这一段飘带的颜色为红色，并加厚
-        view.setStyle({'resi': pdb_idx}, {'cartoon': {'color': '#d9534f', 'thickness': 1.2}})
-        # 保留一个小球和标签作为指引
-        view.addLabel(f"MUT:{pdb_idx}",
-                      {'fontSize': 10, 'fontColor': '#d9534f', 'backgroundColor': 'white', 'backgroundOpacity': 0.5},
-                      {'resi': pdb_idx})
+    # 我们把基础飘带设为稍微透明的灰色，侧链淡色显示增加细节感
+    view.setStyle({'cartoon': {'color': '#e0e0e0', 'thickness': 1.0, 'opacity': 0.6},
+                   'stick': {'radius': 0.1, 'opacity': 0.3}})
+
+    # --- 2. 渲染“一段红”（错义突变）：整批残基一次着色 ---
+    label_style = {'fontSize': 10, 'fontColor': '#d9534f', 'backgroundColor': 'white', 'backgroundOpacity': 0.5}
+    mut_sel = atom_selection(struct, mut_keys)
+    if mut_sel:
+        view.setStyle(mut_sel, {'cartoon': {'color': '#d9534f', 'thickness': 1.2},
+                                 'stick': {'radius': 0.15, 'color': '#d9534f'}})
+        if len(mut_keys) <= LABEL_MAX:
+            view.addResLabels(atom_selection(struct, mut_keys, ca_only=True), label_style)
 
     # --- 3. 渲染“一段黄”（成药性风险） ---
-    for r_idx in risk_indices:
-        pdb_idx = str(r_idx + offset)
-        # 如果是风险位点，将飘带改为黄色
-        # 注意：如果既是突变又是风险，后面这行会覆盖颜色，通常风险比突变更值得关注
-        view.setStyle({'cartoon': {'color': '#e0e0e0', 'thickness': 1.0}},
-                      {'outline': {'color': 'black', 'width': 0.1}})
-        view.addLabel(f"RISK:{pdb_idx}", {'fontSize': 10, 'fontColor': '#8a6d3b', 'backgroundColor': '#fcf8e3'},
-                      {'resi': pdb_idx})
-
-    # --- 4. 辅助展示 ---
-    # 增加侧链显示（淡色），增加细节感
-    view.addStyle({'stick': {'radius': 0.1, 'opacity': 0.3}})
+    # 注意：如果既是突变又是风险，风险颜色会覆盖突变，通常风险比突变更值得关注
+    risk_sel = atom_selection(struct, risk_keys)
+    if risk_sel:
+        view.setStyle(risk_sel, {'cartoon': {'color': '#f0ad4e', 'thickness': 1.2},
+                                  'stick': {'radius': 0.15, 'color': '#f0ad4e'}})
+        if len(risk_keys) <= LABEL_MAX:
+            view.addResLabels(atom_selection(struct, risk_keys, ca_only=True),
+                              dict(label_style, fontColor='#8a6d3b', backgroundColor='#fcf8e3'))
 
     view.setBackgroundColor('#ffffff')
     view.zoomTo()
-    view.spin(True)
+    view.spin(spin)
     showmol(view, height=550, width=800)
 
 
+def structure_keys(struct, protein, positions, chain=None, offset=None):
+    """
+    序列 1 基位点 -> 结构残基键
+    offset 为 None 时按序列比对自动映射 (结果按结构/序列缓存)，否则按旧规则 (链, 位点 + offset)
+    返回 (残基键列表, 映射信息 或 None)
+    """
+    if offset is None:
+        mapping = map_sequence(struct, protein, chain)
+        return mapped_keys(mapping, positions), mapping
+    chain = chain or protein_chains(struct)[0]
+    return [(chain, p + int(offset), "") for p in positions], None
+
+
 # ==========================================
 # 2. 风险扫描逻辑
 # ==========================================
-def scan_liabilities(protein_seq):
-    risks = []
-    risk_indices = []
-    motifs = {
-        "NG": "脱酰胺 (Deamidation)",
-        "DG": "异构化 (Isomerization)",
-        "DP": "酸裂解 (Cleavage)",
-        "NXS": "糖基化 (Glycosylation)",
-        "NXT": "糖基化 (Glycosylation)"
-    }
-    for i in range(len(protein_seq) - 1):
-        sub_2, sub_3 = protein_seq[i:i + 2], protein_seq[i:i + 3]
-        for m, desc in motifs.items():
-            if m in [sub_2, sub_3]:
-                risks.append({"位点": i + 1, "基序": m, "风险类型": desc})
-                risk_indices.extend([i + 1, i + 2] if len(m) == 2 else [i + 1, i + 2, i + 3])
-    return risks, list(set(risk_indices))
+def scan_liabilities(protein_seq, regions=None, motifs=None):
+    """
+    单条序列风险扫描 (基于 liabilities.scan_sequences)
+    返回 (风险列表, 风险残基位点列表 (1 基))；给定 regions 时附带所在区域
+    """
+    df = scan_sequences([protein_seq], regions=None if regions is None else [regions], motifs=motifs)
+    risks = [{"位点": int(r.Position), "基序": r.Match, "风险类型": r.Risk, "等级": r.Severity,
+              "区域": r.Region or "-"} for r in df.itertuples()]
+    return risks, risk_residues(df)
 
 
 # ==========================================
-# 3. HTML 比对视图函数
+# 3. HTML 比对视图函数 (游程合并 + 分页)
 # ==========================================
-def render_dna_protein_alignment(ref_seq_str, query_seq_str):
+ALIGN_CSS = """
+<style>
+    .seq-wrapper { font-family: 'Consolas', 'Courier New', monospace; font-size: 15px; line-height: 1.8; }
+    .seq-block { margin-bottom: 30px; padding: 15px; background: #f8f9fa; border-left: 5px solid #007bff; border-radius: 4px; }
+    .seq-block .row { white-space: pre; }
+
+    /* 标签列固定宽度 */
+    .label { display: inline-block; width: 50px; color: #888; font-weight: bold; font-size: 12px; }
+
+    /* 氨基酸行每个残基占 3 个字符宽 (" A ")，等宽字体下与下方 3 个碱基对齐 */
+    .aa { font-weight: bold; }
+
+    /* 颜色定义 */
+    .m { color: #d9534f; background: #fce8e8; font-weight: bold; } /* DNA突变 */
+    .g { color: #f0ad4e; background: #fdf3e1; } /* 缺口 (插入/缺失) */
+    .match { color: #ccc; } /* 一致部分 */
+    .aa-m { color: #d9534f; text-decoration: underline; } /* 错义突变 */
+    .aa-s { color: #5bc0de; } /* 同义突变 */
+</style>
+"""
+
+# 碱基 / 氨基酸的显示类别 (数组编码 -> CSS 类)
+_NT_CLASS = ("b match", "b m", "b g")
+_AA_CLASS = ("aa match", "aa aa-s", "aa aa-m", "aa g", "aa")
+
+
+def _codon_aa(nt):
+    """比对后的核酸串 (缺口为 "-") -> 逐密码子氨基酸，"---" 记为 "-" """
+    nt = nt[:len(nt) - len(nt) % 3]
+    return "".join("-" if "-" in nt[i:i + 3] else str(Seq(nt[i:i + 3]).translate()) for i in range(0, len(nt), 3))
+
+
+def _runs(classes):
+    """游程编码：返回每段的 (起点, 终点)，相邻同类字符合并为一个 <span>"""
+    classes = np.asarray(classes)
+    if classes.size == 0:
+        return []
+    breaks = np.flatnonzero(classes[1:] != classes[:-1]) + 1
+    starts = np.r_[0, breaks]
+    ends = np.r_[breaks, classes.size]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _row(label, text, classes, class_names):
+    parts = [f"<div class='row'><span class='label'>{label}</span>"]
+    for s, e in _runs(classes):
+        parts.append(f"<span class='{class_names[classes[s]]}'>{html_escape(text[s:e])}</span>")
+    parts.append("</div>")
+    return "".join(parts)
+
+
+class AlignmentView:
     """
-    通过 CSS 强制 1AA : 3DNA 对齐的渲染函数
+    已对齐的参考 / 克隆核酸串 (等长，可含 "-" 缺口，按密码子对齐) 的分块渲染器
+    逐列的突变类别一次性用 numpy 算好；渲染时只拼接当前页的块
     """
-    ref_seq_str = ref_seq_str.upper().strip()
-    query_seq_str = query_seq_str.upper().strip()
-
-    # 翻译序列
-    ref_aa = str(Seq(ref_seq_str).translate())
-    query_aa = str(Seq(query_seq_str).translate())
-
-    # CSS 样式：定义单元格宽度
-    html = """
-    <style>
-        .seq-wrapper { font-family: 'Consolas', 'Courier New', monospace; font-size: 15px; line-height: 1.8; }
-        .seq-block { margin-bottom: 30px; padding: 15px; background: #f8f9fa; border-left: 5px solid #007bff; border-radius: 4px; }
-
-        /* 标签列固定宽度 */
-        .label { display: inline-block; width: 50px; color: #888; font-weight: bold; font-size: 12px; }
-
-        /* 碱基单元：1个字符宽 */
-        .b { display: inline-block; width: 1ch; text-align: center; }
-
-        /* 氨基酸单元：3个字符宽，确保对齐下方的3个碱基 */
-        .aa { display: inline-block; width: 3ch; text-align: center; font-weight: bold; }
-
-        /* 颜色定义 */
-        .m { color: #d9534f; background: #fce8e8; font-weight: bold; } /* DNA突变 */
-        .match { color: #ccc; } /* 一致部分 */
-        .aa-m { color: #d9534f; text-decoration: underline; } /* 错义突变 */
-        .aa-s { color: #5bc0de; } /* 同义突变 */
-    </style>
-    <div class='seq-wrapper'>
+
+    def __init__(self, ref_nt, clone_nt, chunk_size=60):
+        ref_nt, clone_nt = ref_nt.upper().strip(), clone_nt.upper().strip()
+        n = min(len(ref_nt), len(clone_nt))
+        n -= n % 3
+        self.ref_nt, self.clone_nt = ref_nt[:n], clone_nt[:n]
+        self.ref_aa, self.clone_aa = _codon_aa(self.ref_nt), _codon_aa(self.clone_nt)
+        self.chunk_size = chunk_size - chunk_size % 3
+
+        r = np.frombuffer(self.ref_nt.encode(), dtype=np.uint8)
+        q = np.frombuffer(self.clone_nt.encode(), dtype=np.uint8)
+        gap = (r == ord("-")) | (q == ord("-"))
+        diff = r != q
+        # 碱基类别: 0 一致 / 1 突变 / 2 缺口
+        self.nt_class = np.where(gap, 2, np.where(diff, 1, 0)).astype(np.int8)
+
+        # 氨基酸类别: 0 一致 / 1 同义 / 2 错义 / 3 缺口
+        ra = np.frombuffer(self.ref_aa.encode(), dtype=np.uint8)
+        qa = np.frombuffer(self.clone_aa.encode(), dtype=np.uint8)
+        codon_diff = diff.reshape(-1, 3).any(axis=1)
+        codon_gap = gap.reshape(-1, 3).any(axis=1)
+        self.aa_class = np.select([codon_gap, ra != qa, codon_diff], [3, 2, 1], 0).astype(np.int8)
+
+        # 参考编号 (跳过参考中的缺口)
+        self.ref_pos = np.cumsum(r != ord("-"))
+        self.n_blocks = -(-n // self.chunk_size) if n else 0
+
+    def block(self, b):
+        """第 b 个块 (chunk_size bp) 的 HTML"""
+        i = b * self.chunk_size
+        end = min(i + self.chunk_size, len(self.ref_nt))
+        ai, ae = i // 3, end // 3
+        aa_text = lambda s: "".join(f" {c} " for c in s)
+        aa_cls = lambda c: np.repeat(c, 3)
+        clone_text = "".join(q if k else "." for q, k in zip(self.clone_nt[i:end], self.nt_class[i:end]))
+        clone_aa = "".join(q if k else "." for q, k in zip(self.clone_aa[ai:ae], self.aa_class[ai:ae]))
+        return "".join([
+            "<div class='seq-block'>",
+            _row("REF AA", aa_text(self.ref_aa[ai:ae]), np.full(3 * (ae - ai), 4, dtype=np.int8), _AA_CLASS),
+            _row(f"{int(self.ref_pos[i]):03d}", self.ref_nt[i:end], np.zeros(end - i, dtype=np.int8), ("b",)),
+            _row("CLO", clone_text, self.nt_class[i:end], _NT_CLASS),
+            _row("DIFF", aa_text(clone_aa), aa_cls(self.aa_class[ai:ae]), _AA_CLASS),
+            "</div>",
+        ])
+
+    def page(self, page=0, blocks_per_page=10):
+        """只渲染一页 (blocks_per_page 个块)，返回 (HTML, 总页数)"""
+        n_pages = max(1, -(-self.n_blocks // blocks_per_page))
+        page = min(max(page, 0), n_pages - 1)
+        start = page * blocks_per_page
+        blocks = [self.block(b) for b in range(start, min(start + blocks_per_page, self.n_blocks))]
+        return ALIGN_CSS + "<div class='seq-wrapper'>" + "".join(blocks) + "</div>", n_pages
+
+
+def render_dna_protein_alignment(ref_seq_str, query_seq_str, page=0, blocks_per_page=10):
     """
+    通过等宽字体强制 1AA : 3DNA 对齐的渲染函数 (相邻同类字符合并为一个 span，按页渲染)
+    """
+    return AlignmentView(ref_seq_str, query_seq_str).page(page, blocks_per_page)[0]
+
+
+def show_alignment_view(view, key, blocks_per_page=10):
+    """分页显示比对视图：页码控件 + 当前页 HTML"""
+    n_pages = max(1, -(-view.n_blocks // blocks_per_page))
+    page = 0
+    if n_pages > 1:
+        page = st.number_input(f"页码 (共 {n_pages} 页，每页 {blocks_per_page * view.chunk_size} bp)",
+                               min_value=1, max_value=n_pages, value=1, key=key) - 1
+    st.markdown(view.page(page, blocks_per_page)[0], unsafe_allow_html=True)
 
-    chunk_size = 60  # 每行显示 60bp (20AA)
-    length = min(len(ref_seq_str), len(query_seq_str))
-
-    for i in range(0, length, chunk_size):
-        end = min(i + chunk_size, length)
-        dna_r = ref_seq_str[i:end]
-        dna_q = query_seq_str[i:end]
-        aa_r = ref_aa[i // 3: end // 3]
-        aa_q = query_aa[i // 3: end // 3]
-
-        # --- 第一行：Reference AA ---
-        html += f"<div class='seq-block'><div class='row'><span class='label'>REF AA</span>"
-        for aa in aa_r:
-            html += f"<span class='aa'>{aa}</span>"
-        html += "</div>"
-
-        # --- 第二行：Reference DNA ---
-        html += f"<div class='row'><span class='label'>{i + 1:03d}</span>"
-        for base in dna_r:
-            html += f"<span class='b'>{base}</span>"
-        html += "</div>"
-
-        # --- 第三行：Clone DNA (对比) ---
-        html += f"<div class='row'><span class='label'>CLO</span>"
-        diff_in_codon = []  # 记录哪些密码子发生了突变
-        for j, (r, q) in enumerate(zip(dna_r, dna_q)):
-            if r == q:
-                html += f"<span class='b match'>.</span>"
-            else:
-                html += f"<span class='b m'>{q}</span>"
-                diff_in_codon.append(j // 3)  # 记录突变所属的氨基酸索引
-        html += "</div>"
-
-        # --- 第四行：Clone AA / Diff (对比) ---
-        html += f"<div class='row'><span class='label'>DIFF</span>"
-        for k, (ar, aq) in enumerate(zip(aa_r, aa_q)):
-            has_dna_mut = (k in diff_in_codon)
-            if ar == aq:
-                if has_dna_mut:
-                    # 同义突变 (蓝色)
-                    html += f"<span class='aa aa-s'>{aq}</span>"
-                else:
-                    # 完全一致 (灰色点)
-                    html += f"<span class='aa match'>.</span>"
-            else:
-                # 错义突变 (红色下划线)
-                html += f"<span class='aa aa-m'>{aq}</span>"
-        html += "</div></div>"
-
-    html += "</div>"
-    return html
+
+# ==========================================
+# 4. 批量比对 (1 个参考 vs N 个克隆)
+# ==========================================
+def show_batch():
+    ref_seq = st.text_area("Reference (DNA，读码框从第 1 位开始)", height=120, key="batch_ref")
+    uploaded = st.file_uploader("📂 上传克隆序列 (FASTA / Excel / CSV)",
+                                type=['fasta', 'fa', 'fas', 'txt', 'xlsx', 'csv'], key="batch_clones")
+
+    if st.button("🚀 开始批量比对", type="primary"):
+        ref = clean_dna(ref_seq)
+        ref = ref[:len(ref) - len(ref) % 3]
+        if not ref or not uploaded:
+            st.error("请先输入参考序列并上传克隆文件")
+            return
+        try:
+            names, seqs = read_clones(uploaded)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        if not seqs:
+            st.error("克隆文件中没有序列")
+            return
+
+        # 按块流式返回，边算边刷新汇总表
+        bar = st.progress(0.0, text="比对中...")
+        live = st.empty()
+        chunks, done = [], 0
+        for chunk in iter_align_clones(ref, seqs, names):
+            chunks.append(chunk)
+            done += len(chunk[1])
+            bar.progress(done / len(seqs), text=f"比对中... {done}/{len(seqs)}")
+            live.dataframe(collect_results(chunks, len(ref) // 3)[0], use_container_width=True, height=250)
+        bar.empty()
+        live.empty()
+
+        df_summary, df_mut, codes = collect_results(chunks, len(ref) // 3)
+        st.session_state['batch_align'] = {"summary": df_summary, "mutations": df_mut, "codes": codes,
+                                           "ref": ref, "seqs": seqs, "ref_aa": str(Seq(ref).translate())}
+
+    res = st.session_state.get('batch_align')
+    if not res:
+        return
+    df_summary, df_mut, codes, ref_aa = res["summary"], res["mutations"], res["codes"], res["ref_aa"]
+
+    ok = df_summary["Status"] == "OK"
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("克隆数", len(df_summary))
+    c2.metric("比对成功", int(ok.sum()))
+    c3.metric("含错义/无义", int(((df_summary["Missense"] + df_summary["Nonsense"]) > 0).sum()))
+    c4.metric("含插入/缺失", int(((df_summary["Deletion"] + df_summary["Insertion"]) > 0).sum()))
+
+    t1, t2, t3, t4 = st.tabs(["🗺️ 突变矩阵", "📋 克隆汇总", "🧬 突变明细", "🔍 单克隆比对"])
+    with t1:
+        st.plotly_chart(mutation_heatmap(codes, df_summary["Clone"], ref_aa), use_container_width=True)
+        freq = position_frequency(codes)
+        freq.index = [f"{aa}{i + 1}" for i, aa in enumerate(ref_aa[:len(freq)])]
+        hot = freq[freq.sum(axis=1) > 0]
+        if not hot.empty:
+            st.markdown("**突变热点 (位点 x 克隆数)**")
+            st.bar_chart(hot.drop(columns="Insertion", errors="ignore"))
+        matrix = mutation_matrix(codes, df_summary["Clone"], ref_aa)
+        st.download_button("📥 下载突变矩阵 (CSV)", matrix.to_csv().encode("utf-8-sig"),
+                           "mutation_matrix.csv", "text/csv")
+    with t2:
+        st.dataframe(df_summary, use_container_width=True)
+        st.download_button("📥 下载克隆汇总 (CSV)", df_summary.to_csv(index=False).encode("utf-8-sig"),
+                           "clone_summary.csv", "text/csv")
+    with t3:
+        types = st.multiselect("突变类型", ["Missense", "Nonsense", "Silent", "Deletion", "Insertion"],
+                               default=["Missense", "Nonsense", "Deletion", "Insertion"])
+        st.dataframe(df_mut[df_mut["Type"].isin(types)], use_container_width=True)
+        st.download_button("📥 下载突变明细 (CSV)", df_mut.to_csv(index=False).encode("utf-8-sig"),
+                           "mutations.csv", "text/csv")
+    with t4:
+        idx = st.selectbox("选择克隆", range(len(df_summary)), format_func=lambda i: df_summary["Clone"].iloc[i])
+        ca = codon_align(res["ref"], res["seqs"][idx])
+        if ca is None:
+            st.warning("该克隆无法比对")
+        else:
+            ref_nt, clone_nt, _, _ = aligned_strings(res["ref"], res["seqs"][idx], ca)
+            show_alignment_view(AlignmentView(ref_nt, clone_nt), key=f"batch_page_{idx}")
 
 
 # ==========================================
-# 4. 主入口 show 函数
+# 5. 主入口 show 函数
 # ==========================================
 def show():
     st.header("⚖️ 序列差异比对与 3D 成药性扫描")
 
+    mode = st.radio("比对模式", ["单克隆 (1 vs 1)", "批量 (1 vs N)"], horizontal=True)
+    if mode.startswith("批量"):
+        show_batch()
+        return
+
     col_a, col_b = st.columns(2)
     with col_a:
         ref_seq = st.text_area("Reference (DNA)",
@@ -180,35 +327,110 @@ def show():
     with cp1:
         uploaded_pdb = st.file_uploader("📂 上传参考结构 (.pdb)", type=['pdb'])
     with cp2:
-        offset = st.number_input("PDB 序号偏移量", value=0, help="如果PDB第一个残基序号是10，序列是从1开始，请输入9")
+        map_mode = st.radio("残基映射", ["自动 (序列比对)", "手动偏移"],
+                            help="自动：提取结构链序列与克隆比对，支持插入码、缺失残基和多链")
+        offset = 0
+        if map_mode == "手动偏移":
+            offset = st.number_input("PDB 序号偏移量", value=0, help="如果PDB第一个残基序号是10，序列是从1开始，请输入9")
+
+    struct, pdb_chain, show_chains, spin, exposed_only = None, None, None, False, False
+    if uploaded_pdb:
+        try:
+            # 按内容哈希缓存，重跑页面不会重复解析
+            struct = load_structure(uploaded_pdb.getvalue().decode("utf-8", "replace"))
+        except ValueError as e:
+            st.error(f"PDB 解析失败: {e}")
+        if struct:
+            chain_ids = protein_chains(struct)
+            cs1, cs2, cs3 = st.columns([1, 2, 1])
+            pdb_chain = cs1.selectbox("克隆对应的链", (["自动"] if map_mode.startswith("自动") else []) + chain_ids)
+            pdb_chain = None if pdb_chain == "自动" else pdb_chain
+            show_chains = cs2.multiselect("显示的链", chain_ids, default=chain_ids,
+                                          help="未选中的链、水、配体和氢原子不会发送到浏览器")
+            spin = cs3.checkbox("自动旋转", value=False)
+            exposed_only = cs3.checkbox("只高亮暴露的风险", value=False,
+                                        help=f"相对可及性 RSA ≥ {EXPOSED_RSA:.0%} 视为暴露；包埋的风险位点通常可以忽略")
 
     if st.button("🚀 开始双维综合分析", type="primary"):
-        s1, s2 = ref_seq.replace("\n", "").strip().upper(), clone_seq.replace("\n", "").strip().upper()
-        if len(s1) != len(s2):
-            st.error("⚠️ 序列长度不一致，无法进行 3D 映射。")
-            return
-
-        # 1. 序列比对
-        st.markdown("#### 1️⃣ 序列对比视图")
-        st.markdown(render_dna_protein_alignment(s1, s2), unsafe_allow_html=True)
-
-        # 2. 逻辑计算
-        ref_aa = str(Seq(s1).translate())
-        clone_aa = str(Seq(s2).translate())
-        mutated_indices = [i + 1 for i, (r, q) in enumerate(zip(ref_aa, clone_aa)) if r != q]
-        risks, risk_indices = scan_liabilities(clone_aa)
-
-        # 3. 风险展示
-        if risks:
-            st.warning("⚠️ 检测到成药性风险位点：")
-            st.table(risks)
-        else:
-            st.success("✅ 未检测到明显的成药性基序风险。")
-
-        # 4. 3D 渲染
-        if uploaded_pdb:
-            st.markdown("#### 2️⃣ 3D 空间风险投影 (红色:突变 / 黄色:风险)")
-            pdb_str = uploaded_pdb.getvalue().decode("utf-8")
-            render_3d_structure(pdb_str, mutated_indices, risk_indices, offset)
+        s1, s2 = clean_dna(ref_seq), clean_dna(clone_seq)
+        if len(s1) == len(s2):
+            ref_nt, clone_nt = s1, s2
+            ref_aa = str(Seq(s1[:len(s1) - len(s1) % 3]).translate())
+            clone_aa = str(Seq(s2[:len(s2) - len(s2) % 3]).translate())
+            mutated_indices = [i + 1 for i, (r, q) in enumerate(zip(ref_aa, clone_aa)) if r != q]
         else:
-            st.info("ℹ️ 上传 PDB 文件后即可查看 3D 空间投影。")
\ No newline at end of file
+            # 长度不一致 (插入/缺失)：按密码子比对后再逐位对照，突变按参考编号
+            s1 = s1[:len(s1) - len(s1) % 3]
+            ca = codon_align(s1, s2)
+            if ca is None:
+                st.error("⚠️ 序列过短，无法比对。")
+                return
+            ref_nt, clone_nt, _, _ = aligned_strings(s1, s2, ca)
+            ref_aa, clone_aa = ca["ref_aa"], ca["clone_aa"]
+            mutated_indices = [m["Ref Pos"] for m in classify_clone(s1, s2)["mutations"]
+                               if m["Type"] in ("Missense", "Nonsense", "Deletion")]
+            st.info("ℹ️ 序列长度不一致，已按密码子比对 (突变位点按参考编号)。")
+        risks, risk_indices = scan_liabilities(clone_aa, regions=annotate_protein(clone_aa)["Regions"])
+        st.session_state['pairwise'] = {"view": AlignmentView(ref_nt, clone_nt), "mutated": mutated_indices,
+                                        "risks": risks, "risk_indices": risk_indices,
+                                        "ref_aa": ref_aa, "clone_aa": clone_aa, "ref_dna": s1, "clone_dna": s2}
+
+    res = st.session_state.get('pairwise')
+    if not res:
+        return
+
+    # 1. 序列比对 (分页渲染，只生成当前页)
+    st.markdown("#### 1️⃣ 序列对比视图")
+    show_alignment_view(res["view"], key="pairwise_page")
+
+    # 2. 风险展示
+    if res["risks"]:
+        st.warning("⚠️ 检测到成药性风险位点：")
+        st.table(res["risks"])
+    else:
+        st.success("✅ 未检测到明显的成药性基序风险。")
+
+    # 3. 3D 渲染
+    if struct:
+        st.markdown("#### 2️⃣ 3D 空间风险投影 (红色:突变 / 黄色:风险)")
+        pdb_str = uploaded_pdb.getvalue().decode("utf-8", "replace")
+        # 突变位点按参考编号、风险位点按克隆编号，分别映射到结构
+        manual = None if map_mode.startswith("自动") else offset
+        mut_keys, mapping = structure_keys(struct, res["ref_aa"], res["mutated"], pdb_chain, manual)
+        risk_keys, _ = structure_keys(struct, res["clone_aa"], res["risk_indices"], pdb_chain, manual)
+        if mapping:
+            st.caption(f"自动映射到链 {mapping['chain']}：一致度 {mapping['identity']:.1f}%，"
+                       f"覆盖 {mapping['coverage']:.1f}%；突变残基 {', '.join(map(residue_label, mut_keys)) or '-'}")
+        # 残基 SASA 按结构缓存，只在第一次分析该结构时计算
+        risk_rsa = residue_exposure(struct, risk_keys)
+        shown_risks = [k for k, v in zip(risk_keys, risk_rsa) if v >= EXPOSED_RSA] if exposed_only else risk_keys
+        render_3d_structure(pdb_str, mut_keys, shown_risks, chains=show_chains or None, spin=spin)
+
+        st.markdown("#### 3️⃣ 结构暴露度分析")
+        if res["risks"]:
+            df_risk = pd.DataFrame(res["risks"])
+            # 每个风险位点单独映射 (未映射到结构的位点 RSA 为空)
+            site_keys = [structure_keys(struct, res["clone_aa"], [p], pdb_chain, manual)[0] for p in df_risk["位点"]]
+            df_risk["结构残基"] = [residue_label(k[0]) if k else "-" for k in site_keys]
+            df_risk["RSA"] = [residue_exposure(struct, k)[0] if k else np.nan for k in site_keys]
+            df_risk["暴露"] = np.where(df_risk["RSA"] >= EXPOSED_RSA, "是", "否")
+            st.dataframe(df_risk, use_container_width=True, hide_index=True)
+            st.markdown("**风险位点三维聚集 (8 Å)**")
+            # 基序覆盖的每个残基 -> 基序名 (同一残基属于多个基序时用 / 连接)，与结构键一一对应
+            site_motifs = {}
+            for r in res["risks"]:
+                for p in range(r["位点"], r["位点"] + len(r["基序"])):
+                    site_motifs.setdefault(p, []).append(r["基序"])
+            cluster_keys, cluster_motifs = [], []
+            for p, names in sorted(site_motifs.items()):
+                k = structure_keys(struct, res["clone_aa"], [p], pdb_chain, manual)[0]
+                if k:
+                    cluster_keys.append(k[0])
+                    cluster_motifs.append("/".join(dict.fromkeys(names)))
+            st.dataframe(liability_clusters(struct, cluster_keys, cluster_motifs), use_container_width=True,
+                         hide_index=True)
+        st.markdown("**暴露疏水补丁**")
+        st.dataframe(hydrophobic_patches(struct, chains=show_chains or None), use_container_width=True,
+                     hide_index=True)
+    else:
+        st.info("ℹ️ 上传 PDB 文件后即可查看 3D 空间投影。")
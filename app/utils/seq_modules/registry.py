@@ -0,0 +1,295 @@
+import hashlib
+import re
+import time
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+import requests
+
+# ==========================================
+# 0. 常量
+# ==========================================
+COLLECTION = "sequences"
+BATCH_SIZE = 50             # 每次批量请求的记录数 (PocketBase Batch API 默认上限 maxRequests = 50)
+LOOKUP_CHUNK = 50           # 按哈希查询已有记录时每个 filter 包含的哈希数 (控制 URL 长度)
+KMER_K = 3                  # k-mer 索引长度 (CDR3 等短肽用 3)
+INDEX_FIELDS = ("clone_id", "cdr3", "protein", "dna")
+# 归属 / 来源字段：seq_hash 全局唯一，同一序列被其他项目再次登记时不能改写原记录的归属，只在为空时补填
+OWNER_FIELDS = ("project_id", "name", "clone_id", "source", "experiment", "inventory")
+# 写入 / 比较的业务字段 (不含 id 和关联)
+FIELDS = ("seq_hash", "name", "project_id", "clone_id", "chain", "source", "dna", "protein", "protein_hash",
+          "cdr1", "cdr2", "cdr3")
+
+
+# ==========================================
+# 1. 规范化 + 哈希
+# ==========================================
+def normalize_dna(seq):
+    """大写、去空白 / 缺口 / 数字，U -> T"""
+    return re.sub(r"[^A-Z]", "", str(seq or "").upper()).replace("U", "T")
+
+
+def normalize_protein(seq):
+    """大写、去空白 / 缺口，去掉末尾终止符"""
+    return re.sub(r"[^A-Z*]", "", str(seq or "").upper()).rstrip("*")
+
+
+def content_hash(dna="", protein=""):
+    """
+    去重键：有 DNA 时按 DNA 计算，否则按蛋白计算 (加前缀区分，两者不会冲突)
+    同一条 DNA 无论从哪个页面、以什么名字保存，都只对应一条记录
+    """
+    dna, protein = normalize_dna(dna), normalize_protein(protein)
+    key = f"dna:{dna}" if dna else f"aa:{protein}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def build_records(df, project_id="", source="Manual", experiment=None, inventory=None):
+    """
+    结果表 -> 待写入的记录列表 (批内按 seq_hash 去重，保留第一条)
+    df 需含 Name，以及 DNA / Protein Seq 中至少一列；Chain / CDR1-3 可选
+    inventory: {样本编号: 库存记录 id}，按克隆名关联库存
+    """
+    inventory = inventory or {}
+    records, seen = [], set()
+    for row in df.to_dict(orient="records"):
+        dna, protein = normalize_dna(row.get("DNA", "")), normalize_protein(row.get("Protein Seq", ""))
+        if not dna and not protein:
+            continue
+        h = content_hash(dna, protein)
+        if h in seen:
+            continue
+        seen.add(h)
+        clone = str(row.get("Clone", row.get("Name", ""))).strip()
+        rec = {"seq_hash": h, "name": str(row.get("Name", "")), "project_id": project_id, "clone_id": clone,
+               "chain": str(row.get("Chain", "") or ""), "source": source, "dna": dna, "protein": protein,
+               "protein_hash": hashlib.sha1(protein.encode()).hexdigest() if protein else "",
+               "cdr1": normalize_protein(row.get("CDR1", "")), "cdr2": normalize_protein(row.get("CDR2", "")),
+               "cdr3": normalize_protein(row.get("CDR3", ""))}
+        if experiment:
+            rec["experiment"] = experiment
+        if clone in inventory:
+            rec["inventory"] = inventory[clone]
+        records.append(rec)
+    return records
+
+
+def inventory_lookup(inventory_records):
+    """库存记录 -> {sample_id: id}，用于把序列挂到对应的库存样本上"""
+    return {str(getattr(r, "sample_id", "")).strip(): r.id for r in inventory_records
+            if str(getattr(r, "sample_id", "")).strip()}
+
+
+# ==========================================
+# 2. 批量 upsert
+# ==========================================
+def _record_dict(rec):
+    """SDK 记录对象 / dict -> dict"""
+    if isinstance(rec, dict):
+        return rec
+    return {k: getattr(rec, k, "") for k in ("id", *FIELDS, "experiment", "inventory")}
+
+
+def fetch_existing(client, hashes):
+    """按 seq_hash 分块查询已有记录 -> {seq_hash: 记录 dict} (走唯一索引)"""
+    hashes = list(dict.fromkeys(hashes))
+    found = {}
+    for i in range(0, len(hashes), LOOKUP_CHUNK):
+        chunk = hashes[i:i + LOOKUP_CHUNK]
+        flt = " || ".join(f'seq_hash = "{h}"' for h in chunk)
+        for rec in client.collection(COLLECTION).get_full_list(query_params={"filter": flt}):
+            rec = _record_dict(rec)
+            found[rec["seq_hash"]] = rec
+    return found
+
+
+def plan_upsert(records, existing):
+    """
+    -> (新建列表, 更新列表 [(id, 变化字段)], 未变化条数)
+    已有记录只更新有变化且新值非空的字段，不会用空值覆盖已有的注释 / 关联；
+    OWNER_FIELDS (项目 / 名称 / 克隆号 / 来源 / 关联) 只在原记录为空时补填，不改写原归属
+    """
+    creates, updates, unchanged = [], [], 0
+    for rec in records:
+        old = existing.get(rec["seq_hash"])
+        if old is None:
+            creates.append(rec)
+            continue
+        diff = {k: v for k, v in rec.items() if v not in ("", None) and old.get(k) != v
+                and (k not in OWNER_FIELDS or old.get(k) in ("", None))}
+        if diff:
+            updates.append((old["id"], diff))
+        else:
+            unchanged += 1
+    return creates, updates, unchanged
+
+
+def _filter(client, expr, params):
+    """参数化 filter：优先用 SDK 的 client.filter，旧版 SDK 按同样规则转义字符串"""
+    if hasattr(client, "filter"):
+        return client.filter(expr, params)
+    for k, v in params.items():
+        v = "'" + str(v).replace("\\", "\\\\").replace("'", "\\'") + "'" if isinstance(v, str) else str(v)
+        expr = expr.replace("{:" + k + "}", v)
+    return expr
+
+
+def _send_batch(base_url, token, items):
+    """PocketBase /api/batch (需在设置中启用 Batch API)；返回 (是否成功, 失败原因)"""
+    body = {"requests": [
+        {"method": "POST", "url": f"/api/collections/{COLLECTION}/records", "body": data} if rid is None else
+        {"method": "PATCH", "url": f"/api/collections/{COLLECTION}/records/{rid}", "body": data}
+        for rid, data in items]}
+    try:
+        res = requests.post(f"{base_url.rstrip('/')}/api/batch", json=body, headers={"Authorization": token},
+                            timeout=30)
+    except requests.RequestException as e:
+        return False, f"Batch API 请求失败: {e}"
+    if res.status_code == 200:
+        return True, None
+    try:
+        message = res.json().get("message", "")
+    except ValueError:
+        message = res.text[:200]
+    return False, f"Batch API 返回 HTTP {res.status_code}: {message}"
+
+
+def upsert_sequences(client, records, batch_size=BATCH_SIZE, progress=None):
+    """
+    批量 upsert：先按哈希批量查出已有记录，再分批新建 / 更新
+    优先使用 Batch API (每批一个事务、一次请求)；服务端未启用或拒绝时退回逐条 create / update
+    返回统计 dict: created / updated / unchanged / failed / fallback (退回逐条写入的原因，未退回为 None)
+    """
+    existing = fetch_existing(client, [r["seq_hash"] for r in records])
+    creates, updates, unchanged = plan_upsert(records, existing)
+    items = [(None, r) for r in creates] + updates
+    stats = {"created": 0, "updated": 0, "unchanged": unchanged, "failed": 0, "fallback": None}
+    for i in range(0, len(items), batch_size):
+        chunk = items[i:i + batch_size]
+        if stats["fallback"] is None:
+            _, stats["fallback"] = _send_batch(client.base_url, client.auth_store.token, chunk)
+        if stats["fallback"] is None:
+            ok = [True] * len(chunk)
+        else:
+            ok = []
+            for rid, data in chunk:
+                try:
+                    if rid is None:
+                        client.collection(COLLECTION).create(data)
+                    else:
+                        client.collection(COLLECTION).update(rid, data)
+                    ok.append(True)
+                except Exception:
+                    ok.append(False)
+        for (rid, _), good in zip(chunk, ok):
+            stats["failed" if not good else "created" if rid is None else "updated"] += 1
+        if progress:
+            progress(min(1.0, (i + len(chunk)) / len(items)))
+    return stats
+
+
+def fetch_registry(client, project_id=None):
+    """读取序列库 (可按项目过滤) -> DataFrame"""
+    params = {"filter": _filter(client, "project_id = {:pid}", {"pid": project_id})} if project_id else {}
+    rows = [_record_dict(r) for r in client.collection(COLLECTION).get_full_list(query_params=params)]
+    return pd.DataFrame(rows, columns=["id", *FIELDS, "experiment", "inventory"])
+
+
+# ==========================================
+# 3. 本地索引 (精确 / 前缀 / k-mer)
+# ==========================================
+class SequenceIndex:
+    """
+    序列库的内存索引，构建一次后查询为毫秒级:
+      exact  : 哈希表
+      prefix : 排序键 + 二分
+      kmer   : 倒排表 (k-mer -> 行号)，按共享 k-mer 比例排序
+    """
+
+    def __init__(self, df, fields=INDEX_FIELDS, k=KMER_K):
+        self.df = df.reset_index(drop=True)
+        self.k = k
+        self._exact, self._sorted, self._kmers = {}, {}, {}
+        for field in fields:
+            values = self.df[field].fillna("").astype(str).to_numpy()
+            exact = {}
+            for i, v in enumerate(values):
+                if v:
+                    exact.setdefault(v, []).append(i)
+            self._exact[field] = exact
+            self._sorted[field] = sorted(exact)
+            self._kmers[field] = None       # k-mer 倒排表按需构建
+
+    def _rows(self, rows):
+        return self.df.iloc[sorted(rows)]
+
+    def exact(self, field, value):
+        return self._rows(self._exact[field].get(value, []))
+
+    def prefix(self, field, value):
+        keys = self._sorted[field]
+        lo, hi = bisect_left(keys, value), bisect_right(keys, value + "\uffff")
+        return self._rows([i for key in keys[lo:hi] for i in self._exact[field][key]])
+
+    def _kmer_table(self, field):
+        if self._kmers[field] is None:
+            table = {}
+            for key, rows in self._exact[field].items():
+                for km in {key[j:j + self.k] for j in range(len(key) - self.k + 1)}:
+                    table.setdefault(km, []).extend(rows)
+            self._kmers[field] = {km: np.asarray(rows, dtype=np.int64) for km, rows in table.items()}
+        return self._kmers[field]
+
+    def kmer(self, field, query, min_shared=0.5, limit=100):
+        """
+        与 query 共享 k-mer 比例 >= min_shared 的记录 (相似 CDR3 / 片段检索)
+        返回按 Shared (%) 降序的 DataFrame
+        """
+        table = self._kmer_table(field)
+        qk = {query[j:j + self.k] for j in range(len(query) - self.k + 1)}
+        hits = [table[km] for km in qk if km in table]
+        if not qk or not hits:
+            return self.df.iloc[:0].assign(**{"Shared (%)": []})
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.df))
+        shared = 100.0 * counts / len(qk)
+        rows = np.flatnonzero(shared >= 100.0 * min_shared)
+        rows = rows[np.argsort(-shared[rows], kind="stable")][:limit]
+        return self.df.iloc[rows].assign(**{"Shared (%)": shared[rows].round(1)})
+
+    def shared(self, field="cdr3", min_clones=2):
+        """同一 field 值被多个克隆共享的分组 -> DataFrame (值 / 克隆数 / 克隆列表)"""
+        rows = []
+        for value, idx in self._exact[field].items():
+            clones = sorted(set(self.df["clone_id"].to_numpy()[idx]))
+            if len(clones) >= min_clones:
+                rows.append({field.upper(): value, "Clones": len(clones), "Clone IDs": ", ".join(clones)})
+        return pd.DataFrame(rows, columns=[field.upper(), "Clones", "Clone IDs"]).sort_values(
+            "Clones", ascending=False, ignore_index=True)
+
+
+# ==========================================
+# 4. 基准测试
+# ==========================================
+def benchmark_index(n=100_000, seed=0):
+    """构建索引 + 三类查询耗时；运行: python -m utils.seq_modules.registry"""
+    rng = np.random.default_rng(seed)
+    aa = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+    cdr3 = [aa[rng.integers(0, 20, rng.integers(8, 18))].tobytes().decode() for _ in range(n // 10)]
+    df = pd.DataFrame({"clone_id": [f"C{i}" for i in range(n)], "cdr3": [cdr3[i] for i in rng.integers(0, len(cdr3), n)],
+                       "protein": "", "dna": ""})
+    t0 = time.perf_counter()
+    index = SequenceIndex(df)
+    t_build = time.perf_counter() - t0
+    q = cdr3[0]
+    timings = {}
+    for name, fn in (("exact", lambda: index.exact("cdr3", q)), ("prefix", lambda: index.prefix("cdr3", q[:4])),
+                     ("kmer (cold)", lambda: index.kmer("cdr3", q)), ("kmer", lambda: index.kmer("cdr3", q))):
+        t0 = time.perf_counter()
+        fn()
+        timings[f"{name} (ms)"] = 1000 * (time.perf_counter() - t0)
+    return pd.DataFrame([{"Records": n, "Build (s)": t_build, **timings}])
+
+
+if __name__ == "__main__":
+    print(benchmark_index().to_string(index=False))
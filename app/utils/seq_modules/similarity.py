@@ -0,0 +1,314 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from Bio.Align import PairwiseAligner
+
+DNA_ALPHABET = "ACGT"
+PROTEIN_ALPHABET = "ACDEFGHIKLMNPQRSTVWY"
+DEFAULT_K = {"dna": 8, "protein": 3}
+
+SIMILARITY_METHODS = ("auto", "align", "kmer", "minhash")
+AUTO_ALIGN_MAX = 200        # auto 模式下 n 不超过该值时用精确比对，否则用 k-mer
+# 所有算法统一输出“一致度”估计 (0-1)，同一个阈值对 align / kmer / minhash 含义相同:
+#   align         比对回溯后的真实一致度 (相同残基数 / 比对列数)
+#   kmer/minhash  由 k-mer Jaccard 换算的 Mash 一致度 1 + ln(2J / (1 + J)) / k
+
+
+# ==========================================
+# 1. 编码
+# ==========================================
+def detect_alphabet(seqs):
+    """全部字符都在 ACGTUN 内视为核酸，否则按蛋白处理"""
+    chars = set("".join(seqs))
+    return "dna" if chars <= set("ACGTUN-") else "protein"
+
+
+def clean_sequences(seqs):
+    """去空白、转大写、U -> T"""
+    return ["".join(str(s).split()).upper().replace("U", "T") for s in seqs]
+
+
+def _lookup_table(alphabet):
+    """ASCII -> 字母表序号 (uint8)，不在字母表内的字符记为 255"""
+    lut = np.full(256, 255, dtype=np.uint8)
+    lut[np.frombuffer(alphabet.encode(), dtype=np.uint8)] = np.arange(len(alphabet), dtype=np.uint8)
+    return lut
+
+
+def encode_sequences(seqs, alphabet):
+    """序列 -> uint8 整数数组列表"""
+    lut = _lookup_table(alphabet)
+    return [lut[np.frombuffer(s.encode("ascii", "replace"), dtype=np.uint8)] for s in seqs]
+
+
+def kmer_codes(encoded, k, base):
+    """
+    单条序列的 k-mer 整数编码 (去重)
+    含未知字符 (N / X 等) 的 k-mer 会被丢弃
+    """
+    if encoded.size < k:
+        return np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(encoded, k)
+    windows = windows[(windows != 255).all(axis=1)].astype(np.int64)
+    powers = base ** np.arange(k - 1, -1, -1, dtype=np.int64)
+    return np.unique(windows @ powers)
+
+
+def kmer_matrix(seqs, k=None, alphabet=None):
+    """
+    所有序列的 k-mer 存在矩阵 (CSR, n x base^k)，返回 (X, 每条序列 k-mer 数)
+    """
+    kind = alphabet or detect_alphabet(seqs)
+    letters = DNA_ALPHABET if kind == "dna" else PROTEIN_ALPHABET
+    k = k or DEFAULT_K[kind]
+    codes = [kmer_codes(e, k, len(letters)) for e in encode_sequences(seqs, letters)]
+    sizes = np.array([c.size for c in codes], dtype=np.int64)
+    indptr = np.r_[0, np.cumsum(sizes)]
+    indices = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+    X = sparse.csr_matrix((np.ones(indices.size, dtype=np.int32), indices, indptr),
+                          shape=(len(seqs), len(letters) ** k))
+    return X, sizes
+
+
+# ==========================================
+# 2. 上三角索引 & 分块
+# ==========================================
+def condensed_index(n, i):
+    """压缩向量 (scipy squareform 顺序) 中第 i 行 (j > i) 的起始位置"""
+    return n * i - i * (i + 1) // 2
+
+
+def _row_blocks(n, n_blocks):
+    """把上三角按 pair 数均分为若干行区间 [(i0, i1), ...]"""
+    pairs = np.arange(n - 1, 0, -1, dtype=np.int64)  # 第 i 行有 n-1-i 对
+    if pairs.size == 0:
+        return []
+    bounds = np.searchsorted(np.cumsum(pairs), np.linspace(0, pairs.sum(), n_blocks + 1)[1:-1])
+    edges = np.unique(np.r_[0, bounds + 1, n - 1])
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def to_square(condensed, n, diagonal=1.0):
+    """压缩向量 -> 对称方阵"""
+    mat = np.empty((n, n), dtype=np.float32)
+    iu = np.triu_indices(n, k=1)
+    mat[iu] = condensed
+    mat.T[iu] = condensed
+    np.fill_diagonal(mat, diagonal)
+    return mat
+
+
+# ==========================================
+# 3. 各算法的分块任务 (在子进程中执行)
+# ==========================================
+_WORKER = {}
+
+
+def _init_worker(payload):
+    _WORKER.clear()
+    _WORKER.update(payload)
+
+
+def mash_identity(jaccard, k):
+    """k-mer Jaccard -> Mash 一致度估计 1 - D，D = -ln(2J / (1 + J)) / k；J = 0 时为 0"""
+    j = np.asarray(jaccard, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ident = 1.0 + np.log(2.0 * j / (1.0 + j)) / k
+    return np.clip(np.where(j > 0, ident, 0.0), 0.0, 1.0).astype(np.float32)
+
+
+def alignment_identity(alignment, a, b):
+    """比对 -> 一致度 (相同残基数 / 比对列数，两端缺口计入列数)；a / b 为 uint8 编码的序列"""
+    coords = alignment.coordinates
+    same, cols = 0, 0
+    for (a0, b0), (a1, b1) in zip(coords.T[:-1], coords.T[1:]):
+        cols += max(a1 - a0, b1 - b0)
+        if a1 > a0 and b1 > b0:
+            same += int((a[a0:a1] == b[b0:b1]).sum())
+    return same / cols if cols else 0.0
+
+
+def _align_rows(i0, i1):
+    """
+    精确比对：match=1 / mismatch=-1 / gap -2,-1，先只算得分
+    得分 > 0 (一致度约 > 50%) 的序列对回溯比对，取真实一致度；
+    其余按无缺口近似 (1 + 得分 / max(La, Lb)) / 2 估计，远低于任何有意义的阈值，省去回溯
+    """
+    seqs, codes = _WORKER["seqs"], _WORKER["codes"]
+    lengths = _WORKER["lengths"]
+    aligner = PairwiseAligner(mode="global", match_score=1.0, mismatch_score=-1.0,
+                              open_gap_score=-2.0, extend_gap_score=-1.0)
+
+    out = []
+    for i in range(i0, i1):
+        a = seqs[i]
+        scores = np.array([aligner.score(a, b) if a and b else -np.inf for b in seqs[i + 1:]], dtype=np.float64)
+        denom = np.maximum(lengths[i], lengths[i + 1:])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ident = np.clip(np.where(denom > 0, (1.0 + scores / denom) / 2.0, 0.0), 0.0, 1.0)
+        for j in np.flatnonzero(scores > 0):
+            b = i + 1 + j
+            ident[j] = alignment_identity(aligner.align(a, seqs[b])[0], codes[i], codes[b])
+        out.append(ident.astype(np.float32))
+    return i0, out
+
+
+def _kmer_rows(i0, i1):
+    """k-mer Jaccard：交集 = X_block · X^T (稀疏乘法)，并集 = |A| + |B| - 交集；换算为 Mash 一致度"""
+    X, sizes = _WORKER["X"], _WORKER["sizes"]
+    inter = (X[i0:i1] @ X[i0:].T).toarray().astype(np.float32)
+    union = sizes[i0:i1, None] + sizes[None, i0:] - inter
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jac = np.where(union > 0, inter / union, 0.0)
+    ident = mash_identity(jac, _WORKER["k"])
+    return i0, [ident[r, r + 1:] for r in range(i1 - i0)]
+
+
+def _minhash_rows(i0, i1):
+    """MinHash 估计 Jaccard (签名逐位相等的比例)，换算为 Mash 一致度"""
+    sig = _WORKER["sig"]
+    eq = (sig[i0:i1, None, :] == sig[None, i0:, :]).mean(axis=2, dtype=np.float32)
+    ident = mash_identity(eq, _WORKER["k"])
+    return i0, [ident[r, r + 1:] for r in range(i1 - i0)]
+
+
+def _mix64(x):
+    """splitmix64 混合函数 (uint64 乘法按 2^64 回绕)"""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash_signatures(X, n_hashes=128, seed=0):
+    """
+    k-mer 集合 -> MinHash 签名 (n x n_hashes, uint64)
+    哈希族 h_i(x) = mix64(x XOR seed_i)；空集合签名全为最大值
+    """
+    seeds = np.random.default_rng(seed).integers(0, np.iinfo(np.int64).max, n_hashes).astype(np.uint64)
+    sig = np.full((X.shape[0], n_hashes), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i in range(X.shape[0]):
+        codes = X.indices[X.indptr[i]:X.indptr[i + 1]].astype(np.uint64)
+        if codes.size:
+            sig[i] = _mix64(codes[None, :] ^ seeds[:, None]).min(axis=1)
+    return sig
+
+
+_TASKS = {"align": _align_rows, "kmer": _kmer_rows, "minhash": _minhash_rows}
+
+
+def resolve_method(method, n):
+    """auto -> 实际使用的算法 (n <= AUTO_ALIGN_MAX 用 align，否则 kmer)"""
+    if method == "auto":
+        return "align" if n <= AUTO_ALIGN_MAX else "kmer"
+    return method
+
+
+# ==========================================
+# 4. 主入口
+# ==========================================
+def pairwise_similarity(seqs, method="auto", k=None, n_hashes=128, n_jobs=None, progress=None):
+    """
+    计算全部序列两两一致度 (0-1)，只算上三角，返回压缩向量 (长度 n(n-1)/2，scipy squareform 顺序)
+    method:
+        align   - PairwiseAligner 比对回溯的真实一致度，适合几百条以内
+        kmer    - k-mer 集合 Jaccard (稀疏矩阵乘法) 换算的 Mash 一致度，可扩展到数千条
+        minhash - MinHash 签名估计 Jaccard 再换算 Mash 一致度，内存与序列长度无关
+        auto    - n <= AUTO_ALIGN_MAX 用 align，否则 kmer
+    n_jobs: 进程数 (默认 CPU 核数，1 为单进程)
+    progress: 可选回调 progress(已完成比例)
+    """
+    seqs = clean_sequences(seqs)
+    n = len(seqs)
+    method = resolve_method(method, n)
+    if method not in _TASKS:
+        raise ValueError(f"未知相似度算法: {method}")
+    if n < 2:
+        return np.empty(0, dtype=np.float32)
+
+    kind = detect_alphabet(seqs)
+    if method == "align":
+        payload = {"seqs": seqs, "codes": [np.frombuffer(s.encode("ascii", "replace"), dtype=np.uint8) for s in seqs],
+                   "lengths": np.array([len(s) for s in seqs], dtype=np.float32)}
+    else:
+        k = k or DEFAULT_K[kind]
+        X, sizes = kmer_matrix(seqs, k=k, alphabet=kind)
+        payload = {"X": X, "sizes": sizes.astype(np.float32), "k": k}
+        if method == "minhash":
+            payload = {"sig": minhash_signatures(X, n_hashes=n_hashes), "k": k}
+
+    n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+    blocks = _row_blocks(n, max(1, n_jobs * 8) if method == "align" else max(1, n // 64))
+    task = _TASKS[method]
+    condensed = np.empty(n * (n - 1) // 2, dtype=np.float32)
+    done = 0
+
+    def collect(result):
+        nonlocal done
+        i0, rows = result
+        for offset, row in enumerate(rows):
+            start = condensed_index(n, i0 + offset)
+            condensed[start:start + row.size] = row
+            done += row.size
+        if progress:
+            progress(done / condensed.size)
+
+    if n_jobs == 1 or len(blocks) == 1:
+        _init_worker(payload)
+        try:
+            for i0, i1 in blocks:
+                collect(task(i0, i1))
+        finally:
+            _WORKER.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(payload,)) as ex:
+            for result in ex.map(task, *zip(*blocks)):
+                collect(result)
+    return condensed
+
+
+def similarity_matrix(seqs, method="auto", **kwargs):
+    """对称相似度方阵 (float32，对角线为 1)"""
+    return to_square(pairwise_similarity(seqs, method=method, **kwargs), len(seqs))
+
+
+# ==========================================
+# 5. 基准测试
+# ==========================================
+def random_clone_panel(n=5000, length=360, n_families=50, mut_rate=0.05, seed=0):
+    """模拟 NGS 抗体库：n_families 个亲本序列 + 随机点突变"""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list(DNA_ALPHABET))
+    parents = rng.integers(0, 4, (n_families, length))
+    family = rng.integers(0, n_families, n)
+    seqs = parents[family]
+    mutate = rng.random(seqs.shape) < mut_rate
+    seqs = np.where(mutate, rng.integers(0, 4, seqs.shape), seqs)
+    return ["".join(row) for row in letters[seqs]]
+
+
+def benchmark_similarity(sizes=(200, 1000, 5000), methods=("align", "kmer", "minhash"), align_max=300,
+                         n_jobs=None):
+    """
+    各算法在不同序列数下的耗时 (秒)；align 只测到 align_max 条
+    运行: python -m utils.seq_modules.similarity
+    """
+    import pandas as pd
+
+    rows = []
+    for n in sizes:
+        seqs = random_clone_panel(n)
+        for method in methods:
+            if method == "align" and n > align_max:
+                continue
+            t0 = time.perf_counter()
+            sim = pairwise_similarity(seqs, method=method, n_jobs=n_jobs)
+            rows.append({"Sequences": n, "Method": method, "Pairs": sim.size,
+                         "Seconds": time.perf_counter() - t0, "Mean Similarity": float(sim.mean())})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    print(benchmark_similarity().to_string(index=False))
@@ -0,0 +1,231 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from Bio.Align import PairwiseAligner, substitution_matrices
+from Bio.SeqUtils import seq1
+
+# ==========================================
+# 0. 常量
+# ==========================================
+CACHE_MAX = 16              # 最多缓存的结构数 (按 PDB 文本哈希)
+LABEL_MAX = 40              # 单次最多添加的残基标签数 (超出只着色不标注)
+WATER = {"HOH", "WAT", "DOD", "H2O"}
+_CACHE = {}
+
+ATOM_COLUMNS = ["serial", "name", "altloc", "resn", "chain", "resi", "icode", "x", "y", "z", "element", "hetero"]
+
+
+# ==========================================
+# 1. 解析 (每个结构只解析一次)
+# ==========================================
+def structure_key(pdb_text):
+    return hashlib.sha1(pdb_text.encode("utf-8", "replace")).hexdigest()
+
+
+def _element(line, name):
+    elem = line[76:78].strip()
+    if elem:
+        return elem.upper()
+    # 老格式没有元素列：取原子名第一个字母
+    return name.strip().lstrip("0123456789")[:1].upper()
+
+
+def parse_pdb(pdb_text):
+    """
+    PDB 文本 -> 结构 dict (只读第一个 MODEL):
+        key      : 文本 SHA1
+        lines    : ATOM / HETATM 原始行 (ndarray[object])，用于生成精简载荷
+        atoms    : 原子表 (列见 ATOM_COLUMNS)
+        residues : 残基表 (chain / resi / icode / resn / aa / first / last / ca)，按文件顺序
+    """
+    lines, rows = [], []
+    for line in pdb_text.splitlines():
+        rec = line[:6]
+        if rec == "ENDMDL":
+            break
+        if rec not in ("ATOM  ", "HETATM"):
+            continue
+        line = line.ljust(80)
+        try:
+            serial = int(line[6:11])
+            resi = int(line[22:26])
+            xyz = float(line[30:38]), float(line[38:46]), float(line[46:54])
+        except ValueError:
+            continue
+        name = line[12:16]
+        lines.append(line.rstrip())
+        rows.append((serial, name.strip(), line[16].strip(), line[17:20].strip(), line[21].strip(), resi,
+                     line[26].strip(), *xyz, _element(line, name), rec == "HETATM"))
+    if not rows:
+        raise ValueError("PDB 中没有 ATOM / HETATM 记录")
+
+    atoms = pd.DataFrame(rows, columns=ATOM_COLUMNS)
+    # 残基边界：(链, 序号, 插入码) 变化处
+    res_id = atoms[["chain", "resi", "icode"]]
+    new_res = (res_id != res_id.shift()).any(axis=1).to_numpy()
+    atoms["res_index"] = np.cumsum(new_res) - 1
+
+    first = np.flatnonzero(new_res)
+    last = np.r_[first[1:], len(atoms)] - 1
+    residues = atoms.iloc[first][["chain", "resi", "icode", "resn", "hetero"]].reset_index(drop=True)
+    residues["aa"] = [seq1(r) if r not in WATER else "" for r in residues["resn"]]
+    residues["first"], residues["last"] = first, last
+    ca = atoms[(atoms["name"] == "CA") & ~atoms["hetero"]].drop_duplicates("res_index")
+    residues["ca"] = -1
+    residues.loc[ca["res_index"].to_numpy(), "ca"] = ca.index.to_numpy()
+
+    return {"key": structure_key(pdb_text), "lines": np.array(lines, dtype=object), "atoms": atoms,
+            "residues": residues, "_trimmed": {}}
+
+
+def load_structure(pdb_text):
+    """带缓存的解析：同一 PDB 文本 (按 SHA1) 只解析一次，后续重跑直接取缓存"""
+    key = structure_key(pdb_text)
+    if key not in _CACHE:
+        _CACHE[key] = parse_pdb(pdb_text)
+        # 超出上限时丢弃最早写入的结构
+        for k in list(_CACHE)[:max(0, len(_CACHE) - CACHE_MAX)]:
+            del _CACHE[k]
+    return _CACHE[key]
+
+
+def clear_cache():
+    _CACHE.clear()
+
+
+def protein_chains(struct):
+    """含蛋白残基 (有 CA 的标准残基) 的链，按文件顺序"""
+    res = struct["residues"]
+    return list(dict.fromkeys(res.loc[res["ca"] >= 0, "chain"]))
+
+
+# ==========================================
+# 2. 精简载荷
+# ==========================================
+def trimmed_pdb(struct, chains=None, keep_hetero=False, keep_hydrogens=False):
+    """
+    只保留需要的部分再交给 py3Dmol：去掉水、HETATM (配体/离子)、氢原子、备选构象 (altloc 非 A) 和未选中的链
+    结果按参数缓存在结构 dict 中
+    """
+    key = (tuple(chains) if chains else None, keep_hetero, keep_hydrogens)
+    if key not in struct["_trimmed"]:
+        atoms = struct["atoms"]
+        mask = ~atoms["resn"].isin(WATER).to_numpy()
+        mask &= atoms["altloc"].isin(["", "A"]).to_numpy()
+        if not keep_hetero:
+            mask &= ~atoms["hetero"].to_numpy()
+        if not keep_hydrogens:
+            mask &= ~atoms["element"].isin(["H", "D"]).to_numpy()
+        if chains:
+            mask &= atoms["chain"].isin(list(chains)).to_numpy()
+        struct["_trimmed"][key] = "\n".join(struct["lines"][mask]) + "\nEND\n"
+    return struct["_trimmed"][key]
+
+
+# ==========================================
+# 3. 残基选择 (批量)
+# ==========================================
+def residue_rows(struct, keys):
+    """(链, 序号, 插入码) 列表 -> 残基表中的行号 (找不到的忽略)"""
+    res = struct["residues"]
+    lookup = struct.get("_res_lookup")
+    if lookup is None:
+        lookup = struct["_res_lookup"] = {k: i for i, k in enumerate(zip(res["chain"], res["resi"], res["icode"]))}
+    return [lookup[k] for k in keys if k in lookup]
+
+
+def atom_selection(struct, keys, ca_only=False):
+    """
+    残基键 -> 一个 3Dmol 选择 {'serial': [...]}
+    按原子序号选择，插入码 / 多链都不会混淆；整批残基只需一次 setStyle
+    """
+    rows = residue_rows(struct, keys)
+    if not rows:
+        return None
+    res, atoms = struct["residues"], struct["atoms"]
+    if ca_only:
+        idx = res["ca"].to_numpy()[rows]
+        idx = idx[idx >= 0]
+    else:
+        idx = np.concatenate([np.arange(a, b + 1) for a, b in zip(res["first"].to_numpy()[rows],
+                                                                 res["last"].to_numpy()[rows])])
+    return {"serial": atoms["serial"].to_numpy()[idx].tolist()} if len(idx) else None
+
+
+# ==========================================
+# 4. 序列 -> 结构残基映射
+# ==========================================
+MAP_CACHE_MAX = 512
+_MAP_CACHE = {}
+
+
+def chain_sequence(struct, chain):
+    """链上有 CA 的残基 -> (单字母序列, 残基表行号数组)"""
+    res = struct["residues"]
+    rows = np.flatnonzero(((res["chain"] == chain) & (res["ca"] >= 0)).to_numpy())
+    seq = "".join(a if len(a) == 1 else "X" for a in res["aa"].to_numpy()[rows])
+    return seq, rows
+
+
+@lru_cache(maxsize=1)
+def _map_aligner():
+    """全局比对，末端缺口不罚分 (结构常缺 N/C 端或只含可变区)"""
+    return PairwiseAligner(mode="global", substitution_matrix=substitution_matrices.load("BLOSUM62"),
+                           open_gap_score=-10.0, extend_gap_score=-1.0, end_gap_score=0.0)
+
+
+def map_sequence(struct, protein, chain=None):
+    """
+    蛋白序列与结构链比对，建立 序列位点 -> 结构残基 的查找表 (自动处理插入码、缺失残基和编号跳跃)
+    chain 为空时在所有蛋白链中选比对得分最高的一条
+    返回 dict: chain / keys (长度 = 序列长度，每个位点为 (链, 序号, 插入码) 或 None) / identity / coverage
+    同一 (结构, 序列, 链) 只计算一次
+    """
+    protein = "".join(str(protein).split()).upper()
+    cache_key = (struct["key"], hashlib.sha1(protein.encode()).hexdigest(), chain)
+    if cache_key in _MAP_CACHE:
+        return _MAP_CACHE[cache_key]
+
+    aligner = _map_aligner()
+    best = None
+    for ch in ([chain] if chain else protein_chains(struct)):
+        seq, rows = chain_sequence(struct, ch)
+        if not seq or not protein:
+            continue
+        score = aligner.score(protein, seq)
+        if best is None or score > best[0]:
+            best = (score, ch, seq, rows)
+
+    keys = [None] * len(protein)
+    out = {"chain": None, "keys": keys, "identity": 0.0, "coverage": 0.0}
+    if best is not None:
+        _, ch, seq, rows = best
+        idx = aligner.align(protein, seq)[0].indices
+        both = (idx[0] >= 0) & (idx[1] >= 0)
+        q, t = idx[0][both], idx[1][both]
+        res = struct["residues"]
+        triples = list(zip(res["chain"].to_numpy()[rows[t]], res["resi"].to_numpy()[rows[t]].tolist(),
+                           res["icode"].to_numpy()[rows[t]]))
+        for qi, key in zip(q.tolist(), triples):
+            keys[qi] = key
+        same = sum(protein[a] == seq[b] for a, b in zip(q.tolist(), t.tolist()))
+        out.update(chain=ch, identity=100.0 * same / max(len(q), 1), coverage=100.0 * len(q) / len(protein))
+
+    _MAP_CACHE[cache_key] = out
+    for k in list(_MAP_CACHE)[:max(0, len(_MAP_CACHE) - MAP_CACHE_MAX)]:
+        del _MAP_CACHE[k]
+    return out
+
+
+def mapped_keys(mapping, positions):
+    """1 基序列位点 -> 结构残基键 (未映射的位点丢弃)"""
+    keys = mapping["keys"]
+    return [keys[p - 1] for p in positions if 0 < p <= len(keys) and keys[p - 1] is not None]
+
+
+def residue_label(key):
+    """(链, 序号, 插入码) -> "H:52A" """
+    chain, resi, icode = key
+    return f"{chain}:{resi}{icode}"
@@ -0,0 +1,231 @@
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from utils.seq_modules.structure import map_sequence, mapped_keys, residue_label
+
+# ==========================================
+# 0. 常量
+# ==========================================
+# 残基最大可及表面积 (Å²)，Tien et al. 2013 理论值，用于相对可及性 RSA
+MAX_ASA = {"A": 129.0, "R": 274.0, "N": 195.0, "D": 193.0, "C": 167.0, "Q": 225.0, "E": 223.0, "G": 104.0,
+           "H": 224.0, "I": 197.0, "L": 201.0, "K": 236.0, "M": 224.0, "F": 240.0, "P": 159.0, "S": 155.0,
+           "T": 172.0, "W": 285.0, "Y": 263.0, "V": 174.0}
+# 范德华半径 (Å, Bondi)
+VDW_RADII = {"C": 1.70, "N": 1.55, "O": 1.52, "S": 1.80, "H": 1.10, "SE": 1.90, "P": 1.80}
+DEFAULT_RADIUS = 1.80
+PROBE = 1.4                 # 水分子探针半径
+N_POINTS = 100              # 每个原子球面的采样点数
+EXPOSED_RSA = 0.25          # RSA 不低于该值视为暴露
+HYDROPHOBIC = set("AILMFVWY")
+SEVERITY_WEIGHT = {"High": 3.0, "Medium": 2.0, "Low": 1.0}
+BACKBONE = {"N", "CA", "C", "O", "OXT"}
+
+
+# ==========================================
+# 1. Shrake-Rupley SASA
+# ==========================================
+@lru_cache(maxsize=8)
+def sphere_points(n=N_POINTS):
+    """单位球面上 n 个近似均匀的点 (黄金螺旋)"""
+    i = np.arange(n) + 0.5
+    phi = np.arccos(1 - 2 * i / n)
+    theta = np.pi * (1 + 5 ** 0.5) * i
+    return np.column_stack([np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)])
+
+
+def atom_sasa(coords, radii, n_points=N_POINTS, probe=PROBE, block=2000):
+    """
+    每个原子的溶剂可及表面积 (Å²)
+    球面点与原子中心的邻近关系由 KD 树一次查出 (稀疏距离矩阵)，按原子分块控制内存
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    r = np.asarray(radii, dtype=np.float64) + probe
+    sphere = sphere_points(n_points)
+    tree = cKDTree(coords)
+    r_max = r.max()
+    sasa = np.empty(len(coords))
+
+    for a0 in range(0, len(coords), block):
+        a1 = min(a0 + block, len(coords))
+        pts = (coords[a0:a1, None, :] + r[a0:a1, None, None] * sphere[None]).reshape(-1, 3)
+        owner = np.repeat(np.arange(a0, a1), n_points)
+        pairs = cKDTree(pts).sparse_distance_matrix(tree, r_max, output_type="ndarray")
+        # 点落在其他原子 (半径 + 探针) 内即被掩埋
+        hit = (pairs["v"] < r[pairs["j"]]) & (pairs["j"] != owner[pairs["i"]])
+        buried = np.zeros(len(pts), dtype=bool)
+        buried[pairs["i"][hit]] = True
+        exposed = (~buried).reshape(a1 - a0, n_points).sum(axis=1)
+        sasa[a0:a1] = 4.0 * np.pi * r[a0:a1] ** 2 * exposed / n_points
+    return sasa
+
+
+def residue_sasa(struct, chains=None):
+    """
+    逐残基 SASA / RSA / 是否暴露 / 侧链质心 (Gly 用 CA)，只计算蛋白原子 (去掉水、HETATM、氢、备选构象)
+    结果按链选择缓存在结构 dict 中，同一模型排名多个克隆时只算一次
+    """
+    key = tuple(chains) if chains else None
+    cache = struct.setdefault("_surface", {})
+    if key in cache:
+        return cache[key]
+
+    atoms = struct["atoms"]
+    mask = ~atoms["hetero"].to_numpy() & atoms["altloc"].isin(["", "A"]).to_numpy()
+    mask &= ~atoms["element"].isin(["H", "D"]).to_numpy()
+    if chains:
+        mask &= atoms["chain"].isin(list(chains)).to_numpy()
+    sub = atoms[mask]
+    radii = sub["element"].map(VDW_RADII).fillna(DEFAULT_RADIUS).to_numpy()
+    coords = sub[["x", "y", "z"]].to_numpy()
+    sasa = atom_sasa(coords, radii)
+
+    res_index = sub["res_index"].to_numpy()
+    side = ~sub["name"].isin(BACKBONE).to_numpy() | (sub["name"] == "CA").to_numpy() & \
+        (struct["residues"]["aa"].to_numpy()[res_index] == "G")
+    uniq, inv = np.unique(res_index, return_inverse=True)
+    res_sasa = np.bincount(inv, weights=sasa)
+    # 侧链质心 (没有侧链原子时退回 CA / 全原子质心)
+    w = np.where(side, 1.0, 1e-6)
+    centroid = np.column_stack([np.bincount(inv, weights=coords[:, k] * w) for k in range(3)]) / \
+        np.bincount(inv, weights=w)[:, None]
+
+    res = struct["residues"].iloc[uniq][["chain", "resi", "icode", "resn", "aa"]].reset_index(drop=True)
+    res["SASA"] = res_sasa
+    res["RSA"] = res_sasa / res["aa"].map(MAX_ASA).to_numpy(dtype=float)
+    res["Exposed"] = res["RSA"] >= EXPOSED_RSA
+    res[["cx", "cy", "cz"]] = centroid
+    res = res[res["aa"].isin(MAX_ASA)].reset_index(drop=True)
+    res.index = pd.MultiIndex.from_arrays([res["chain"], res["resi"], res["icode"]])
+    cache[key] = res
+    return res
+
+
+def residue_exposure(struct, keys, chains=None):
+    """残基键列表 -> RSA 数组 (找不到的为 NaN)"""
+    res = residue_sasa(struct, chains)
+    return res["RSA"].reindex(pd.MultiIndex.from_tuples(keys) if keys else res.index[:0]).to_numpy()
+
+
+# ==========================================
+# 2. 三维空间聚类
+# ==========================================
+def spatial_clusters(coords, cutoff):
+    """质心距离 < cutoff 的残基连通为一簇 (单连接)，返回簇编号 (从 0 开始)"""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    if len(coords) == 0:
+        return np.empty(0, dtype=np.int64)
+    pairs = cKDTree(coords).query_pairs(cutoff, output_type="ndarray")
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(coords), len(coords)))
+    return connected_components(graph, directed=False)[1]
+
+
+def liability_clusters(struct, keys, motifs=None, cutoff=8.0, chains=None):
+    """
+    风险残基的三维聚集：空间上相邻的风险位点合并为一簇
+    keys: 风险残基键；motifs: 与 keys 等长的基序名 (可选)
+    返回 DataFrame: Cluster / Size / Residues / Motifs / Exposed / Mean RSA，按簇大小降序
+    """
+    cols = ["Cluster", "Size", "Residues", "Motifs", "Exposed", "Mean RSA"]
+    res = residue_sasa(struct, chains)
+    idx = pd.MultiIndex.from_tuples(keys) if keys else res.index[:0]
+    found = idx.isin(res.index)
+    if not found.any():
+        return pd.DataFrame(columns=cols)
+    sub = res.loc[idx[found]]
+    motifs = np.asarray(motifs if motifs is not None else [""] * len(keys), dtype=object)[found]
+    labels = spatial_clusters(sub[["cx", "cy", "cz"]].to_numpy(), cutoff)
+
+    rows = []
+    for lab in np.unique(labels):
+        m = labels == lab
+        g = sub[m]
+        rows.append({"Size": int(m.sum()),
+                     "Residues": ", ".join(residue_label(k) for k in dict.fromkeys(g.index)),
+                     "Motifs": ", ".join(dict.fromkeys(x for x in motifs[m] if x)),
+                     "Exposed": int(g["Exposed"].sum()), "Mean RSA": float(g["RSA"].mean())})
+    out = pd.DataFrame(rows).sort_values(["Size", "Exposed"], ascending=False).reset_index(drop=True)
+    out.insert(0, "Cluster", np.arange(1, len(out) + 1))
+    return out[cols]
+
+
+def hydrophobic_patches(struct, chains=None, cutoff=7.0, min_size=3):
+    """
+    暴露疏水残基 (AILMFVWY, RSA >= EXPOSED_RSA) 的三维聚集 (疏水补丁)
+    返回 DataFrame: Patch / Size / Area (Å²，补丁内残基 SASA 之和) / Residues，按面积降序
+    """
+    cols = ["Patch", "Size", "Area (Å²)", "Residues"]
+    res = residue_sasa(struct, chains)
+    hyd = res[res["aa"].isin(HYDROPHOBIC) & res["Exposed"]]
+    if hyd.empty:
+        return pd.DataFrame(columns=cols)
+    labels = spatial_clusters(hyd[["cx", "cy", "cz"]].to_numpy(), cutoff)
+    rows = []
+    for lab in np.unique(labels):
+        g = hyd[labels == lab]
+        if len(g) >= min_size:
+            rows.append({"Size": len(g), "Area (Å²)": float(g["SASA"].sum()),
+                         "Residues": ", ".join(f"{k[0]}:{a}{k[1]}{k[2]}" for a, k in zip(g["aa"], g.index))})
+    if not rows:
+        return pd.DataFrame(columns=cols)
+    out = pd.DataFrame(rows).sort_values("Area (Å²)", ascending=False).reset_index(drop=True)
+    out.insert(0, "Patch", np.arange(1, len(out) + 1))
+    return out[cols]
+
+
+# ==========================================
+# 3. 多克隆排名 (同一结构模型)
+# ==========================================
+def rank_clones(struct, df_hits, proteins, names, chain=None):
+    """
+    按结构暴露度给每个克隆的风险位点加权 (liabilities.scan_sequences 的输出)
+    每个风险位点取基序覆盖残基中最大的 RSA，Exposure Score = Σ 等级权重 x RSA
+    残基 SASA 整个结构只算一次；序列 -> 结构映射按 (结构, 序列) 缓存
+    """
+    res = residue_sasa(struct)
+    rsa = dict(zip(res.index, res["RSA"].to_numpy()))
+    severity = df_hits["Severity"].astype(str).to_numpy()
+    weight = pd.Series(severity).map(SEVERITY_WEIGHT).fillna(1.0).to_numpy()
+    groups = df_hits.groupby("Seq Index").indices
+    rows = []
+    for i, (name, protein) in enumerate(zip(names, proteins)):
+        mapping = map_sequence(struct, protein, chain)
+        idx = groups.get(i, np.empty(0, dtype=np.int64))
+        best = np.full(idx.size, np.nan)
+        for n, (start, end) in enumerate(zip(df_hits["Position"].to_numpy()[idx], df_hits["End"].to_numpy()[idx])):
+            vals = [rsa[k] for k in mapped_keys(mapping, range(start, end + 1)) if k in rsa]
+            if vals:
+                best[n] = max(vals)
+        exposed = best >= EXPOSED_RSA
+        rows.append({"Name": name, "Chain": mapping["chain"], "Identity (%)": mapping["identity"],
+                     "Risks": int(idx.size), "Mapped": int(np.isfinite(best).sum()), "Exposed": int(exposed.sum()),
+                     "Exposed High": int((exposed & (severity[idx] == "High")).sum()),
+                     "Exposure Score": float(np.nansum(weight[idx] * np.nan_to_num(best)))})
+    return pd.DataFrame(rows).sort_values("Exposure Score").reset_index(drop=True)
+
+
+# ==========================================
+# 4. 基准测试
+# ==========================================
+def benchmark_sasa(n_atoms=5000, seed=0):
+    """
+    随机堆积 n 个原子的 SASA 计算耗时 (秒)
+    运行: python -m utils.seq_modules.surface
+    """
+    rng = np.random.default_rng(seed)
+    side = (n_atoms * 20.0) ** (1 / 3)                 # 约 20 Å³ / 原子，接近蛋白密度
+    coords = rng.random((n_atoms, 3)) * side
+    radii = rng.choice([1.7, 1.55, 1.52], n_atoms)
+    t0 = time.perf_counter()
+    sasa = atom_sasa(coords, radii)
+    return pd.DataFrame([{"Atoms": n_atoms, "Total SASA (Å²)": float(sasa.sum()),
+                          "Time (s)": time.perf_counter() - t0}])
+
+
+if __name__ == "__main__":
+    print(benchmark_sasa().to_string(index=False))
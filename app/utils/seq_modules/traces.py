@@ -0,0 +1,237 @@
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from Bio import SeqIO
+
+# ==========================================
+# 0. 常量
+# ==========================================
+TRACE_TAGS = ("DATA9", "DATA10", "DATA11", "DATA12")
+TRACE_COLORS = {"G": "black", "A": "green", "T": "red", "C": "blue"}
+MOTT_CUTOFF = 0.05          # Mott 修剪阈值 (错误概率)，与 phred / Biopython 默认一致
+MIXED_RATIO = 0.3           # 次峰 / 主峰 >= 该比例时判为杂合峰 (简并碱基)
+PLOT_POINTS = 2000          # 峰图每条通道最多绘制的点数
+PARALLEL_MIN = 64           # 少于该数量的文件不启用多进程
+
+# 两种碱基 -> IUPAC 简并码
+IUPAC_PAIRS = {frozenset("AG"): "R", frozenset("CT"): "Y", frozenset("GC"): "S", frozenset("AT"): "W",
+               frozenset("GT"): "K", frozenset("AC"): "M"}
+
+
+# ==========================================
+# 1. 单个 AB1
+# ==========================================
+def mott_trim(qual, cutoff=MOTT_CUTOFF):
+    """
+    Mott 修剪：每个碱基得分 cutoff - 10^(-Q/10)，取累计得分最大的连续区段
+    (最大子段和，用 cumsum + 前缀最小值向量化)；返回 (start, end) 半开区间，全部低质量时为 (0, 0)
+    """
+    qual = np.asarray(qual, dtype=np.float64)
+    if qual.size == 0:
+        return 0, 0
+    score = cutoff - 10.0 ** (-qual / 10.0)
+    s = np.r_[0.0, np.cumsum(score)]
+    prefix_min = np.minimum.accumulate(s)
+    prefix_arg = np.maximum.accumulate(np.where(s == prefix_min, np.arange(s.size), 0))
+    end = int(np.argmax(s - prefix_min))
+    if s[end] - prefix_min[end] <= 0:
+        return 0, 0
+    return int(prefix_arg[end]), end
+
+
+def call_mixed_bases(traces, peaks, order, calls, ratio=MIXED_RATIO):
+    """
+    在每个峰位比较 4 个通道信号，次峰 >= ratio x 主峰的位置改为 IUPAC 简并码
+    返回 (新碱基序列, 杂合位点数组 (0 基))
+    """
+    calls = np.array(list(calls), dtype="<U1")
+    if traces is None or peaks is None or len(peaks) == 0:
+        return "".join(calls), np.empty(0, dtype=np.int64)
+    n = min(len(peaks), calls.size)
+    peaks = np.clip(np.asarray(peaks[:n], dtype=np.int64), 0, traces.shape[1] - 1)
+    signal = traces[:, peaks].astype(np.float64)               # (4, n)
+    rank = np.argsort(-signal, axis=0)
+    top, second = signal[rank[0], np.arange(n)], signal[rank[1], np.arange(n)]
+    mixed = np.flatnonzero((top > 0) & (second >= ratio * top))
+    letters = np.array(list(order))
+    for i in mixed:
+        code = IUPAC_PAIRS.get(frozenset((letters[rank[0, i]], letters[rank[1, i]])))
+        if code:
+            calls[i] = code
+    return "".join(calls), mixed
+
+
+def parse_ab1(name, data):
+    """AB1 字节 -> dict: name / seq / qual / traces (4 x N, 通道顺序同 order) / order / peaks"""
+    record = SeqIO.read(io.BytesIO(data), "abi")
+    raw = record.annotations.get("abif_raw", {})
+    order = raw.get("FWO_1", b"GATC")
+    order = order.decode() if isinstance(order, bytes) else str(order)
+    traces = None
+    if all(t in raw for t in TRACE_TAGS):
+        length = min(len(raw[t]) for t in TRACE_TAGS)
+        traces = np.vstack([np.asarray(raw[t][:length], dtype=np.int16) for t in TRACE_TAGS])
+    peaks = np.asarray(raw["PLOC2"], dtype=np.int64) if "PLOC2" in raw else None
+    qual = np.asarray(record.letter_annotations.get("phred_quality", [0] * len(record.seq)), dtype=np.int16)
+    return {"name": name, "seq": str(record.seq).upper(), "qual": qual, "traces": traces, "order": order,
+            "peaks": peaks}
+
+
+def process_trace(name, data, cutoff=MOTT_CUTOFF, ratio=MIXED_RATIO):
+    """解析 + Mott 修剪 + 杂合峰识别；失败时返回 Status 为错误信息的结果"""
+    try:
+        rec = parse_ab1(name, data)
+    except Exception as e:
+        return {"name": name, "status": f"Failed: {e}", "seq": "", "qual": np.empty(0, dtype=np.int16),
+                "traces": None, "order": "GATC", "peaks": None, "trim": (0, 0), "mixed": np.empty(0, dtype=np.int64),
+                "trimmed": ""}
+    seq, mixed = call_mixed_bases(rec["traces"], rec["peaks"], rec["order"], rec["seq"], ratio)
+    start, end = mott_trim(rec["qual"], cutoff)
+    rec.update(seq=seq, mixed=mixed, trim=(start, end), trimmed=seq[start:end],
+               status="OK" if end - start > 0 else "Low Quality")
+    return rec
+
+
+def trace_summary(rec):
+    """单条结果 -> 汇总行"""
+    start, end = rec["trim"]
+    q = rec["qual"][start:end]
+    mixed = rec["mixed"]
+    return {"Name": rec["name"], "Raw Length": len(rec["seq"]), "Trim Start": start + 1 if end else 0,
+            "Trim End": end, "Trimmed Length": end - start, "Mean Q": float(q.mean()) if q.size else 0.0,
+            "Q20 (%)": 100.0 * float((q >= 20).mean()) if q.size else 0.0,
+            "Mixed Bases": int(((mixed >= start) & (mixed < end)).sum()), "Status": rec["status"]}
+
+
+# ==========================================
+# 2. 批量 (进程池)
+# ==========================================
+def _process_chunk(args):
+    items, cutoff, ratio = args
+    return [process_trace(n, d, cutoff, ratio) for n, d in items]
+
+
+def process_batch(files, cutoff=MOTT_CUTOFF, ratio=MIXED_RATIO, n_jobs=None, progress=None):
+    """
+    files: [(文件名, 字节)]；返回 (结果列表 (顺序与输入一致), 汇总 DataFrame)
+    """
+    files = list(files)
+    n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+    if n_jobs == 1 or len(files) < PARALLEL_MIN:
+        results = []
+        for i, (n, d) in enumerate(files):
+            results.append(process_trace(n, d, cutoff, ratio))
+            if progress:
+                progress((i + 1) / len(files))
+    else:
+        size = max(1, -(-len(files) // (n_jobs * 4)))
+        chunks = [(files[i:i + size], cutoff, ratio) for i in range(0, len(files), size)]
+        results = []
+        with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+            for i, part in enumerate(ex.map(_process_chunk, chunks)):
+                results.extend(part)
+                if progress:
+                    progress((i + 1) / len(chunks))
+    return results, pd.DataFrame([trace_summary(r) for r in results])
+
+
+def trimmed_fasta(results):
+    return "".join(f">{r['name']}\n{r['trimmed']}\n" for r in results if r["trimmed"])
+
+
+# ==========================================
+# 3. 降采样绘图
+# ==========================================
+def minmax_decimate(y, n_bins):
+    """
+    每个区间保留最小值和最大值 (2 x n_bins 个点)，峰形和峰高不丢失
+    返回 (x, y)
+    """
+    y = np.asarray(y)
+    n = y.size
+    if n <= 2 * n_bins:
+        return np.arange(n), y
+    edges = np.linspace(0, n, n_bins + 1).astype(np.int64)
+    width = int(np.diff(edges).max())
+    # 不等长区间补齐为矩阵 (用区间内第一个值填充，不影响 min/max)
+    idx = edges[:-1, None] + np.arange(width)[None, :]
+    idx = np.where(idx < edges[1:, None], idx, edges[:-1, None])
+    block = y[idx]
+    i_min = idx[np.arange(n_bins), block.argmin(axis=1)]
+    i_max = idx[np.arange(n_bins), block.argmax(axis=1)]
+    x = np.sort(np.concatenate([i_min, i_max]))
+    return x, y[x]
+
+
+def lttb(y, n_out):
+    """Largest-Triangle-Three-Buckets 降采样，返回 (x, y)"""
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    if n <= n_out or n_out < 3:
+        return np.arange(n), y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = [0]
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nxt_lo, nxt_hi = edges[b + 1], edges[b + 2] if b + 2 < len(edges) else n
+        avg_x, avg_y = (nxt_lo + nxt_hi - 1) / 2.0, y[nxt_lo:nxt_hi].mean()
+        ax, ay = keep[-1], y[keep[-1]]
+        xs = np.arange(lo, hi)
+        area = np.abs((ax - avg_x) * (y[lo:hi] - ay) - (ax - xs) * (avg_y - ay))
+        keep.append(int(xs[area.argmax()]))
+    keep.append(n - 1)
+    keep = np.asarray(keep)
+    return keep, y[keep]
+
+
+def trace_figure(rec, window=None, max_points=PLOT_POINTS, method="minmax"):
+    """
+    4 通道峰图 (降采样)，修剪掉的两端加灰色阴影
+    window: (起, 止) 采样点范围，None 为全长
+    """
+    fig = go.Figure()
+    if rec["traces"] is None:
+        return fig
+    traces = rec["traces"]
+    lo, hi = window or (0, traces.shape[1])
+    for k, base in enumerate(rec["order"]):
+        y = traces[k, lo:hi]
+        x, yy = lttb(y, max_points) if method == "lttb" else minmax_decimate(y, max_points // 2)
+        fig.add_trace(go.Scattergl(x=x + lo, y=yy, mode="lines", name=base,
+                                   line=dict(color=TRACE_COLORS.get(base, "gray"), width=1)))
+
+    start, end = rec["trim"]
+    peaks = rec["peaks"]
+    if peaks is not None and len(peaks):
+        left = peaks[min(start, len(peaks) - 1)] if end else traces.shape[1]
+        right = peaks[min(end, len(peaks)) - 1] if end else traces.shape[1]
+        for x0, x1 in ((0, left), (right, traces.shape[1])):
+            if x1 > x0:
+                fig.add_vrect(x0=x0, x1=x1, fillcolor="gray", opacity=0.15, line_width=0)
+    fig.update_layout(title=f"Trace: {rec['name']}", height=400, hovermode="x unified",
+                      margin=dict(l=10, r=10, t=40, b=10))
+    return fig
+
+
+# ==========================================
+# 4. 基准测试
+# ==========================================
+def benchmark_decimation(n=15_000, n_out=PLOT_POINTS):
+    """单通道降采样耗时 (秒)；运行: python -m utils.seq_modules.traces"""
+    y = np.random.default_rng(0).normal(0, 100, n).cumsum()
+    t0 = time.perf_counter()
+    minmax_decimate(y, n_out // 2)
+    t_mm = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    lttb(y, n_out)
+    t_lttb = time.perf_counter() - t0
+    return pd.DataFrame([{"Points": n, "Out": n_out, "MinMax (s)": t_mm, "LTTB (s)": t_lttb}])
+
+
+if __name__ == "__main__":
+    print(benchmark_decimation().to_string(index=False))
@@ -0,0 +1,304 @@
+import io
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from Bio import SeqIO
+from Bio.Data import CodonTable
+
+# ==========================================
+# 0. 常量
+# ==========================================
+FRAMES = (1, 2, 3, -1, -2, -3)      # 正链 1..3 / 反链 -1..-3 (与 EMBOSS / NCBI 记法一致)
+MIN_ORF_AA = 30                     # ORF 最短长度 (氨基酸)
+PAGE_SIZES = (50, 100, 200, 500)
+
+# 核酸 -> 4 位掩码 (A=1 C=2 G=4 T=8，简并碱基为对应组合，N=15，其他字符为 0)；密码子编码 = a << 8 | b << 4 | c
+_IUPAC_MASK = {"A": 1, "C": 2, "G": 4, "T": 8, "U": 8, "R": 5, "Y": 10, "S": 6, "W": 9, "K": 12, "M": 3,
+               "B": 14, "D": 13, "H": 11, "V": 7, "N": 15}
+_ENCODE = np.zeros(256, dtype=np.uint16)
+for _b, _m in _IUPAC_MASK.items():
+    _ENCODE[ord(_b)] = _ENCODE[ord(_b.lower())] = _m
+_AMBIGUOUS_AA = {frozenset("IL"): "J", frozenset("DN"): "B", frozenset("EQ"): "Z"}
+# 互补: 掩码位 A<->T、C<->G 对调
+_COMPLEMENT = np.array([((m & 1) << 3) | ((m & 2) << 1) | ((m & 4) >> 1) | ((m & 8) >> 3) for m in range(16)],
+                       dtype=np.uint16)
+
+
+# ==========================================
+# 1. 读取 (流式)
+# ==========================================
+def sniff_format(head):
+    """根据首个非空字符判断格式: '>' FASTA / '@' FASTQ / 其他为纯序列"""
+    head = head.lstrip()
+    return "fasta" if head.startswith(">") else "fastq" if head.startswith("@") else "raw"
+
+
+def iter_records(source):
+    """
+    source: 文本 / bytes / 上传的文件对象
+    逐条产出 (名称, 序列)，FASTA / FASTQ 用 SeqIO.parse 流式解析，不把整个文件切分成列表
+    纯序列 (无 '>' 表头) 视为一条 Input_Seq
+    """
+    if isinstance(source, bytes):
+        source = source.decode("utf-8", "replace")
+    if isinstance(source, str):
+        handle = io.StringIO(source)
+    else:
+        source.seek(0)
+        handle = io.TextIOWrapper(source, encoding="utf-8", errors="replace")
+    try:
+        head = handle.read(256)
+        handle.seek(0)
+        fmt = sniff_format(head)
+        if fmt == "raw":
+            yield "Input_Seq", "".join(handle.read().split()).upper()
+            return
+        for rec in SeqIO.parse(handle, fmt):
+            yield rec.description or rec.id, str(rec.seq).upper()
+    finally:
+        # 不关闭上传的文件对象 (页面重跑时还要再读)
+        if isinstance(handle, io.TextIOWrapper):
+            handle.detach()
+
+
+def read_records(source, limit=None):
+    """-> (名称列表, 序列列表)；limit 为最多读取的条数"""
+    names, seqs = [], []
+    for i, (name, seq) in enumerate(iter_records(source)):
+        if limit is not None and i >= limit:
+            break
+        names.append(name)
+        seqs.append(seq)
+    return names, seqs
+
+
+# ==========================================
+# 2. 查表翻译 (整批一次完成)
+# ==========================================
+@lru_cache(maxsize=8)
+def codon_lut(table=1):
+    """
+    4096 项查找表 (按 NCBI 遗传密码表生成)
+    简并密码子展开后只对应一种氨基酸 (或都是终止) 时取该结果，I/L、D/N、E/Q 记为 J / B / Z，其余为 X，与 Bio.Seq.translate 一致
+    """
+    code = CodonTable.unambiguous_dna_by_id[table]
+    single = {}
+    for x in "ACGT":
+        for y in "ACGT":
+            for z in "ACGT":
+                single[_IUPAC_MASK[x], _IUPAC_MASK[y], _IUPAC_MASK[z]] = \
+                    "*" if x + y + z in code.stop_codons else code.forward_table[x + y + z]
+    bits = {m: [1 << i for i in range(4) if m >> i & 1] for m in range(16)}
+    lut = np.full(4096, ord("X"), dtype=np.uint8)
+    for a in range(1, 16):
+        for b in range(1, 16):
+            for c in range(1, 16):
+                aas = {single[x, y, z] for x in bits[a] for y in bits[b] for z in bits[c]}
+                if len(aas) == 1:
+                    lut[a << 8 | b << 4 | c] = ord(aas.pop())
+                elif frozenset(aas) in _AMBIGUOUS_AA:
+                    lut[a << 8 | b << 4 | c] = ord(_AMBIGUOUS_AA[frozenset(aas)])
+    return lut
+
+
+def encode_batch(seqs):
+    """
+    序列列表 -> dict: buf (拼接后的掩码数组) / starts / lens
+    整批只编码一次，六个读码框共用
+    """
+    seqs = list(seqs)
+    lens = np.fromiter((len(s) for s in seqs), dtype=np.int64, count=len(seqs))
+    raw = np.frombuffer("".join(seqs).encode("ascii", "replace"), dtype=np.uint8)
+    starts = np.r_[0, np.cumsum(lens)[:-1]].astype(np.int64) if len(seqs) else np.empty(0, dtype=np.int64)
+    return {"buf": _ENCODE[raw], "starts": starts, "lens": lens}
+
+
+def reverse_strand(enc):
+    """
+    整体反向互补：rc(s1 + s2 + ... + sn) = rc(sn) + ... + rc(s1)，只需一次翻转，不必逐条处理
+    返回同样结构的 dict，序列顺序与输入一致
+    """
+    n = enc["buf"].size
+    return {"buf": _COMPLEMENT[enc["buf"][::-1]], "starts": n - enc["starts"] - enc["lens"], "lens": enc["lens"]}
+
+
+def _translate_encoded(enc, table=1, shift=0, pad=True):
+    """
+    已编码的一条链 -> (氨基酸 uint8 数组, 每条序列的边界)
+    每个位置的密码子编码整批只算一次 (缓存在 enc 中)，再按读码框取下标；末尾不完整的密码子 (pad=True) 单独补 N
+    """
+    buf, starts, lens = enc["buf"], enc["starts"], enc["lens"]
+    avail = np.maximum(lens - shift, 0)
+    full = avail // 3
+    n_codons = -(-avail // 3) if pad else full
+    bounds = np.r_[0, np.cumsum(n_codons)]
+    total = int(bounds[-1])
+
+    padded = np.r_[buf, np.zeros(2, dtype=np.uint16)]
+    if "codes" not in enc:
+        # 同一条链的三个读码框共用
+        enc["codes"] = padded[:-2] << 8 | padded[1:-1] << 4 | padded[2:]
+    codes = enc["codes"]
+    pos = np.repeat(starts + shift - 3 * bounds[:-1], n_codons) + 3 * np.arange(total)
+    aa = codon_lut(table)[codes[pos]] if total else np.empty(0, dtype=np.uint8)
+
+    if pad:
+        # 不完整的末位密码子: 越过序列末尾的碱基按 N 处理
+        part = np.flatnonzero(n_codons > full)
+        if part.size:
+            p = starts[part] + shift + 3 * full[part]
+            rem = avail[part] - 3 * full[part]
+            b1 = padded[p]
+            b2 = np.where(rem > 1, padded[p + 1], 15)
+            aa[bounds[part + 1] - 1] = codon_lut(table)[b1 << 8 | b2 << 4 | 15]
+    return aa, bounds
+
+
+def _split(aa, bounds):
+    text = aa.tobytes().decode("ascii")
+    return [text[bounds[i]:bounds[i + 1]] for i in range(bounds.size - 1)]
+
+
+def translate_batch(seqs, table=1, frame=1, pad=True):
+    """
+    整批翻译：所有序列拼成一个数组，按密码子编码查表
+    frame: 1..3 正链 / -1..-3 反链；pad=True 时末尾不足 3 个碱基的部分按 N 补齐 (与原先补 N 再翻译一致)
+    返回蛋白序列列表
+    """
+    enc = encode_batch(seqs)
+    if frame < 0:
+        enc = reverse_strand(enc)
+    return _split(*_translate_encoded(enc, table, abs(frame) - 1, pad))
+
+
+def six_frames(seqs, table=1):
+    """-> {frame: (氨基酸 uint8 数组, 边界)}；正 / 反链各只编码一次"""
+    fwd = encode_batch(seqs)
+    rev = reverse_strand(fwd)
+    return {f: _translate_encoded(fwd if f > 0 else rev, table, abs(f) - 1, pad=False) for f in FRAMES}
+
+
+# ==========================================
+# 3. ORF
+# ==========================================
+def _longest_segments(aa, bounds, require_start=True):
+    """
+    每条蛋白序列中不含终止密码子的最长片段 (向量化，序列之间插入 '*' 作为分隔)
+    require_start=True 时片段从第一个 M 开始
+    返回 (起点数组 (氨基酸坐标), 长度数组)，没有片段时长度为 0
+    """
+    n = bounds.size - 1
+    arr = np.insert(aa, bounds[1:], ord("*"))
+    seq_start = bounds[:-1] + np.arange(n)
+    stops = np.flatnonzero(arr == ord("*"))
+    seg_start = np.r_[0, stops[:-1] + 1]
+    seg_end = stops
+    if require_start:
+        met = np.r_[np.flatnonzero(arr == ord("M")), arr.size]
+        seg_start = np.minimum(met[np.searchsorted(met, seg_start)], seg_end)
+    seg_len = seg_end - seg_start
+    seg_seq = np.searchsorted(seq_start, seg_start, side="right") - 1
+
+    # 每条序列取最长片段：按 (序列, -长度) 排序后取每组第一个
+    order = np.lexsort((-seg_len, seg_seq))
+    first = order[np.r_[True, seg_seq[order][1:] != seg_seq[order][:-1]]]
+    start, length = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    start[seg_seq[first]] = seg_start[first] - seq_start[seg_seq[first]]
+    length[seg_seq[first]] = seg_len[first]
+    return start, length
+
+
+def find_orfs(seqs, names=None, table=1, min_aa=MIN_ORF_AA, require_start=True):
+    """
+    六框翻译后取每条序列最长的 ORF
+    返回 DataFrame: Name / Frame / Start / End (核酸 1 基坐标，基于原始正链) / ORF Length / Protein Seq
+    找不到 >= min_aa 的 ORF 时 Frame 为 0、Protein Seq 为空
+    """
+    seqs = list(seqs)
+    names = list(names) if names is not None else [f"Seq_{i + 1}" for i in range(len(seqs))]
+    lens = np.fromiter((len(s) for s in seqs), dtype=np.int64, count=len(seqs))
+    best_len = np.zeros(len(seqs), dtype=np.int64)
+    best_start = np.zeros(len(seqs), dtype=np.int64)
+    best_frame = np.zeros(len(seqs), dtype=np.int64)
+    frames = six_frames(seqs, table)
+    for f in FRAMES:
+        start, length = _longest_segments(*frames[f], require_start)
+        better = length > best_len
+        best_len[better], best_start[better], best_frame[better] = length[better], start[better], f
+    found = best_len >= max(min_aa, 1)
+
+    shift = np.abs(best_frame) - 1
+    nt_lo = shift + 3 * best_start                      # 所在链上的 0 基起点
+    nt_hi = nt_lo + 3 * best_len                        # 不含终止密码子
+    fwd = best_frame > 0
+    start_nt = np.where(fwd, nt_lo + 1, lens - nt_hi + 1)
+    end_nt = np.where(fwd, nt_hi, lens - nt_lo)
+    proteins = ["" if not ok else frames[f][0][frames[f][1][i] + s: frames[f][1][i] + s + n].tobytes().decode("ascii")
+                for i, (f, s, n, ok) in enumerate(zip(best_frame.tolist(), best_start.tolist(), best_len.tolist(),
+                                                      found.tolist()))]
+    return pd.DataFrame({
+        "Name": names, "Frame": np.where(found, best_frame, 0),
+        "Start": np.where(found, start_nt, 0), "End": np.where(found, end_nt, 0),
+        "ORF Length": np.where(found, best_len, 0), "Protein Seq": proteins,
+    })
+
+
+# ==========================================
+# 4. 整批翻译表
+# ==========================================
+def translate_records(names, seqs, table=1, mode="frame1", min_aa=MIN_ORF_AA):
+    """
+    mode: 'frame1' 从第一个碱基起翻译 (末尾补 N)；'orf' 六框最长 ORF
+    返回 DataFrame: Name / DNA Length / (Frame / Start / End) / Protein Length / Protein Seq
+    """
+    names, seqs = list(names), list(seqs)
+    lens = [len(s) for s in seqs]
+    if mode == "orf":
+        df = find_orfs(seqs, names, table, min_aa)
+        df.insert(1, "DNA Length", lens)
+        df = df.drop(columns=["ORF Length"])
+    else:
+        df = pd.DataFrame({"Name": names, "DNA Length": lens, "Protein Seq": translate_batch(seqs, table, 1)})
+    df.insert(len(df.columns) - 1, "Protein Length", df["Protein Seq"].str.len())
+    return df
+
+
+def page_count(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+def page_slice(df, page, page_size):
+    """分页显示：只取当前页 (1 基)"""
+    page = min(max(1, page), page_count(len(df), page_size))
+    return df.iloc[(page - 1) * page_size: page * page_size]
+
+
+# ==========================================
+# 5. 基准测试
+# ==========================================
+def benchmark_translation(n=100_000, length=400, seed=0):
+    """逐条 Bio.Seq.translate vs 整批查表；运行: python -m utils.seq_modules.translation"""
+    from Bio.Seq import Seq
+    rng = np.random.default_rng(seed)
+    letters = np.frombuffer(b"ACGT", dtype=np.uint8)
+    raw = letters[rng.integers(0, 4, n * length)].tobytes().decode()
+    seqs = [raw[i * length:(i + 1) * length] for i in range(n)]
+    t0 = time.perf_counter()
+    fast = translate_batch(seqs)
+    t_lut = time.perf_counter() - t0
+    k = min(n, 5000)
+    t0 = time.perf_counter()
+    slow = [str(Seq(s + "N" * ((3 - len(s) % 3) % 3)).translate()) for s in seqs[:k]]
+    t_seq = (time.perf_counter() - t0) * n / k
+    t0 = time.perf_counter()
+    find_orfs(seqs)
+    t_orf = time.perf_counter() - t0
+    assert fast[:k] == slow
+    return pd.DataFrame([{"Sequences": n, "Length": length, "Bio.Seq (s, est.)": t_seq, "LUT (s)": t_lut,
+                          "Six-frame ORF (s)": t_orf}])
+
+
+if __name__ == "__main__":
+    print(benchmark_translation().to_string(index=False))
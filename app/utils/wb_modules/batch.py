@@ -0,0 +1,246 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.wb_modules.image_pipeline import build_image
+from utils.wb_modules.lane_analysis import compute_lanes, scaled_params, fit_marker, lane_rows
+from utils.wb_modules.lane_detection import locate_lanes
+from utils.wb_modules.quantification import quantify, saturated_lanes
+
+# ==========================================
+# 0. 常量
+# ==========================================
+LAYOUT_FILE = "wb_layouts.json"     # 与 marker_templates.json 放在一起
+# 批量模式只允许读取该目录下的服务器文件夹: app/data/wb/<子目录>
+DATA_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "wb")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+R2_MIN = 0.98               # Marker 拟合 R² 低于该值时标记 QC 警告
+PARALLEL_MIN = 4            # 少于该数量的胶图不启用多进程
+TABLE_COLS = ["Gel", "Lane", "Type", "Sample Name", "Size (kDa)", "Purity (%)", "IOD", "Std?", "Std Conc.", "Conc.",
+              "Flag"]
+QC_COLS = ["Gel", "Lanes", "Marker R²", "Status", "Flags"]
+
+
+# ==========================================
+# 1. 布局模板 (JSON 持久化)
+# ==========================================
+def load_layouts(path=LAYOUT_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_layouts(layouts, path=LAYOUT_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(layouts, f, ensure_ascii=False, indent=2)
+
+
+def make_layout(rects, shape, marker_idx, marker_name, marker_mw, settings, standards=None, std_model="linear",
+                n_lanes=None, width_ratio=0.8, correct_shear=True, roi=None):
+    """
+    当前胶图的泳道布局 -> 可复用的布局模板 (JSON 可序列化)
+    rects 为原始坐标；保存为相对图像宽高的比例，分辨率不同的胶图也能套用
+    rects="auto" 时每张胶图重新自动识别泳道 (roi 为可选的相对定位框)
+    settings: 侧边栏参数 {bg_method, ball_radius, prominence, rel_height} (显示像素 / 8 位习惯，与单张模式一致)
+    standards: {泳道号: 已知浓度}，每张胶图按同一组标准品拟合标准曲线 (std_model)
+    """
+    h, w = shape[:2]
+    rel = lambda r: [round(r[0] / w, 5), round(r[1] / h, 5), round(r[2] / w, 5), round(r[3] / h, 5)]
+    return {
+        "lanes": "auto" if rects == "auto" else [rel(r) for r in rects],
+        "roi": rel(roi) if roi else None,
+        "n_lanes": int(n_lanes or (0 if rects == "auto" else len(rects))),
+        "width_ratio": float(width_ratio),
+        "correct_shear": bool(correct_shear),
+        "marker_idx": int(marker_idx),
+        "marker_name": marker_name,
+        "marker_mw": [float(v) for v in marker_mw],
+        "standards": {str(int(k)): float(v) for k, v in (standards or {}).items()},
+        "std_model": std_model,
+        "settings": dict(settings),
+    }
+
+
+def layout_standards(layout):
+    """布局中的标准品 -> {泳道号: 浓度}；兼容旧版单参比布局 (ref_lane / ref_conc)"""
+    if layout.get("standards"):
+        return {int(k): v for k, v in layout["standards"].items()}
+    if layout.get("ref_lane"):
+        return {int(layout["ref_lane"]): layout.get("ref_conc", 1.0)}
+    return {}
+
+
+def _to_native(rel, shape):
+    h, w = shape[:2]
+    x, y = int(round(rel[0] * w)), int(round(rel[1] * h))
+    return x, y, min(int(round(rel[2] * w)), w - x), min(int(round(rel[3] * h)), h - y)
+
+
+# ==========================================
+# 2. 单张胶图 (顶层函数，可被进程池序列化)
+# ==========================================
+def process_gel(name, data, layout):
+    """
+    一张胶图按布局模板完整分析 -> dict:
+        name / rows (分析表行) / r2 / n_lanes / flags (QC 问题列表) / error
+    data 为文件字节或文件路径 (路径在子进程中才读取，整批胶图不会同时占用内存)
+    异常不外抛，记录在 error 中，单张坏图不影响整批
+    全程不经过模块缓存：工作进程不会越攒越多，串行时也不挤掉单张页面的缓存
+    """
+    try:
+        if isinstance(data, str):
+            with open(data, "rb") as f:
+                data = f.read()
+        img = build_image(data)
+        shape = img["signal"].shape
+        flags = []
+        if layout["lanes"] == "auto":
+            roi = _to_native(layout["roi"], shape) if layout.get("roi") else None
+            det = locate_lanes(img, roi, n_lanes=layout["n_lanes"] or None, width_ratio=layout["width_ratio"],
+                               correct_shear=layout["correct_shear"])
+            rects, quant_img = det["rects"], det["image"]
+            if layout["n_lanes"] and len(rects) != layout["n_lanes"]:
+                flags.append(f"识别到 {len(rects)} 条泳道 (布局 {layout['n_lanes']} 条)")
+        else:
+            rects, quant_img = [_to_native(r, shape) for r in layout["lanes"]], img
+
+        s = layout["settings"]
+        valid = [i for i, r in enumerate(rects) if r[2] > 0 and r[3] > 0]
+        results = compute_lanes(quant_img, [rects[i] for i in valid], cache=False,
+                                **scaled_params(s["bg_method"], s["ball_radius"], s["prominence"], s["rel_height"],
+                                                img["scale"]))
+        lanes = [{"lane_id": i + 1, "is_marker": i + 1 == layout["marker_idx"], **r} for i, r in zip(valid, results)]
+        if not lanes:
+            raise ValueError("没有有效的泳道")
+        marker = next((d for d in lanes if d["is_marker"]), None)
+        mw_model, r2 = fit_marker(marker, layout["marker_mw"])
+        if mw_model is None:
+            flags.append("Marker 条带不足，未计算分子量")
+        elif r2 < R2_MIN:
+            flags.append(f"Marker R² = {r2:.4f} < {R2_MIN}")
+
+        table = pd.DataFrame(lane_rows(lanes, mw_model))
+        standards = layout_standards(layout)
+        table["Std?"] = table["Lane"].isin(list(standards))
+        table["Std Conc."] = table["Lane"].map(standards)
+        table, curve, err = quantify(table, layout.get("std_model", "linear"), saturated_lanes(lanes, img["level"]))
+        if err:
+            flags.append(err)
+        elif curve and curve["r2"] is not None and curve["r2"] < R2_MIN:
+            flags.append(f"标准曲线 R² = {curve['r2']:.4f} < {R2_MIN}")
+        if (table["Flag"] == "像素饱和").any():
+            flags.append("存在饱和条带 (IOD 偏低)")
+        rows = table.to_dict(orient="records")
+        return {"name": name, "rows": rows, "r2": r2, "n_lanes": len(lanes), "flags": flags, "error": None}
+    except Exception as e:
+        return {"name": name, "rows": [], "r2": 0, "n_lanes": 0, "flags": [], "error": str(e)}
+
+
+# ==========================================
+# 3. 批量 (进程池)
+# ==========================================
+def _process_chunk(args):
+    items, layout = args
+    return [process_gel(n, d, layout) for n, d in items]
+
+
+def qc_row(res):
+    if res["error"]:
+        return {"Gel": res["name"], "Lanes": 0, "Marker R²": None, "Status": "❌ 失败", "Flags": res["error"]}
+    return {"Gel": res["name"], "Lanes": res["n_lanes"], "Marker R²": round(res["r2"], 4),
+            "Status": "⚠️ 警告" if res["flags"] else "✅ 通过", "Flags": "; ".join(res["flags"])}
+
+
+def process_gels(files, layout, n_jobs=None, progress=None):
+    """
+    files: [(文件名, 字节或路径)] -> (结果列表 (顺序与输入一致), 合并结果表, QC 表)
+    """
+    files = list(files)
+    n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+    if n_jobs == 1 or len(files) < PARALLEL_MIN:
+        results = []
+        for i, (n, d) in enumerate(files):
+            results.append(process_gel(n, d, layout))
+            if progress:
+                progress((i + 1) / len(files))
+    else:
+        size = max(1, -(-len(files) // (n_jobs * 2)))
+        chunks = [(files[i:i + size], layout) for i in range(0, len(files), size)]
+        results = []
+        with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+            for i, part in enumerate(ex.map(_process_chunk, chunks)):
+                results.extend(part)
+                if progress:
+                    progress((i + 1) / len(chunks))
+    table = pd.DataFrame([{"Gel": r["name"], **row} for r in results for row in r["rows"]],
+                         columns=TABLE_COLS)
+    return results, table, pd.DataFrame([qc_row(r) for r in results], columns=QC_COLS)
+
+
+def _under(path, root):
+    return os.path.commonpath([root, path]) == root
+
+
+def resolve_folder(path, root=DATA_ROOT):
+    """
+    用户填写的文件夹 (相对 root，或 root 下的绝对路径) -> 解析后的真实路径
+    解析后不在 root 下时抛出 ValueError，不存在时抛出 FileNotFoundError
+    """
+    root = os.path.realpath(root)
+    folder = os.path.realpath(os.path.join(root, path))
+    if not _under(folder, root):
+        raise ValueError(f"只能读取数据目录 {root} 下的文件夹")
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"文件夹不存在: {path}")
+    return folder
+
+
+def iter_folder(path, root=DATA_ROOT):
+    """
+    数据目录下的胶图 -> [(文件名, 路径)] (按文件名排序)
+    只返回路径，由工作进程各自读取；指向 root 之外的符号链接会被跳过
+    """
+    folder = resolve_folder(path, root)
+    root = os.path.realpath(root)
+    files = []
+    for n in sorted(os.listdir(folder)):
+        p = os.path.realpath(os.path.join(folder, n))
+        if n.lower().endswith(IMAGE_EXTS) and os.path.isfile(p) and _under(p, root):
+            files.append((n, p))
+    return files
+
+
+# ==========================================
+# 4. 基准测试
+# ==========================================
+def benchmark_batch(n_gels=24, n_lanes=12):
+    """合成 16 位胶图：串行 vs 进程池；运行: python -m utils.wb_modules.batch"""
+    import cv2
+    from utils.wb_modules import image_pipeline, lane_analysis
+    from utils.wb_modules.lane_analysis import _synthetic_gel
+
+    files = []
+    for i in range(n_gels):
+        image, rects = _synthetic_gel(n_lanes, (1500, 2000), seed=i)
+        gray = np.clip(65535 - image["signal"], 0, 65535).astype(np.uint16)
+        files.append((f"gel_{i:02d}.tif", cv2.imencode(".tif", gray)[1].tobytes()))
+    layout = make_layout(rects, (1500, 2000), 1, "Simple", [70, 55, 40, 35, 25],
+                         {"bg_method": "rolling_ball", "ball_radius": 25, "prominence": 10, "rel_height": 0.6})
+    timings = {}
+    for label, jobs in (("Serial (s)", 1), ("Pool (s)", max(2, os.cpu_count() or 1))):
+        image_pipeline.clear_cache()
+        lane_analysis.clear_cache()
+        t0 = time.perf_counter()
+        _, table, qc = process_gels(files, layout, n_jobs=jobs)
+        timings[label] = time.perf_counter() - t0
+    return {"Gels": n_gels, "Lanes": len(table), **timings, "QC pass": int((qc["Status"] == "✅ 通过").sum())}
+
+
+if __name__ == "__main__":
+    for k, v in benchmark_batch().items():
+        print(f"{k:>12}: {v:.2f}" if isinstance(v, float) else f"{k:>12}: {v}")
@@ -0,0 +1,152 @@
+import hashlib
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# ==========================================
+# 0. 常量
+# ==========================================
+DISPLAY_WIDTH = 800         # 画布显示宽度 (只用于显示，定量始终在原始分辨率上做)
+CACHE_MAX = 8               # 最多缓存的图像数 (按文件哈希)
+STRETCH_PCT = (0.5, 99.5)   # 高位深图像生成 8 位显示图时的对比度拉伸百分位
+_CACHE = {}
+
+
+# ==========================================
+# 1. 解码 (保留 16 位)
+# ==========================================
+def file_key(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def decode_image(data):
+    """
+    文件字节 -> 原始位深的灰度数组 (uint8 / uint16 / float32)
+    优先用 OpenCV (IMREAD_UNCHANGED 保留 16 位 TIFF)，解不出来时退回 PIL
+    """
+    arr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if arr is None:
+        with Image.open(io.BytesIO(data)) as im:
+            if im.mode in ("I;16", "I;16B", "I;16L"):
+                arr = np.array(im, dtype=np.uint16)
+            elif im.mode in ("I", "F"):
+                arr = np.array(im, dtype=np.float32)
+            else:
+                arr = np.array(im.convert("L"))
+        return arr
+    if arr.ndim == 3:
+        code = cv2.COLOR_BGRA2GRAY if arr.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        arr = cv2.cvtColor(arr, code)
+    return arr
+
+
+def bit_depth(gray):
+    return {np.dtype(np.uint8): 8, np.dtype(np.uint16): 16}.get(gray.dtype, 32)
+
+
+def full_scale(gray):
+    """满量程灰度值 (8 位 255 / 16 位 65535 / 浮点取最大值)"""
+    return {8: 255.0, 16: 65535.0}.get(bit_depth(gray), float(gray.max()) or 1.0)
+
+
+def to_signal(gray, invert=True):
+    """
+    灰度 -> 定量用的 float32 信号 (原始分辨率、原始位深)
+    invert=True: 白底黑带 (常规显影 / 扫描)，信号 = 满量程 - 灰度
+    """
+    gray = gray.astype(np.float32) if gray.dtype != np.float32 else gray
+    if not invert:
+        return gray
+    return full_scale(gray) - gray
+
+
+# ==========================================
+# 2. 显示金字塔
+# ==========================================
+def to_display8(gray):
+    """任意位深 -> 8 位显示图；16 位 / 浮点图按百分位做线性拉伸 (只影响显示)"""
+    if gray.dtype == np.uint8:
+        return gray
+    lo, hi = np.percentile(gray, STRETCH_PCT)
+    if hi <= lo:
+        hi = lo + 1
+    return np.clip((gray.astype(np.float32) - lo) * (255.0 / (hi - lo)), 0, 255).astype(np.uint8)
+
+
+def build_pyramid(gray8, min_width=DISPLAY_WIDTH):
+    """逐级 pyrDown (每级宽度减半) 直到宽度不大于 min_width；返回 [原图, 1/2, 1/4, ...]"""
+    levels = [gray8]
+    while levels[-1].shape[1] // 2 >= min_width:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+
+def display_image(pyramid, width=DISPLAY_WIDTH):
+    """从最接近的金字塔层缩放到画布宽度 -> (PIL 图像, 原始像素 / 画布像素 比例)"""
+    native_w = pyramid[0].shape[1]
+    if native_w <= width:
+        return Image.fromarray(pyramid[0]), 1.0
+    level = next(lv for lv in reversed(pyramid) if lv.shape[1] >= width)
+    height = int(round(pyramid[0].shape[0] * width / native_w))
+    small = cv2.resize(level, (width, height), interpolation=cv2.INTER_AREA)
+    return Image.fromarray(small), native_w / width
+
+
+# ==========================================
+# 3. 加载 (批量用不缓存的 build_image，页面用带缓存的 load_wb_image)
+# ==========================================
+def build_image(data, invert=True, width=DISPLAY_WIDTH):
+    """
+    文件字节 -> 图像 dict (不经过缓存):
+        key     : 文件 SHA1
+        gray    : 原始位深灰度
+        signal  : 定量用 float32 信号 (原始分辨率)
+        depth   : 位深 (8 / 16 / 32)
+        display : 画布用 8 位 PIL 图像
+        scale   : 原始像素 / 画布像素
+        level   : 满量程 / 255，把按 8 位习惯设置的阈值 (如峰灵敏度) 换算到原始位深
+    """
+    gray = decode_image(data)
+    display, scale = display_image(build_pyramid(to_display8(gray), width), width)
+    return {"key": file_key(data), "gray": gray, "signal": to_signal(gray, invert), "depth": bit_depth(gray),
+            "display": display, "scale": scale, "level": full_scale(gray) / 255.0}
+
+
+def load_wb_image(data, invert=True, width=DISPLAY_WIDTH):
+    """同 build_image，按文件哈希缓存 (同一文件只解码一次，Streamlit 重跑直接取缓存)"""
+    key = (file_key(data), invert, width)
+    if key not in _CACHE:
+        _CACHE[key] = build_image(data, invert, width)
+        for k in list(_CACHE)[:max(0, len(_CACHE) - CACHE_MAX)]:
+            del _CACHE[k]
+    return _CACHE[key]
+
+
+def clear_cache():
+    _CACHE.clear()
+
+
+# ==========================================
+# 4. 画布坐标 <-> 原始坐标
+# ==========================================
+def canvas_to_native(obj, scale, shape):
+    """
+    画布矩形 (fabric.js 对象，含拖拽缩放产生的 scaleX / scaleY) -> 原始图像上的 (x, y, w, h)
+    超出图像的部分裁掉；完全在图像外时 w / h 为 0
+    """
+    h_img, w_img = shape[:2]
+    x0 = obj["left"] * scale
+    y0 = obj["top"] * scale
+    x1 = x0 + obj["width"] * obj.get("scaleX", 1.0) * scale
+    y1 = y0 + obj["height"] * obj.get("scaleY", 1.0) * scale
+    x0, x1 = int(round(min(max(x0, 0), w_img))), int(round(min(max(x1, 0), w_img)))
+    y0, y1 = int(round(min(max(y0, 0), h_img))), int(round(min(max(y1, 0), h_img)))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def native_to_canvas(rect, scale):
+    """原始 (x, y, w, h) -> 画布坐标 dict (left / top / width / height)"""
+    x, y, w, h = rect
+    return {"left": x / scale, "top": y / scale, "width": w / scale, "height": h / scale}
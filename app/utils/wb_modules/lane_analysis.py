@@ -0,0 +1,282 @@
+import numpy as np
+from scipy.ndimage import grey_opening
+from scipy.signal import find_peaks
+from scipy.stats import linregress
+
+# ==========================================
+# 0. 常量
+# ==========================================
+BG_METHODS = {"rolling_ball": "滚球法 (Rolling Ball)", "percentile": "10% 分位数", "none": "不扣除"}
+BALL_RADIUS = 50            # 滚球半径 (原始像素)
+MIN_PEAK_WIDTH = 5          # 最小峰宽 (原始像素)
+MEMO_MAX = 512              # 泳道结果缓存条数
+INTEGRAL_MAX = 4            # 行累加表缓存的图像数
+_LANE_MEMO = {}
+_INTEGRAL = {}
+
+
+# ==========================================
+# 1. 泳道轮廓 (一次提取全部泳道)
+# ==========================================
+def prefix_sums(signal):
+    """每行的前缀和 (H x (W+1))：任意矩形的逐行和 = 两列相减"""
+    integral = np.zeros((signal.shape[0], signal.shape[1] + 1), dtype=np.float64)
+    np.cumsum(signal, axis=1, out=integral[:, 1:])
+    return integral
+
+
+def row_integral(image):
+    """prefix_sums 按图像哈希缓存，同一张图的所有泳道 / 所有重跑共用"""
+    key = image["key"]
+    if key not in _INTEGRAL:
+        _INTEGRAL[key] = prefix_sums(image["signal"])
+        for k in list(_INTEGRAL)[:max(0, len(_INTEGRAL) - INTEGRAL_MAX)]:
+            del _INTEGRAL[k]
+    return _INTEGRAL[key]
+
+
+def extract_profiles(integral, rects):
+    """
+    rects: [(x, y, w, h)] 原始坐标 -> 填充矩阵 (n x 最大高度，末尾按最后一行补齐) 和各泳道高度
+    每行取泳道宽度内的平均值 (与 np.mean(roi, axis=1) 相同)
+    """
+    rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+    x, y, w, h = rects.T
+    h_max = int(h.max()) if len(rects) else 0
+    off = np.minimum(np.arange(h_max)[None, :], h[:, None] - 1)        # 超出泳道高度的部分重复最后一行
+    rows = y[:, None] + off
+    sums = integral[rows, (x + w)[:, None]] - integral[rows, x[:, None]]
+    return sums / w[:, None], h
+
+
+# ==========================================
+# 2. 背景扣除 (矩阵运算)
+# ==========================================
+def ball_structure(radius, level=1.0):
+    """
+    一维滚球结构元素：高度 sqrt(r² - d²) - r (中心为 0)，按 level (满量程 / 255) 换算到原始位深，
+    使同一半径在 8 位 / 16 位图像上的效果一致
+    """
+    d = np.arange(-radius, radius + 1, dtype=np.float64)
+    return (np.sqrt(np.maximum(radius ** 2 - d ** 2, 0)) - radius) * level
+
+
+def subtract_background(profiles, heights, method="rolling_ball", radius=BALL_RADIUS, level=1.0):
+    """
+    profiles: n x L 填充矩阵 -> (扣除背景后的矩阵, 背景矩阵)
+    rolling_ball: 灰度开运算 (滚球从下方滚过轮廓，所有泳道一次完成)
+    percentile  : 每条泳道减去其 10% 分位数 (旧算法)
+    """
+    if method == "none" or profiles.size == 0:
+        return profiles, np.zeros_like(profiles)
+    if method == "percentile":
+        valid = np.arange(profiles.shape[1])[None, :] < heights[:, None]
+        bg = np.nanpercentile(np.where(valid, profiles, np.nan), 10, axis=1)[:, None] * np.ones_like(profiles)
+    else:
+        radius = int(max(1, min(radius, profiles.shape[1])))
+        bg = grey_opening(profiles, structure=ball_structure(radius, level)[None, :], mode="nearest")
+    return np.maximum(profiles - bg, 0), bg
+
+
+# ==========================================
+# 3. 峰积分 (前缀和查表)
+# ==========================================
+def integrate_peaks(clean, heights, peak_lists, rel_height):
+    """
+    peak_lists: 每条泳道 (峰位数组, 峰宽数组)
+    积分区间 [p - w x rel_height, p + w x rel_height)，所有峰的面积用一次前缀和相减得到
+    返回每条泳道的峰列表 [{'y_pos', 'iod', 'height', 'start', 'end'}]
+    """
+    cum = np.zeros((clean.shape[0], clean.shape[1] + 1))
+    np.cumsum(clean, axis=1, out=cum[:, 1:])
+    lane = np.concatenate([np.full(len(p), i) for i, (p, _) in enumerate(peak_lists)]).astype(np.int64) \
+        if peak_lists else np.empty(0, dtype=np.int64)
+    pos = np.concatenate([p for p, _ in peak_lists]).astype(np.int64) if peak_lists else np.empty(0, dtype=np.int64)
+    half = np.concatenate([w for _, w in peak_lists]) * rel_height if peak_lists else np.empty(0)
+    start = np.maximum(0, pos - half).astype(np.int64)
+    end = np.minimum(heights[lane], pos + half).astype(np.int64)
+    area = cum[lane, end] - cum[lane, start]
+    height = clean[lane, pos]
+
+    out = [[] for _ in peak_lists]
+    for i, p, a, hgt, s, e in zip(lane.tolist(), pos.tolist(), area.tolist(), height.tolist(), start.tolist(),
+                                  end.tolist()):
+        out[i].append({"y_pos": p, "iod": a, "height": hgt, "start": s, "end": e})
+    return out
+
+
+def _lane_result(profile, clean, peaks):
+    total = sum(p["iod"] for p in peaks)
+    main = max(peaks, key=lambda p: p["iod"]) if peaks else None
+    purity = main["iod"] / total * 100 if main and total > 0 else 0
+    return {"profile": clean, "raw_profile": profile, "peaks": peaks, "main_peak": main, "purity": purity,
+            "total_peaks_iod": total}
+
+
+def compute_lanes(image, rects, bg_method="rolling_ball", radius=BALL_RADIUS, prominence=10.0,
+                  min_width=MIN_PEAK_WIDTH, rel_height=0.6, cache=True):
+    """
+    一批泳道的完整计算 (不经过泳道缓存)：轮廓 -> 背景 -> 找峰 -> 积分
+    prominence 为 8 位灰度习惯的数值，内部按图像位深换算
+    cache=False 时行前缀和也不进缓存 (批量工作进程用)
+    """
+    if not rects:
+        return []
+    level = image.get("level", 1.0)
+    integral = row_integral(image) if cache else prefix_sums(image["signal"])
+    profiles, heights = extract_profiles(integral, rects)
+    clean, _ = subtract_background(profiles, heights, bg_method, radius, level)
+    peak_lists = []
+    for i, h in enumerate(heights):
+        # 逐泳道只剩 find_peaks 本身
+        p, prop = find_peaks(clean[i, :h], prominence=prominence * level, width=min_width)
+        peak_lists.append((p, prop["widths"]))
+    peaks = integrate_peaks(clean, heights, peak_lists, rel_height)
+    return [_lane_result(profiles[i, :h].copy(), clean[i, :h].copy(), peaks[i]) for i, h in enumerate(heights)]
+
+
+# ==========================================
+# 4. 带缓存的入口
+# ==========================================
+def analyze_lanes(image, rects, **params):
+    """
+    按 (图像哈希, 泳道矩形, 参数) 缓存每条泳道的结果；微调一个框时只重算这一条
+    rects 中宽或高 <= 0 的泳道返回 None
+    """
+    pkey = tuple(sorted(params.items()))
+    results = [None] * len(rects)
+    todo = []
+    for i, r in enumerate(rects):
+        r = tuple(int(v) for v in r)
+        if r[2] <= 0 or r[3] <= 0:
+            continue
+        key = (image["key"], r, pkey)
+        if key in _LANE_MEMO:
+            results[i] = _LANE_MEMO[key]
+        else:
+            todo.append((i, r, key))
+    if todo:
+        for (i, _, key), res in zip(todo, compute_lanes(image, [r for _, r, _ in todo], **params)):
+            _LANE_MEMO[key] = results[i] = res
+        for k in list(_LANE_MEMO)[:max(0, len(_LANE_MEMO) - MEMO_MAX)]:
+            del _LANE_MEMO[k]
+    return results
+
+
+def scaled_params(bg_method, ball_radius, prominence, rel_height, scale):
+    """侧边栏参数 (显示像素 / 8 位习惯) -> analyze_lanes 参数 (原始像素)；单张与批量共用"""
+    return {"bg_method": bg_method, "radius": int(round(ball_radius * scale)), "prominence": float(prominence),
+            "min_width": MIN_PEAK_WIDTH * scale, "rel_height": float(rel_height)}
+
+
+def clear_cache():
+    _LANE_MEMO.clear()
+    _INTEGRAL.clear()
+
+
+# ==========================================
+# 5. Marker 拟合 + 结果表
+# ==========================================
+def fit_marker(marker_lane, template_mw, min_points=3):
+    """
+    Marker 泳道峰位 (从上到下) 与模板分子量 (从大到小) 一一对应，y 对 log10(MW) 线性回归
+    -> ((slope, intercept), R²)；条带不足 min_points 时返回 (None, 0)
+    """
+    if not marker_lane or not marker_lane["peaks"]:
+        return None, 0
+    ys = sorted(p["y_pos"] for p in marker_lane["peaks"])
+    n = min(len(template_mw), len(ys))
+    if n < min_points:
+        return None, 0
+    fit = linregress(ys[:n], np.log10(template_mw[:n]))
+    return (fit.slope, fit.intercept), fit.rvalue ** 2
+
+
+def lane_rows(lanes, mw_model=None):
+    """泳道结果 -> 分析表行 (Lane / Type / Sample Name / Size (kDa) / Purity (%) / IOD / Std? / Std Conc.)"""
+    rows = []
+    for d in lanes:
+        calc_mw = 0
+        if mw_model and d["main_peak"]:
+            calc_mw = 10 ** (mw_model[0] * d["main_peak"]["y_pos"] + mw_model[1])
+        rows.append({
+            "Lane": d["lane_id"],
+            "Type": "Marker" if d["is_marker"] else "Sample",
+            "Sample Name": "Marker" if d["is_marker"] else f"Sample {d['lane_id']}",
+            "Size (kDa)": round(calc_mw, 1) if calc_mw > 0 else 0,
+            "Purity (%)": round(d["purity"], 1),
+            "IOD": int(d["main_peak"]["iod"]) if d["main_peak"] else 0,
+            "Std?": False,
+            "Std Conc.": None
+        })
+    return rows
+
+
+# ==========================================
+# 6. 基准测试
+# ==========================================
+def _synthetic_gel(n_lanes=12, shape=(3000, 4000), seed=0):
+    """合成 16 位凝胶信号：每条泳道 3 条高斯带 + 斜坡背景 + 噪声"""
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    yy = np.arange(h, dtype=np.float32)[:, None]
+    sig = np.tile(np.linspace(500, 3000, h, dtype=np.float32)[:, None], (1, w))
+    lane_w = w // n_lanes
+    rects = []
+    for i in range(n_lanes):
+        x = i * lane_w + lane_w // 8
+        bands = sum(rng.uniform(5000, 30000) * np.exp(-((yy - rng.uniform(300, h - 300)) / 25) ** 2) for _ in range(3))
+        sig[:, x:x + lane_w * 3 // 4] += bands
+        rects.append((x, 100, lane_w * 3 // 4, h - 200))
+    sig += rng.normal(0, 200, sig.shape).astype(np.float32)
+    return {"key": f"synthetic-{seed}", "signal": sig, "level": 65535.0 / 255.0}, rects
+
+
+def _loop_reference(image, rects, prominence=10.0, min_width=MIN_PEAK_WIDTH, rel_height=0.6):
+    """旧页面的逐泳道循环 (10% 分位数背景 + 切片求和)，用于对比"""
+    out = []
+    for x, y, w, h in rects:
+        profile = np.mean(image["signal"][y:y + h, x:x + w], axis=1)
+        clean = np.maximum(profile - np.percentile(profile, 10), 0)
+        peaks, prop = find_peaks(clean, prominence=prominence * image["level"], width=min_width)
+        iods = []
+        for j, p in enumerate(peaks):
+            half = prop["widths"][j] * rel_height
+            iods.append(np.sum(clean[int(max(0, p - half)):int(min(len(clean), p + half))]))
+        out.append(iods)
+    return out
+
+
+def benchmark_lanes(n_lanes=12, shape=(3000, 4000)):
+    """旧循环 vs 新引擎 (冷启动 / 全部命中缓存 / 只改一条泳道)；运行: python -m utils.wb_modules.lane_analysis"""
+    import time
+    image, rects = _synthetic_gel(n_lanes, shape)
+    params = {"bg_method": "rolling_ball", "radius": BALL_RADIUS, "prominence": 10.0, "rel_height": 0.6}
+    clear_cache()
+    timings = {}
+    t0 = time.perf_counter()
+    _loop_reference(image, rects)
+    timings["Loop (ms)"] = 1000 * (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    analyze_lanes(image, rects, **params)
+    timings["Engine cold (ms)"] = 1000 * (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    analyze_lanes(image, rects, **params)
+    timings["Engine cached (ms)"] = 1000 * (time.perf_counter() - t0)
+    moved = list(rects)
+    x, y, w, h = moved[0]
+    moved[0] = (x + 3, y, w, h)
+    t0 = time.perf_counter()
+    analyze_lanes(image, moved, **params)
+    timings["One lane moved (ms)"] = 1000 * (time.perf_counter() - t0)
+
+    # 一致性：同一背景算法下与旧循环的积分结果相同
+    ref = _loop_reference(image, rects)
+    new = compute_lanes(image, rects, bg_method="percentile")
+    same = all(np.allclose(r, [p["iod"] for p in n["peaks"]]) for r, n in zip(ref, new))
+    return {"Lanes": n_lanes, "Image": f"{shape[1]}x{shape[0]}", **timings, "Matches loop": same}
+
+
+if __name__ == "__main__":
+    for k, v in benchmark_lanes().items():
+        print(f"{k:>22}: {v:.1f}" if isinstance(v, float) else f"{k:>22}: {v}")
@@ -0,0 +1,281 @@
+import cv2
+import numpy as np
+import pandas as pd
+from scipy.ndimage import gaussian_filter1d
+from scipy.signal import find_peaks
+
+# ==========================================
+# 0. 常量
+# ==========================================
+SMOOTH_FRAC = 0.004         # 列投影平滑 sigma (占 ROI 宽度比例)
+MIN_PROMINENCE = 0.05       # 泳道峰最小显著度 (占投影动态范围比例)
+MAX_SHEAR = 0.15            # 允许的最大剪切 (行偏移 / 列距离)
+MIN_BAND_AREA = 0.02        # 条带最小面积 (占 泳道宽 x 泳道宽 的比例)，过滤噪点
+CACHE_MAX = 8
+_CACHE = {}
+
+
+# ==========================================
+# 1. 泳道中心 (列投影)
+# ==========================================
+def column_projection(signal, roi=None):
+    """ROI 内每列的平均信号，高斯平滑 -> (投影, ROI 左边界 x)"""
+    x, y, w, h = roi or (0, 0, signal.shape[1], signal.shape[0])
+    proj = signal[y:y + h, x:x + w].mean(axis=0, dtype=np.float64)
+    return gaussian_filter1d(proj, max(1.0, SMOOTH_FRAC * w)), x
+
+
+def lane_pitch(proj):
+    """投影自相关的第一个峰 = 泳道间距 (像素)；没有周期性时返回 None"""
+    p = proj - proj.mean()
+    n = len(p)
+    spec = np.fft.rfft(p, 2 * n)
+    ac = np.fft.irfft(spec * np.conj(spec))[:n]
+    if ac[0] <= 0:
+        return None
+    peaks, _ = find_peaks(ac / ac[0], height=0.1)
+    peaks = peaks[peaks >= 4]
+    return float(peaks[0]) if len(peaks) else None
+
+
+def detect_lane_centers(proj, n_lanes=None):
+    """
+    投影上的峰 = 泳道中心
+    n_lanes 给定时取显著度最高的 n 个 (按位置排序)，否则取所有显著度足够的峰
+    峰间最小距离取 0.6 x 自相关估计的泳道间距
+    """
+    pitch = lane_pitch(proj)
+    if pitch is None and n_lanes:
+        pitch = len(proj) / n_lanes
+    distance = max(3, int(0.6 * pitch)) if pitch else max(3, len(proj) // 60)
+    span = float(proj.max() - proj.min()) or 1.0
+    peaks, prop = find_peaks(proj, distance=distance, prominence=MIN_PROMINENCE * span)
+    if n_lanes and len(peaks) > n_lanes:
+        keep = np.sort(np.argsort(-prop["prominences"], kind="stable")[:n_lanes])
+        peaks = peaks[keep]
+    return peaks
+
+
+def lane_rects(centers, x0, roi_y, roi_h, width_ratio=0.8, img_w=None):
+    """
+    泳道中心 -> 原始坐标矩形 (x, y, w, h)
+    宽度 = 相邻中心间距的中位数 x width_ratio (所有泳道等宽，和手动布局一致)
+    """
+    centers = np.asarray(centers, dtype=np.float64) + x0
+    if len(centers) == 0:
+        return []
+    pitch = float(np.median(np.diff(centers))) if len(centers) > 1 else roi_h / 4
+    w = max(2, int(round(pitch * width_ratio)))
+    x = np.round(centers - w / 2).astype(int)
+    if img_w is not None:
+        x = np.clip(x, 0, img_w - w)
+    return [(int(xi), int(roi_y), w, int(roi_h)) for xi in x]
+
+
+# ==========================================
+# 2. 剪切矫正 (smile / 倾斜)
+# ==========================================
+def estimate_shear(strip, max_shear=MAX_SHEAR):
+    """
+    泳道条带左右两半的行轮廓做互相关 -> 剪切系数 (右半相对左半每列下移的行数)
+    条带在泳道内近似直线，左右两半中心相距 w/2；抛物线插值到亚像素
+    """
+    h, w = strip.shape
+    if w < 4 or h < 8:
+        return 0.0
+    half = w // 2
+    left = strip[:, :half].mean(axis=1)
+    right = strip[:, w - half:].mean(axis=1)
+    left, right = left - left.mean(), right - right.mean()
+    max_shift = max(1, int(np.ceil(max_shear * (w - half))))
+    n = 2 * h
+    xc = np.fft.irfft(np.fft.rfft(right, n) * np.conj(np.fft.rfft(left, n)), n)
+    lags = np.r_[np.arange(0, max_shift + 1), np.arange(-max_shift, 0)]
+    vals = xc[lags % n]
+    i = int(np.argmax(vals))
+    shift = float(lags[i])
+    if 0 < i < len(vals) - 1 and lags[i - 1] == lags[i] - 1 and lags[(i + 1) % len(vals)] == lags[i] + 1:
+        a, b, c = vals[i - 1], vals[i], vals[i + 1]
+        if a - 2 * b + c != 0:
+            shift += 0.5 * (a - c) / (a - 2 * b + c)
+    return shift / (w - half)
+
+
+def deskew_strip(strip, shear):
+    """cv2.warpAffine 反向剪切：第 x 列上移 shear x (x - 中心)，使条带水平"""
+    if abs(shear) < 1e-6:
+        return strip
+    h, w = strip.shape
+    cx = (w - 1) / 2.0
+    m = np.float32([[1, 0, 0], [shear, 1, -shear * cx]])
+    return cv2.warpAffine(strip, m, (w, h), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def deskew_image(image, rects, shears):
+    """
+    按泳道剪切矫正后的信号 -> 新的图像 dict (可直接交给 lane_analysis.analyze_lanes)
+    key 带上剪切参数，矫正前后的泳道结果分开缓存
+    """
+    if not np.any(np.abs(shears) > 1e-6):
+        return image
+    sig = image["signal"].copy()
+    for (x, y, w, h), s in zip(rects, shears):
+        sig[y:y + h, x:x + w] = deskew_strip(sig[y:y + h, x:x + w], s)
+    tag = ",".join(f"{s:.4f}" for s in shears)
+    return {**image, "key": f"{image['key']}:deskew:{tag}", "signal": sig}
+
+
+# ==========================================
+# 3. 二维条带检测 (连通域)
+# ==========================================
+def band_mask(signal, roi, lane_w):
+    """ROI 内 Otsu 二值化 + 开运算去噪点 + 水平闭运算把断开的条带连起来"""
+    x, y, w, h = roi
+    sub = signal[y:y + h, x:x + w]
+    lo, hi = np.percentile(sub, (1, 99.9))
+    sub8 = np.clip((sub - lo) * (255.0 / max(hi - lo, 1e-6)), 0, 255).astype(np.uint8)
+    _, mask = cv2.threshold(sub8, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    kx = max(3, int(lane_w * 0.3) | 1)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (kx, 3)))
+
+
+def detect_bands(signal, rects, roi=None):
+    """
+    连通域 (connectedComponentsWithStats) -> 条带表
+    按与泳道的水平重叠分配 (>= 30% 泳道宽)；跨多条泳道的连通域 (条带粘连) 按泳道边界切开分别记录
+    返回 DataFrame: Lane / X / Y / Width / Height / Area / Centroid Y (原始坐标，Lane 从 1 开始)
+    """
+    cols = ["Lane", "X", "Y", "Width", "Height", "Area", "Centroid Y"]
+    if not rects:
+        return pd.DataFrame(columns=cols)
+    roi = roi or (0, 0, signal.shape[1], signal.shape[0])
+    lane_w = rects[0][2]
+    mask = band_mask(signal, roi, lane_w)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if n <= 1:
+        return pd.DataFrame(columns=cols)
+    rx, ry = roi[0], roi[1]
+    lx0 = np.array([r[0] for r in rects]) - rx
+    lx1 = lx0 + lane_w
+    min_area = MIN_BAND_AREA * lane_w * lane_w
+    rows = []
+    for lab in range(1, n):
+        bx, by, bw, bh, area = stats[lab]
+        if area < min_area:
+            continue
+        # 与每条泳道的水平重叠
+        overlap = np.minimum(lx1, bx + bw) - np.maximum(lx0, bx)
+        for lane in np.flatnonzero(overlap >= 0.3 * lane_w):
+            x0, x1 = max(lx0[lane], bx), min(lx1[lane], bx + bw)
+            part = labels[by:by + bh, x0:x1] == lab
+            ys = np.flatnonzero(part.any(axis=1))
+            if part.sum() < min_area * 0.5 or len(ys) == 0:
+                continue
+            cy = (np.nonzero(part)[0].mean()) + by
+            rows.append({"Lane": int(lane) + 1, "X": int(x0 + rx), "Y": int(by + ys[0] + ry), "Width": int(x1 - x0),
+                         "Height": int(ys[-1] - ys[0] + 1), "Area": int(part.sum()), "Centroid Y": float(cy + ry)})
+    return pd.DataFrame(rows, columns=cols).sort_values(["Lane", "Y"], ignore_index=True)
+
+
+def fit_vertical_extent(bands, roi, margin_frac=0.05):
+    """所有条带的上下范围 (外扩 margin) -> (y, h)；没有条带时返回 ROI 的范围"""
+    x, y, w, h = roi
+    if bands.empty:
+        return y, h
+    top = bands["Y"].min()
+    bottom = (bands["Y"] + bands["Height"]).max()
+    pad = int(margin_frac * h)
+    y0, y1 = max(y, top - pad), min(y + h, bottom + pad)
+    return int(y0), int(y1 - y0)
+
+
+# ==========================================
+# 4. 总入口
+# ==========================================
+def locate_lanes(image, roi=None, n_lanes=None, width_ratio=0.8, correct_shear=True):
+    """
+    全自动泳道 + 条带识别 (不经过缓存):
+        rects  : 泳道矩形 (原始坐标)
+        shears : 每条泳道的剪切系数 (未矫正时为 0)
+        bands  : 条带表 (在矫正后的信号上检测)
+        image  : 矫正后的图像 dict (无剪切时就是原图像)
+    roi: 定位框 (原始坐标)，为空时用整张图
+    """
+    sig = image["signal"]
+    roi = tuple(int(v) for v in roi) if roi else (0, 0, sig.shape[1], sig.shape[0])
+    proj, x0 = column_projection(sig, roi)
+    centers = detect_lane_centers(proj, n_lanes)
+    rects = lane_rects(centers, x0, roi[1], roi[3], width_ratio, sig.shape[1])
+    shears = np.array([estimate_shear(sig[y:y + h, x:x + w]) for x, y, w, h in rects]) if correct_shear \
+        else np.zeros(len(rects))
+    fixed = deskew_image(image, rects, shears)
+    bands = detect_bands(fixed["signal"], rects, roi)
+    # 泳道高度收紧到条带所在范围 (去掉上样孔 / 空白区，减少背景干扰)
+    y, h = fit_vertical_extent(bands, roi)
+    rects = [(rx, y, rw, h) for rx, _, rw, _ in rects]
+
+    return {"rects": rects, "shears": shears, "bands": bands, "image": fixed}
+
+
+def detect_lanes(image, roi=None, n_lanes=None, width_ratio=0.8, correct_shear=True):
+    """同 locate_lanes，按 (图像哈希, 参数) 缓存"""
+    sig = image["signal"]
+    roi = tuple(int(v) for v in roi) if roi else (0, 0, sig.shape[1], sig.shape[0])
+    key = (image["key"], roi, n_lanes, round(width_ratio, 3), correct_shear)
+    if key not in _CACHE:
+        _CACHE[key] = locate_lanes(image, roi, n_lanes, width_ratio, correct_shear)
+    for k in list(_CACHE)[:max(0, len(_CACHE) - CACHE_MAX)]:
+        del _CACHE[k]
+    return _CACHE[key]
+
+
+def clear_cache():
+    _CACHE.clear()
+
+
+# ==========================================
+# 5. 基准测试
+# ==========================================
+def synthetic_gel(n_lanes=26, shape=(1800, 5200), smile=0.04, seed=0):
+    """合成倾斜 / 微笑效应的凝胶信号：n 条泳道，每条 2-4 条带，泳道越靠边剪切越大"""
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    pitch = w / (n_lanes + 1)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    sig = rng.normal(800, 150, shape).astype(np.float32)
+    truth = []
+    for i in range(n_lanes):
+        cx = (i + 1) * pitch
+        shear = smile * (cx - w / 2) / (w / 2)
+        in_lane = np.abs(xx - cx) < pitch * 0.35
+        for _ in range(rng.integers(2, 5)):
+            by = rng.uniform(0.15 * h, 0.85 * h)
+            amp = rng.uniform(8000, 40000)
+            band = amp * np.exp(-((yy - by - shear * (xx - cx)) / 12) ** 2)
+            sig += np.where(in_lane, band, 0)
+        truth.append((cx, shear))
+    return {"key": f"synthetic-gel-{seed}", "signal": sig, "level": 65535.0 / 255.0}, truth
+
+
+def benchmark_detection(n_lanes=26):
+    """26 泳道合成凝胶：识别耗时、中心误差、剪切误差；运行: python -m utils.wb_modules.lane_detection"""
+    import time
+    image, truth = synthetic_gel(n_lanes)
+    clear_cache()
+    t0 = time.perf_counter()
+    res = detect_lanes(image)
+    elapsed = time.perf_counter() - t0
+    found = np.array([x + w / 2 for x, _, w, _ in res["rects"]])
+    true_c = np.array([c for c, _ in truth])
+    true_s = np.array([s for _, s in truth])
+    n = min(len(found), len(true_c))
+    return {"Lanes (true)": n_lanes, "Lanes (found)": len(found), "Bands": len(res["bands"]),
+            "Time (ms)": 1000 * elapsed, "Center err (px)": float(np.abs(found[:n] - true_c[:n]).max()),
+            "Shear err": float(np.abs(res["shears"][:n] - true_s[:n]).max())}
+
+
+if __name__ == "__main__":
+    for k, v in benchmark_detection().items():
+        print(f"{k:>16}: {v:.3f}" if isinstance(v, float) else f"{k:>16}: {v}")
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from utils.math_models import linear_fit, poly_fit, fit_4pl, four_pl_model, inverse_four_pl
+
+# ==========================================
+# 0. 常量
+# ==========================================
+STD_MODELS = {"linear": "线性 (Linear)", "quadratic": "二次 (Quadratic)", "4pl": "4PL"}
+MIN_POINTS = {"linear": 2, "quadratic": 3, "4pl": 4}
+LINEAR_TOL = 0.15           # 线性范围判定：各标准点相对线性拟合的偏差不超过 15%
+LINEAR_R2 = 0.98            # 线性范围判定：R² 下限
+SATURATION = 0.98           # 泳道轮廓最大值 >= 满量程的该比例时视为像素饱和
+MONOTONIC_GRID = 200        # 单调性检查：在标准品浓度范围内取点数
+
+
+# ==========================================
+# 1. 标准曲线
+# ==========================================
+def linear_range(conc, iod, tol=LINEAR_TOL, r2_min=LINEAR_R2):
+    """
+    从低浓度开始的最长线性区间：逐个去掉最高浓度点，直到剩余点的线性拟合 R² >= r2_min
+    且每个点相对拟合值的偏差 <= tol -> (IOD 下限, IOD 上限)；不足 3 个点时返回 None
+    """
+    order = np.argsort(conc)
+    conc, iod = np.asarray(conc, float)[order], np.asarray(iod, float)[order]
+    for k in range(len(conc), 2, -1):
+        x, y = conc[:k], iod[:k]
+        slope, intercept = np.polyfit(x, y, 1)
+        pred = slope * x + intercept
+        ss_tot = np.sum((y - y.mean()) ** 2)
+        r2 = 1 - np.sum((y - pred) ** 2) / ss_tot if ss_tot > 0 else 0
+        dev = np.abs(y - pred) / np.maximum(np.abs(pred), 1e-9)
+        if slope > 0 and r2 >= r2_min and np.all(dev[1:] <= tol):
+            return float(y.min()), float(y.max())
+    return None
+
+
+def _is_increasing(forward, conc):
+    """正向模型 (浓度 -> IOD) 在标准品浓度范围内是否严格单调递增"""
+    grid = np.linspace(conc.min(), conc.max(), MONOTONIC_GRID)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = forward(grid)
+    return bool(np.all(np.isfinite(y)) and np.all(np.diff(y) > 0))
+
+
+def fit_standard(conc, iod, model="linear"):
+    """
+    多点标准曲线 (x = 浓度，y = IOD)，拟合统一走 utils.math_models
+    -> dict: model / inverse (IOD 数组 -> 浓度数组) / r2 / formula / iod_min / iod_max / linear_range
+    只有 1 个标准点时退回单点比例法 (过原点)，与旧版“单参比”结果一致
+    曲线在标准品范围内不是单调递增 (斜率 <= 0) 时抛出 ValueError，不返回无法反算的曲线
+    """
+    conc, iod = np.asarray(conc, dtype=float), np.asarray(iod, dtype=float)
+    if len(conc) == 1:
+        ratio = conc[0] / iod[0] if iod[0] > 0 else np.nan
+        if not ratio > 0:
+            raise ValueError("单点标准品的浓度和 IOD 必须大于 0")
+        inverse, r2, formula, model = (lambda y: np.asarray(y, float) * ratio), None, f"Conc = IOD × {ratio:.3e}", \
+            "ratio"
+        forward = None
+    elif model == "4pl":
+        popt, r2, _ = fit_4pl(conc, iod)
+        if popt is None:
+            raise ValueError("4PL 拟合失败，请增加标准点或改用线性 / 二次模型")
+        A, B, C, D = popt
+        inverse = lambda y: inverse_four_pl(y, A, B, C, D)
+        formula = f"y = {D:.3g} + ({A:.3g} - {D:.3g}) / (1 + (x / {C:.3g})^{B:.3g})"
+        forward = lambda x: four_pl_model(x, A, B, C, D)
+    elif model == "quadratic":
+        func, r2, formula = poly_fit(conc, iod)
+        inverse = lambda y: func(np.asarray(y, dtype=float).copy())
+        forward = np.poly1d(np.polyfit(conc, iod, 2))
+    else:
+        func, r2, formula = linear_fit(conc, iod)
+        inverse = lambda y: func(np.asarray(y, dtype=float))
+        forward = np.poly1d(np.polyfit(conc, iod, 1))
+    if forward is not None and not _is_increasing(forward, conc):
+        raise ValueError(f"标准曲线 ({formula}) 在标准品范围内不是单调递增，无法反算浓度；请检查标准品浓度 / 泳道")
+    return {"model": model, "inverse": inverse, "r2": r2, "formula": formula, "iod_min": float(iod.min()),
+            "iod_max": float(iod.max()), "linear_range": linear_range(conc, iod) if len(conc) >= 3 else None}
+
+
+# ==========================================
+# 2. 全部泳道一次计算
+# ==========================================
+def saturated_lanes(lanes, level):
+    """泳道结果 -> {lane_id: 是否像素饱和} (轮廓最大值接近满量程，IOD 被低估)"""
+    limit = SATURATION * level * 255.0
+    return {d["lane_id"]: bool(d["main_peak"] and d["raw_profile"].max() >= limit) for d in lanes}
+
+
+def quantify(df, model="linear", saturated=None):
+    """
+    df: 分析表 (含 Type / IOD / Std? / Std Conc.) -> (带 Conc. / Flag 的新表, 标准曲线 dict 或 None, 错误信息)
+    所有泳道的浓度用一次向量化反算得到；Flag 给出外推 / 线性范围 / 饱和警告
+    """
+    out = df.copy()
+    out["Conc."] = np.nan
+    out["Flag"] = ""
+    saturated = saturated or {}
+    sat = out["Lane"].map(saturated).fillna(False).astype(bool).to_numpy()
+    is_std = out["Std?"].fillna(False).astype(bool).to_numpy() & (out["Type"] != "Marker").to_numpy()
+    std_conc = pd.to_numeric(out["Std Conc."], errors="coerce").to_numpy()
+    iod = out["IOD"].to_numpy(dtype=float)
+    use = is_std & np.isfinite(std_conc) & (iod > 0) & ~sat
+
+    flags = np.full(len(out), "", dtype=object)
+    flags[sat] = "像素饱和"
+    if is_std.any() and not use.any():
+        out["Flag"] = flags
+        return out, None, "标准品泳道没有有效的 IOD / 浓度"
+    if not use.any():
+        out["Flag"] = flags
+        return out, None, None
+    need = MIN_POINTS[model] if use.sum() > 1 else 1
+    if use.sum() < need:
+        out["Flag"] = flags
+        return out, None, f"{STD_MODELS[model]} 至少需要 {need} 个标准点 (当前 {int(use.sum())} 个)"
+    try:
+        curve = fit_standard(std_conc[use], iod[use], model)
+    except Exception as e:
+        out["Flag"] = flags
+        return out, None, str(e)
+
+    target = (out["Type"] != "Marker").to_numpy() & (iod > 0)
+    conc = np.full(len(out), np.nan)
+    conc[target] = curve["inverse"](iod[target])
+    below = target & np.isfinite(conc) & (conc < 0)       # 低于曲线截距，负浓度无意义
+    conc[below] = np.nan
+    out["Conc."] = conc
+
+    # 警告 (后写的覆盖前面的，饱和优先级最高)
+    if curve["linear_range"]:
+        lo, hi = curve["linear_range"]
+        flags[target & ((iod < lo) | (iod > hi))] = "超出线性范围"
+    flags[target & (iod > curve["iod_max"])] = "高于最高标准 (外推)"
+    flags[target & (iod < curve["iod_min"])] = "低于最低标准 (外推)"
+    flags[target & ~np.isfinite(conc)] = "超出曲线范围"
+    flags[below] = "低于曲线"
+    flags[sat] = "像素饱和"
+    out["Flag"] = flags
+    return out, curve, None
+
+
+def curve_points(curve, n=100):
+    """标准曲线上的点 (画图用)：在 IOD 范围内取 n 个点反算浓度 -> (浓度, IOD)"""
+    iod = np.linspace(curve["iod_min"], curve["iod_max"], n)
+    conc = curve["inverse"](iod)
+    ok = np.isfinite(conc)
+    return conc[ok], iod[ok]
+
+
+# ==========================================
+# 3. 基准测试
+# ==========================================
+def benchmark_quantify(n_lanes=2000, n_std=6):
+    """一次向量化反算 vs 逐行反算；运行: python -m utils.wb_modules.quantification"""
+    import time
+    rng = np.random.default_rng(0)
+    conc = np.geomspace(0.1, 4, n_std)
+    iod = 4e5 * conc / (1 + conc / 3)
+    df = pd.DataFrame({"Lane": np.arange(1, n_lanes + 1), "Type": "Sample",
+                       "IOD": np.r_[iod, rng.uniform(2e4, 8e5, n_lanes - n_std)],
+                       "Std?": np.r_[np.ones(n_std, bool), np.zeros(n_lanes - n_std, bool)],
+                       "Std Conc.": np.r_[conc, np.full(n_lanes - n_std, np.nan)]})
+    rows = []
+    for model in STD_MODELS:
+        t0 = time.perf_counter()
+        _, curve, _ = quantify(df, model)
+        t_vec = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for v in df["IOD"].to_numpy():
+            curve["inverse"](np.array([v]))
+        t_loop = time.perf_counter() - t0
+        rows.append({"Model": model, "Lanes": n_lanes, "R²": round(curve["r2"], 4),
+                     "Vectorized (ms)": 1000 * t_vec, "Per-row (ms)": 1000 * t_loop})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    print(benchmark_quantify().to_string(index=False))